@@ -0,0 +1,200 @@
+"""Benchmarks for the client, token and pagination hot paths and for uploads.
+
+Every request goes to an in-process ASGI mock of the token endpoint, authinator and data catalogue (see
+`benchmarks.mock_server`), so results measure the client without any network. Results are written as JSON, with
+operations per second and p50/p99 latency for each scenario, so runs can be compared to catch regressions.
+
+Run from the root of the repository with `python -m benchmarks.bench_client`. Pass `--quick` for a short smoke run,
+`--only` to run some scenarios, and `--output` to write the results to a file.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import pickle
+import tempfile
+import time
+
+import httpx
+
+from src.cache import AsyncCacheAdapter, InMemoryCache
+from src.client import M2MClient
+from src.pool import client_pool
+from src.schema import SignedURL
+from src.services import authinator, data_catalogue
+from src.utilities import Paginator, fetch_all
+
+from .harness import environment, run_scenario
+from .mock_server import OBJECT_STORE_URL, SERVICE_URLS, MockServices
+
+UPLOAD_SIZES = {"64KiB": 64 * 1024, "1MiB": 1024 * 1024, "16MiB": 16 * 1024 * 1024}
+
+
+class PickledCache:
+    """A stand-in for memcached. Values are pickled as pymemcache does, and every call waits `latency` seconds to
+    model the network round trip. Wrapped in an `AsyncCacheAdapter`, calls run in a thread pool like
+    `AsyncMemcachedCache`."""
+
+    def __init__(self, latency: float = 0.0002):
+        self.latency = latency
+        self.values: dict[str, bytes] = {}
+
+    def get(self, key):
+        time.sleep(self.latency)
+        value = self.values.get(key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, expire=0, *args, **kwargs):
+        time.sleep(self.latency)
+        self.values[key] = pickle.dumps(value)
+
+    def add(self, key, value, expire=0, *args, **kwargs):
+        time.sleep(self.latency)
+        if key in self.values:
+            return False
+        self.values[key] = pickle.dumps(value)
+        return True
+
+    def delete(self, key, *args, **kwargs):
+        time.sleep(self.latency)
+        self.values.pop(key, None)
+
+
+async def inject_client_scenarios(scale: float) -> list[dict]:
+    async def get_file_type(i: int) -> None:
+        await data_catalogue.get_file_type(feed_identifier="bench", feed_version=1)
+
+    return [
+        await run_scenario("inject_client.get_file_type", get_file_type, int(5000 * scale), concurrency=1),
+        await run_scenario("inject_client.get_file_type", get_file_type, int(5000 * scale), concurrency=32),
+    ]
+
+
+async def fetch_token_scenarios(transport: httpx.AsyncBaseTransport, scale: float) -> list[dict]:
+    results = []
+    async with M2MClient("authinator", transport=transport, cache=InMemoryCache()) as client:
+
+        async def cold(i: int) -> None:
+            client.token = None
+            client.cache = AsyncCacheAdapter(InMemoryCache())
+            await client.fetch_token()
+
+        async def memory(i: int) -> None:
+            await client.fetch_token()
+
+        results.append(await run_scenario("fetch_token.cold", cold, int(2000 * scale)))
+        results.append(await run_scenario("fetch_token.memory", memory, int(100_000 * scale)))
+
+        client.cache = AsyncCacheAdapter(PickledCache())
+        await client.cache.set(client.cache_key, client.token, 3600)
+
+        async def memcached(i: int) -> None:
+            client.token = None
+            await client.fetch_token()
+
+        results.append(await run_scenario("fetch_token.memcached", memcached, int(2000 * scale), latency_ms=0.2))
+    return results
+
+
+async def pagination_scenarios(services: MockServices, transport: httpx.AsyncBaseTransport, scale: float) -> list[dict]:
+    results = []
+    per_page = 100
+    pages = -(-services.total_items // per_page)
+    meta = {"pages": pages, "items": services.total_items}
+    async with M2MClient("authinator", transport=transport, cache=InMemoryCache()) as client:
+
+        async def fetch_all_organisations(i: int) -> None:
+            await fetch_all(authinator.get_organisations, client, per_page=per_page)
+
+        async def fetch_all_lazy(i: int) -> None:
+            await fetch_all(authinator.get_claims, client, per_page=per_page, lazy=True)
+
+        async def paginate(i: int) -> None:
+            async with Paginator(authinator.get_claims, client=client, per_page=per_page, read_ahead=4) as paginator:
+                async for page in paginator:
+                    pass
+
+        runs = max(int(20 * scale), 1)
+        results.append(await run_scenario("fetch_all.organisations", fetch_all_organisations, runs, **meta))
+        results.append(await run_scenario("fetch_all.claims_lazy", fetch_all_lazy, runs, **meta))
+        results.append(await run_scenario("paginator.claims_read_ahead_4", paginate, runs, **meta))
+    for result in results:
+        result["items_per_second"] = round(result["items"] * result["ops_per_second"], 2)
+    return results
+
+
+async def upload_scenarios(transport: httpx.AsyncBaseTransport, scale: float) -> list[dict]:
+    results = []
+    signed_url = SignedURL(
+        fields={"key": "uploads/bench"}, file_path="s3://bench/uploads/bench", signed_url=OBJECT_STORE_URL
+    )
+    async with httpx.AsyncClient(transport=transport) as upload_client:
+        for label, size in UPLOAD_SIZES.items():
+            with tempfile.NamedTemporaryFile() as file:
+                file.write(os.urandom(size))
+                file.flush()
+
+                async def upload(i: int) -> None:
+                    file.seek(0)
+                    await data_catalogue.upload_using_signed_url(file, signed_url, upload_client=upload_client)
+
+                runs = max(int(200 * scale * 1024 * 1024 / max(size, 1024 * 1024)), 2)
+                result = await run_scenario(f"upload.{label}", upload, runs, bytes=size)
+                result["mib_per_second"] = round(size * result["ops_per_second"] / 1024 / 1024, 2)
+                results.append(result)
+    return results
+
+
+SCENARIOS = ("inject_client", "fetch_token", "pagination", "upload")
+
+
+async def run(scenarios=SCENARIOS, scale: float = 1.0) -> dict:
+    """Run the benchmarks against a fresh set of mock services.
+
+    Args:
+        scenarios (Iterable[str], optional): The groups of scenarios to run. Will default to all of them.
+        scale (float, optional): Scales the number of runs of each scenario. Will default to 1.
+
+    Returns:
+        dict: The environment and the result of each scenario.
+    """
+    services = MockServices()
+    os.environ.update(services.environ())
+    transport = httpx.ASGITransport(app=services)
+    for service in SERVICE_URLS:
+        client_pool.configure(service, transport=transport, cache=InMemoryCache())
+
+    results = []
+    try:
+        if "inject_client" in scenarios:
+            results += await inject_client_scenarios(scale)
+        if "fetch_token" in scenarios:
+            results += await fetch_token_scenarios(transport, scale)
+        if "pagination" in scenarios:
+            results += await pagination_scenarios(services, transport, scale)
+        if "upload" in scenarios:
+            results += await upload_scenarios(transport, scale)
+    finally:
+        await client_pool.aclose()
+    return {"environment": environment(), "results": results}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="Run each scenario a tenth as many times")
+    parser.add_argument("--only", nargs="+", choices=SCENARIOS, default=SCENARIOS, help="The scenarios to run")
+    parser.add_argument("--output", help="Write the results to this file instead of stdout")
+    args = parser.parse_args()
+
+    report = asyncio.run(run(args.only, scale=0.1 if args.quick else 1.0))
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as file:
+            file.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Micro-benchmark for parsing `FileRecord.file_meta`.
+
+Measures records per second for batches of record listings whose metadata is JSON or the legacy Python dict repr. The
+legacy repr is measured as is, with apostrophes in values and with Python literals (True, None), neither of which the
+old quote-swapping parser could handle.
+
+Run from the root of the repository with `python -m benchmarks.bench_file_meta`.
+"""
+
+import argparse
+import json
+import time
+
+from src.schema import FileRecord, decode, parse_file_meta
+
+
+def old_parse_file_meta(value: str) -> dict:
+    return json.loads(value.replace("'", '"'))
+
+
+def make_meta(i: int, style: str) -> dict:
+    meta = {
+        "rows": 1000 + i,
+        "columns": ["store_id", "product_id", "units", "value"],
+        "source": "Sainsbury's" if style == "legacy_apostrophes" else "Sainsburys",
+        "week": f"2024-W{i % 52 + 1:02d}",
+        "checksum": f"{i:032x}",
+    }
+    if style == "legacy_literals":
+        meta.update(delta=i % 2 == 0, replaces=None)
+    return meta
+
+
+def make_batch(size: int, style: str) -> list[dict]:
+    records = []
+    for i in range(size):
+        meta = make_meta(i, style)
+        records.append(
+            {
+                "feed_identifier": "feed",
+                "feed_version": 1,
+                "file_location": f"s3://bucket/uploads/{i}.parquet",
+                "catalogued_time": "2024-01-01T00:00:00",
+                "posted_by": "test",
+                "organisation": "atheon",
+                "file_meta": json.dumps(meta) if style == "json" else repr(meta),
+            }
+        )
+    return records
+
+
+def measure(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"{'payload':<20} {'parser':<8} {'records/s':>12} {'FileRecord/s':>14}")
+    for style in ("json", "legacy", "legacy_apostrophes", "legacy_literals"):
+        records = make_batch(args.batch_size, style)
+        metas = [record["file_meta"] for record in records]
+        content = json.dumps(records)
+
+        try:
+            old = args.batch_size / measure(lambda: [old_parse_file_meta(meta) for meta in metas], args.repeat)
+            old = f"{old:>12,.0f}"
+        except json.JSONDecodeError:
+            old = f"{'fails':>12}"
+        new = args.batch_size / measure(lambda: [parse_file_meta(meta) for meta in metas], args.repeat)
+        decoded = args.batch_size / measure(lambda: decode(list[FileRecord], content), args.repeat)
+
+        print(f"{style:<20} {'old':<8} {old} {'':>14}")
+        print(f"{style:<20} {'new':<8} {new:>12,.0f} {decoded:>14,.0f}")
+
+
+if __name__ == "__main__":
+    main()
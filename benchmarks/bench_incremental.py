@@ -0,0 +1,86 @@
+"""Benchmark for incremental sync of a paginated collection against fetching every page with `fetch_all`.
+
+Syncs the organisations of the in-process mock services, which answer conditional requests for unchanged pages with
+304 responses, and reports the time taken, the number of page requests and how many of them were answered with a 304
+for: a full `fetch_all`, a first sync, a repeat sync with no changes, a repeat sync after a few items changed, and an
+append-only sync after items were added to the end.
+
+Run from the root of the repository with `python -m benchmarks.bench_incremental`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+import httpx
+
+from src.cache import InMemoryCache
+from src.client import M2MClient
+from src.incremental import CheckpointStore, IncrementalSync
+from src.services import authinator
+from src.utilities import fetch_all
+
+from .harness import environment
+from .mock_server import MockServices
+
+
+async def run(items: int, per_page: int, changed: int) -> list[dict]:
+    services = MockServices(total_items=items)
+    os.environ.update(services.environ())
+    transport = httpx.ASGITransport(app=services)
+    store = CheckpointStore()
+    results = []
+
+    async with M2MClient("authinator", transport=transport, cache=InMemoryCache()) as client:
+
+        async def measure(name: str, operation) -> None:
+            requests, not_modified = services.page_requests, services.not_modified
+            started = time.perf_counter()
+            changes = await operation()
+            results.append(
+                {
+                    "name": name,
+                    "seconds": round(time.perf_counter() - started, 4),
+                    "page_requests": services.page_requests - requests,
+                    "not_modified": services.not_modified - not_modified,
+                    "items_or_changes": len(changes),
+                }
+            )
+
+        def sync(append_only: bool = False):
+            return IncrementalSync(
+                authinator.get_organisations,
+                store,
+                per_page=per_page,
+                key=lambda organisation: organisation.id,
+                append_only=append_only,
+                client=client,
+            ).sync()
+
+        await measure("fetch_all", lambda: fetch_all(authinator.get_organisations, client, per_page=per_page))
+        await measure("sync.first", sync)
+        await measure("sync.unchanged", sync)
+        services.modify(random.Random(0).sample(range(items), changed))
+        await measure(f"sync.{changed}_changed", sync)
+        services.append(per_page // 2)
+        await measure(f"sync.append_only_{per_page // 2}_added", lambda: sync(append_only=True))
+    store.close()
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--items", type=int, default=20_000)
+    parser.add_argument("--per-page", type=int, default=100)
+    parser.add_argument("--changed", type=int, default=20, help="The number of items to change between syncs")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.items, args.per_page, args.changed))
+    print(json.dumps({"environment": environment(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Benchmark for the logging overhead on the token hot path.
+
+`inject_client` makes sure the client holds a token before every call, so `M2MClient.fetch_token` runs once per
+request. This measures the cost of a call that finds its token in memory, with the root logger configured at INFO and
+writing to a file, as an application would. It compares the current sampled DEBUG message with the previous
+behaviour, which wrote an INFO line on every call.
+
+Run from the root of the repository with `python -m benchmarks.bench_logging`.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import time
+
+from src.cache import InMemoryCache
+from src.client import M2MClient
+
+
+class LegacyLoggingClient(M2MClient):
+    """Logs on every memory hit at INFO, as `fetch_token` used to"""
+
+    async def fetch_token(self, *args, **kwargs):
+        if self.token and not self.token.is_expired():
+            logging.info("Using m2m token from memory")
+        return await super().fetch_token(*args, **kwargs)
+
+
+def make_client(cls: type[M2MClient]) -> M2MClient:
+    client = cls(
+        client_id="id",
+        client_secret="secret",
+        auth_base_url="https://auth.example.com/oauth/token",
+        audience="https://service.example.com",
+        base_url="https://service.example.com",
+        cache=InMemoryCache(),
+    )
+    client.token = {"access_token": "token", "token_type": "Bearer", "expires_at": time.time() + 3600}
+    return client
+
+
+async def measure(client: M2MClient, calls: int) -> float:
+    started = time.perf_counter()
+    for _ in range(calls):
+        await client.fetch_token()
+    return (time.perf_counter() - started) / calls
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--calls", type=int, default=100_000)
+    args = parser.parse_args()
+
+    with open(os.devnull, "w") as devnull:
+        handler = logging.StreamHandler(devnull)
+        handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(levelname)s %(message)s"))
+        logging.basicConfig(level=logging.INFO, handlers=[handler], force=True)
+
+        results = {}
+        for name, cls in (("legacy (INFO per call)", LegacyLoggingClient), ("current (sampled DEBUG)", M2MClient)):
+            client = make_client(cls)
+            await measure(client, 1000)
+            results[name] = await measure(client, args.calls)
+            await client.aclose()
+
+    for name, seconds in results.items():
+        print(f"{name:<26} {seconds * 1e6:8.2f} us/call")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
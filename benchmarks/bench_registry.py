@@ -0,0 +1,74 @@
+"""Benchmark for the per-call overhead of service functions generated from the endpoint registry.
+
+Compares `data_catalogue.get_file_type`, generated by `register`, with the same function written by hand with
+`inject_client`, as service functions were before the registry. Both call the in-process mock services, so the
+difference is the overhead of the call path rather than the network. Each is run for several interleaved rounds to
+reduce noise, and the best round of each is reported as JSON.
+
+Run from the root of the repository with `python -m benchmarks.bench_registry`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+
+import httpx
+
+from src.cache import InMemoryCache
+from src.client import M2MClient
+from src.pool import client_pool
+from src.schema import FileType, decode
+from src.services import Service, data_catalogue
+from src.utilities import inject_client
+
+from .harness import environment, run_scenario
+from .mock_server import SERVICE_URLS, MockServices
+
+
+@inject_client(service=Service.DATA_CATALOGUE)
+async def get_file_type(client: M2MClient, feed_identifier: str, feed_version: int) -> FileType:
+    resp = await client.get(
+        "file_types",
+        params={"feed_identifier": feed_identifier, "feed_version": feed_version},
+    )
+    return decode(FileType, resp.content, validate=client.validate_responses)
+
+
+async def run(ops: int, rounds: int) -> list[dict]:
+    services = MockServices()
+    os.environ.update(services.environ())
+    transport = httpx.ASGITransport(app=services)
+    for service in SERVICE_URLS:
+        client_pool.configure(service, transport=transport, cache=InMemoryCache())
+
+    async def hand_written(i: int) -> None:
+        await get_file_type(feed_identifier="bench", feed_version=1)
+
+    async def generated(i: int) -> None:
+        await data_catalogue.get_file_type(feed_identifier="bench", feed_version=1)
+
+    best: dict[str, dict] = {}
+    try:
+        for _ in range(rounds):
+            for name, operation in (("hand_written", hand_written), ("registry", generated)):
+                result = await run_scenario(f"get_file_type.{name}", operation, ops, warmup=50)
+                if name not in best or result["ops_per_second"] > best[name]["ops_per_second"]:
+                    best[name] = result
+    finally:
+        await client_pool.aclose()
+    return list(best.values())
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ops", type=int, default=1000)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args.ops, args.rounds))
+    print(json.dumps({"environment": environment(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,134 @@
+"""Benchmark for connection pool settings under high concurrency.
+
+Runs a local HTTP/1.1 server with keep-alive in a background thread. The server waits `--latency` seconds before each
+response to model a real service. Many concurrent requests are then made through `M2MClient` with each
+`TransportConfig`, reporting requests per second, p50/p99 latency and the number of connections opened. With the
+default limits, requests beyond 100 queue for a connection, and connections beyond 20 are closed after each request
+and reopened.
+
+HTTP/2 needs a server that speaks it, so pass `--service` to run the configs, including HTTP/2, against a real
+service configured in the environment (with `pip install httpx[http2]`). Its base url is requested with GET.
+
+Run from the root of the repository with `python -m benchmarks.bench_transport`.
+"""
+
+import argparse
+import asyncio
+import json
+import threading
+import time
+
+from src.client import M2MClient
+from src.transport import TransportConfig, http2_available
+
+from .harness import environment, run_scenario
+
+RESPONSE = b'HTTP/1.1 200 OK\r\nContent-Type: application/json\r\nContent-Length: 11\r\n\r\n{"ok":true}'
+
+
+class LocalServer:
+    """A minimal HTTP/1.1 keep-alive server running on its own event loop in a background thread"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.connections = 0
+        self.port = None
+        self._loop = asyncio.new_event_loop()
+        self._started = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.connections += 1
+        try:
+            while True:
+                head = await reader.readuntil(b"\r\n\r\n")
+                for line in head.split(b"\r\n"):
+                    if line.lower().startswith(b"content-length:"):
+                        await reader.readexactly(int(line.split(b":")[1]))
+                await asyncio.sleep(self.latency)
+                writer.write(RESPONSE)
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    def _run(self) -> None:
+        asyncio.set_event_loop(self._loop)
+        server = self._loop.run_until_complete(asyncio.start_server(self._handle, "127.0.0.1", 0, backlog=4096))
+        self.port = server.sockets[0].getsockname()[1]
+        self._started.set()
+        self._loop.run_forever()
+
+    def __enter__(self) -> "LocalServer":
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def __exit__(self, *args) -> None:
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+def make_client(config: TransportConfig, service: str = None, base_url: str = None) -> M2MClient:
+    if service:
+        return M2MClient(service, transport_config=config)
+    client = M2MClient(
+        client_id="id",
+        client_secret="secret",
+        auth_base_url=f"{base_url}/oauth/token",
+        audience=base_url,
+        base_url=base_url,
+        transport_config=config,
+    )
+    # The local server does not check tokens
+    client.token = {"access_token": "token", "token_type": "Bearer", "expires_at": time.time() + 3600}
+    return client
+
+
+async def run(
+    requests: int, concurrency: int, service: str = None, server: LocalServer = None
+) -> list[dict]:
+    configs = {
+        "defaults": TransportConfig(),
+        "sized_pool": TransportConfig(max_connections=concurrency, max_keepalive_connections=concurrency),
+    }
+    if server is None and http2_available():
+        configs["http2"] = TransportConfig(http2=True, max_connections=concurrency)
+
+    results = []
+    for name, config in configs.items():
+        base_url = f"http://127.0.0.1:{server.port}" if server else None
+        async with make_client(config, service=service, base_url=base_url) as client:
+            connections = server.connections if server else 0
+
+            async def request(i: int) -> None:
+                await client.get("/")
+
+            result = await run_scenario(
+                f"transport.{name}", request, requests, concurrency=concurrency, warmup=concurrency
+            )
+            if server:
+                result["connections_opened"] = server.connections - connections
+            results.append(result)
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=5000)
+    parser.add_argument("--concurrency", type=int, default=256)
+    parser.add_argument("--latency", type=float, default=0.005, help="Seconds the local server waits per request")
+    parser.add_argument("--service", help="Benchmark a real service instead of the local server")
+    args = parser.parse_args()
+
+    if args.service:
+        results = asyncio.run(run(args.requests, args.concurrency, service=args.service))
+    else:
+        with LocalServer(args.latency) as server:
+            results = asyncio.run(run(args.requests, args.concurrency, server=server))
+    print(json.dumps({"environment": environment(), "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,75 @@
+"""Helpers for timing benchmark scenarios and reporting them as JSON."""
+
+import asyncio
+import platform
+import statistics
+import sys
+import time
+from typing import Any, Awaitable, Callable
+
+import httpx
+
+
+def percentile(latencies: list[float], percent: int) -> float:
+    if len(latencies) == 1:
+        return latencies[0]
+    return statistics.quantiles(latencies, n=100, method="inclusive")[percent - 1]
+
+
+async def run_scenario(
+    name: str,
+    operation: Callable[[int], Awaitable[Any]],
+    ops: int,
+    concurrency: int = 1,
+    warmup: int = 1,
+    **meta,
+) -> dict:
+    """Run `operation` `ops` times from `concurrency` concurrent workers and report its throughput and latency.
+
+    Args:
+        name (str): The name of the scenario.
+        operation (Callable[[int], Awaitable]): The operation to time, called with the number of the run.
+        ops (int): The number of times to run the operation.
+        concurrency (int, optional): The number of workers running the operation at once. Will default to 1.
+        warmup (int, optional): The number of untimed runs before timing starts. Will default to 1.
+        **meta: Extra fields to include in the result.
+
+    Returns:
+        dict: The result, with operations per second and the p50 and p99 latency in milliseconds.
+    """
+    for i in range(warmup):
+        await operation(-1 - i)
+
+    latencies: list[float] = []
+    runs = iter(range(ops))
+
+    async def worker() -> None:
+        for i in runs:
+            started = time.perf_counter()
+            await operation(i)
+            latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "name": name,
+        "ops": ops,
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 6),
+        "ops_per_second": round(ops / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 4),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 4),
+        **meta,
+    }
+
+
+def environment() -> dict:
+    """Details of the environment the benchmarks ran in, so results are only compared like for like"""
+    return {
+        "python": sys.version.split()[0],
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "httpx": httpx.__version__,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+    }
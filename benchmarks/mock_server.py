@@ -0,0 +1,152 @@
+"""An in-process ASGI mock of the token endpoint, authinator and data catalogue, for benchmarks.
+
+The app routes on path alone, so every service can share one `httpx.ASGITransport`. Responses are built once and
+reused where possible, so the benchmarks measure the client rather than the mock.
+"""
+
+import hashlib
+import json
+import math
+import time
+from urllib.parse import parse_qs
+
+TOKEN_ENDPOINT = "http://auth.bench/oauth/token"
+SERVICE_URLS = {
+    "AUTHINATOR": "http://authinator.bench",
+    "DATA-CATALOGUE": "http://data-catalogue.bench",
+}
+OBJECT_STORE_URL = "http://object-store.bench/upload"
+
+
+class MockServices:
+    """The mock services.
+
+    Args:
+        total_items (int, optional): The number of organisations and claims the paginated endpoints hold. Will default
+                                    to 20000.
+    """
+
+    def __init__(self, total_items: int = 20_000):
+        self.total_items = total_items
+        self.token_requests = 0
+        self.page_requests = 0
+        self.not_modified = 0
+        self.bytes_uploaded = 0
+        self.revisions: dict[int, int] = {}
+        self._pages: dict[tuple, tuple[bytes, str]] = {}
+
+    def modify(self, indexes) -> None:
+        """Change the organisations and claims at the given indexes, so the pages holding them change"""
+        for index in indexes:
+            self.revisions[index] = self.revisions.get(index, 0) + 1
+        self._pages.clear()
+
+    def append(self, count: int) -> None:
+        """Add organisations and claims to the end of the collections"""
+        self.total_items += count
+        self._pages.clear()
+
+    def environ(self) -> dict[str, str]:
+        """The environment variables that point clients at the mock services"""
+        environ = {
+            "AUTH0_CLIENT_ID": "bench_client_id",
+            "AUTH0_CLIENT_SECRET": "bench_client_secret",
+            "TOKEN_ENDPOINT": TOKEN_ENDPOINT,
+        }
+        for service, url in SERVICE_URLS.items():
+            environ[f"{service}_URL"] = url
+            environ[f"{service}_AUDIENCE"] = url
+        return environ
+
+    def page(self, path: str, page: int, per_page: int) -> tuple[bytes, str]:
+        """The body of a page and its ETag"""
+        key = (path, page, per_page)
+        if key not in self._pages:
+            start = (page - 1) * per_page
+            stop = min(start + per_page, self.total_items)
+            if path == "/organisations":
+                items = [
+                    {"id": i, "host_name": f"host-{i}", "verbose_name": self._name(f"Organisation {i}", i)}
+                    for i in range(start, stop)
+                ]
+            else:
+                items = [
+                    {"claim": self._name(f"read:feed_{i}", i), "organisation": f"host-{i % 100}"}
+                    for i in range(start, stop)
+                ]
+            content = json.dumps(
+                {"items": items, "page": page, "pages": math.ceil(self.total_items / per_page), "per_page": per_page}
+            ).encode()
+            self._pages[key] = content, f'"{hashlib.md5(content).hexdigest()}"'
+        return self._pages[key]
+
+    def _name(self, name: str, index: int) -> str:
+        revision = self.revisions.get(index)
+        return f"{name} v{revision}" if revision else name
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return
+        body = bytearray()
+        while True:
+            message = await receive()
+            body += message.get("body", b"")
+            if not message.get("more_body"):
+                break
+
+        method, path = scope["method"], scope["path"]
+        query = {key: values[0] for key, values in parse_qs(scope["query_string"].decode()).items()}
+        status, content = 200, b""
+        headers = [(b"content-type", b"application/json")]
+
+        if path == "/oauth/token":
+            self.token_requests += 1
+            content = json.dumps(
+                {
+                    "access_token": f"bench_token_{self.token_requests}",
+                    "token_type": "Bearer",
+                    "expires_in": 86400,
+                    "expires_at": time.time() + 86400,
+                }
+            ).encode()
+        elif path in ("/organisations", "/claims"):
+            self.page_requests += 1
+            content, etag = self.page(path, int(query.get("page", 1)), int(query.get("per_page", 100)))
+            headers.append((b"etag", etag.encode()))
+            if dict(scope["headers"]).get(b"if-none-match") == etag.encode():
+                self.not_modified += 1
+                status, content = 304, b""
+        elif path == "/file_types":
+            content = json.dumps(
+                {
+                    "feed_identifier": query.get("feed_identifier"),
+                    "feed_version": int(query.get("feed_version", 1)),
+                    "json_schema": "{}",
+                    "active": True,
+                    "storage_backend": "s3",
+                    "flow_name": "bench",
+                }
+            ).encode()
+        elif path == "/signed_url/":
+            request = json.loads(body)
+            key = f"uploads/{request['feed_identifier']}"
+            content = json.dumps(
+                {"fields": {"key": key}, "file_path": f"s3://bench/{key}", "signed_url": OBJECT_STORE_URL}
+            ).encode()
+        elif path == "/upload" and method == "POST":
+            self.bytes_uploaded += len(body)
+            status = 204
+        elif path == "/records" and method == "POST":
+            record = json.loads(body)
+            content = json.dumps({**record, "catalogued_time": "2024-01-01T00:00:00", "posted_by": "bench"}).encode()
+        else:
+            status, content = 404, b'{"detail": "Not Found"}'
+
+        await send(
+            {
+                "type": "http.response.start",
+                "status": status,
+                "headers": headers + [(b"content-length", str(len(content)).encode())],
+            }
+        )
+        await send({"type": "http.response.body", "body": content})
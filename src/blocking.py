@@ -0,0 +1,201 @@
+"""A synchronous API for callers that are not async, such as task workers and scripts.
+
+Calls are run on one long-lived event loop in a background thread, so pooled clients, their connections and their
+tokens are reused across calls and across caller threads, instead of `asyncio.run` creating a new loop and a new
+client for every call.
+
+```python
+from src import blocking
+
+claims = blocking.fetch_all(blocking.authinator.get_claims, per_page=100)
+file_type = blocking.data_catalogue.get_file_type(feed_identifier="feed", feed_version=1)
+```
+"""
+
+import asyncio
+import atexit
+import functools
+import inspect
+import logging
+import os
+import threading
+from types import ModuleType, SimpleNamespace
+from typing import Any, Callable, Coroutine, Optional, TypeVar
+
+from typing_extensions import ParamSpec
+
+from . import utilities
+from .client import M2MClient
+from .pool import client_pool
+from .services import authinator as _authinator
+from .services import data_catalogue as _data_catalogue
+
+
+logger = logging.getLogger(__name__)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class BackgroundLoop:
+    """An event loop running in a daemon thread that coroutines can be submitted to from any thread. The thread is
+    started by the first call to `run`, and pooled clients created on the loop are closed with it.
+
+    Args:
+        name (str, optional): The name of the thread. Will default to "service-client-loop".
+    """
+
+    def __init__(self, name: str = "service-client-loop"):
+        self.name = name
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loop(self) -> asyncio.AbstractEventLoop:
+        """The running loop, starting it if needed"""
+        loop = self._loop
+        if loop is not None:
+            return loop
+        with self._lock:
+            if self._loop is None:
+                started = threading.Event()
+                loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self._run, args=(loop, started), name=self.name, daemon=True)
+                self._thread.start()
+                started.wait()
+                self._loop = loop
+            return self._loop
+
+    @staticmethod
+    def _run(loop: asyncio.AbstractEventLoop, started: threading.Event) -> None:
+        asyncio.set_event_loop(loop)
+        loop.call_soon(started.set)
+        loop.run_forever()
+
+    def run(self, coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+        """Run a coroutine on the loop and wait for its result. Exceptions raised by the coroutine are raised here.
+
+        Args:
+            coro (Coroutine): The coroutine to run.
+            timeout (float, optional): The number of seconds to wait before cancelling the coroutine and raising a
+                                    `TimeoutError`. Will default to None (wait forever).
+
+        Returns:
+            Any: The result of the coroutine.
+        """
+        if self._thread is threading.current_thread():
+            coro.close()
+            raise RuntimeError("Blocking calls cannot be made from the background loop, await the coroutine instead")
+        future = asyncio.run_coroutine_threadsafe(coro, self.loop)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            # Stop the coroutine if the caller gives up on it, e.g. on a timeout or KeyboardInterrupt
+            future.cancel()
+            raise
+
+    def reset(self) -> None:
+        """Forget the loop without stopping it. This is called in a child process after a fork for the shared
+        `background_loop`, as the loop's thread does not exist in the child. A new loop is started on first use."""
+        self._loop = self._thread = None
+        self._lock = threading.Lock()
+
+    def close(self) -> None:
+        """Close the pooled clients created on the loop, then stop the loop and its thread. The loop is started again
+        by the next call to `run`."""
+        with self._lock:
+            loop, thread = self._loop, self._thread
+            self._loop = self._thread = None
+        if loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(client_pool.aclose(), loop).result(timeout=10)
+        except Exception as e:
+            logger.warning("Failed to close pooled clients: %r", e)
+        loop.call_soon_threadsafe(loop.stop)
+        thread.join()
+        loop.close()
+
+
+background_loop = BackgroundLoop()
+atexit.register(background_loop.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=background_loop.reset)
+
+
+def run(coro: Coroutine[Any, Any, T], timeout: Optional[float] = None) -> T:
+    """Run a coroutine on the shared background loop and wait for its result.
+
+    Args:
+        coro (Coroutine): The coroutine to run.
+        timeout (float, optional): The number of seconds to wait before cancelling the coroutine and raising a
+                                    `TimeoutError`. Will default to None (wait forever).
+
+    Returns:
+        Any: The result of the coroutine.
+    """
+    return background_loop.run(coro, timeout)
+
+
+def syncify(fn: Callable[P, Coroutine[Any, Any, T]]) -> Callable[P, T]:
+    """Wrap an async function so calling it runs it on the shared background loop and returns its result. The async
+    function is available as `__wrapped__`.
+
+    Callbacks passed to the function, such as upload progress callbacks, are called on the background loop's thread.
+
+    Args:
+        fn (Callable[..., Coroutine]): The async function to wrap.
+
+    Returns:
+        Callable[..., Any]: The blocking function.
+    """
+
+    @functools.wraps(fn)
+    def blocking(*args: P.args, **kwargs: P.kwargs) -> T:
+        return background_loop.run(fn(*args, **kwargs))
+
+    return blocking
+
+
+def _syncify_module(module: ModuleType) -> SimpleNamespace:
+    """Wrap every public async function defined in a module"""
+    return SimpleNamespace(
+        **{
+            name: syncify(fn)
+            for name, fn in vars(module).items()
+            if not name.startswith("_") and inspect.iscoroutinefunction(fn) and fn.__module__ == module.__name__
+        }
+    )
+
+
+authinator = _syncify_module(_authinator)
+data_catalogue = _syncify_module(_data_catalogue)
+
+
+def fetch_all(
+    fn: Callable[..., Any],
+    client: Optional[M2MClient] = None,
+    *args,
+    per_page: int,
+    max_concurrency: int = 10,
+    **kwargs,
+) -> list:
+    """Fetch all pages of a paginated API response on the shared background loop.
+
+    Args:
+        fn (Callable[..., PaginatedResponse]): The function to call to get a page of results, either a service
+                                    function or its blocking wrapper.
+        client (M2MClient, optional): The client to use to make the requests. It must have been created on the
+                                    background loop. Will default to None (a pooled client).
+        per_page (int): The number of items per page.
+        max_concurrency (int, optional): The maximum number of pages to request at once. Will default to 10.
+
+    Returns:
+        list: A list of all items from all pages.
+    """
+    if not inspect.iscoroutinefunction(fn):
+        fn = fn.__wrapped__
+    return background_loop.run(
+        utilities.fetch_all(fn, client, *args, per_page=per_page, max_concurrency=max_concurrency, **kwargs)
+    )
@@ -1,13 +1,385 @@
+import asyncio
+import atexit
+import hashlib
+import inspect
+import os
+import pickle
+import stat
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, ClassVar, Mapping, Optional, Protocol, runtime_checkable
+
+from pymemcache import Client, HashClient, PooledClient, serde
+from pymemcache.client import RetryingClient
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - Windows
+    fcntl = None
+
+
+@runtime_checkable
+class AsyncCache(Protocol):
+    """Protocol for caches that can be used by the client without blocking the event loop."""
+
+    async def get(self, key: str) -> Any: ...
+
+    async def set(self, key: str, value: Any, ttl: int = 0) -> None: ...
+
+    async def add(self, key: str, value: Any, ttl: int = 0) -> bool: ...
+
+    async def delete(self, key: str) -> None: ...
+
+
 class InMemoryCache:
     """Basic in-memory cache implementation. This is a simple cache that stores key-value pairs in memory. Its use
     should be avoided where possible (e.g. in production) as it's not scalable and will not persist data across
-    multiple instances of the application."""
+    multiple instances of the application, other than as the local tier of a `TieredCache`.
+
+    The cache holds at most `max_size` entries, evicting the least recently used entry when it is full, and entries
+    expire after the `expire` seconds they were set with. Hit, miss and eviction counts are kept in `stats`.
+
+    Args:
+        max_size (int, optional): The maximum number of entries to hold. Will default to 1024.
+    """
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.cache: OrderedDict[str, tuple[Optional[float], Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self.cache)
+
+    @property
+    def stats(self) -> dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "evictions": self.evictions, "size": len(self.cache)}
+
+    def _get_live(self, key: str, now: float) -> Optional[tuple[Optional[float], Any]]:
+        """Get the entry for a key, dropping it if it has expired"""
+        entry = self.cache.get(key)
+        if entry is not None and entry[0] is not None and entry[0] <= now:
+            del self.cache[key]
+            return None
+        return entry
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            entry = self._get_live(key, time.monotonic())
+            if entry is None:
+                self.misses += 1
+                return None
+            self.cache.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: str, value: Any, expire: float = 0, *args, **kwargs) -> None:
+        """Set a value. An `expire` of 0 means the value never expires, matching memcached."""
+        with self._lock:
+            self._set(key, value, expire)
+
+    def _set(self, key: str, value: Any, expire: float) -> None:
+        self.cache[key] = (time.monotonic() + expire if expire else None, value)
+        self.cache.move_to_end(key)
+        while len(self.cache) > self.max_size:
+            self.cache.popitem(last=False)
+            self.evictions += 1
+
+    def add(self, key: str, value: Any, expire: float = 0, *args, **kwargs) -> bool:
+        """Set the value only if the key is not already set. Returns whether the value was stored."""
+        with self._lock:
+            if self._get_live(key, time.monotonic()) is not None:
+                return False
+            self._set(key, value, expire)
+            return True
+
+    def delete(self, key: str, *args, **kwargs) -> None:
+        with self._lock:
+            self.cache.pop(key, None)
+
+
+class SharedFileCache:
+    """Host-local cache shared by every process on a machine, so worker processes reuse one token without a network
+    call. Each key is stored in its own file in `directory`, written to a temporary file and renamed into place so
+    readers never see a partial value and need no lock. Writes and `add` take an exclusive `flock` on a lock file for
+    the key, so `add` can be used for the client's token lease.
+
+    Values are pickled, as with memcached, so the directory must only be accessible to the user the workers run as. It
+    is created with 0700 permissions if it does not exist, and a `PermissionError` is raised if it is a symlink, belongs
+    to another user or is accessible to other users. Locking blocks, so wrap the cache with `as_async_cache`, which runs
+    its calls in a thread. Only available on POSIX systems.
+
+    Args:
+        directory (str, optional): The directory to store values in. Will default to the TOKEN_CACHE_DIR environment
+                                    variable, or a directory for the current user in the system temporary directory.
+    """
+
+    def __init__(self, directory: Optional[str] = None):
+        if fcntl is None:
+            raise RuntimeError("SharedFileCache needs fcntl, which is only available on POSIX systems")
+        self.directory = directory or os.getenv("TOKEN_CACHE_DIR") or os.path.join(
+            tempfile.gettempdir(), f"service-client-{os.getuid()}"
+        )
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        # Loading a pickle planted by another user would run their code, so refuse directories others can write to
+        status = os.lstat(self.directory)
+        if not stat.S_ISDIR(status.st_mode) or status.st_uid != os.getuid() or status.st_mode & 0o077:
+            raise PermissionError(
+                f"Token cache directory {self.directory} must be a directory owned by the current user with no access "
+                "for other users (mode 0700)"
+            )
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.sha256(key.encode()).hexdigest())
+
+    def _read(self, path: str) -> Any:
+        """Read the value at a path, or None if it is missing or has expired. Expiry uses wall clock time, as the
+        monotonic clock is not comparable between processes on every platform."""
+        try:
+            with open(path, "rb") as file:
+                expires_at, value = pickle.load(file)
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            return None
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def _write(self, path: str, value: Any, expire: float) -> None:
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as file:
+                pickle.dump((time.time() + expire if expire else None, value), file)
+            os.replace(temp_path, path)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
+
+    def _locked(self, path: str) -> int:
+        fd = os.open(f"{path}.lock", os.O_RDWR | os.O_CREAT, 0o600)
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        return fd
+
+    def get(self, key: str) -> Any:
+        return self._read(self._path(key))
+
+    def set(self, key: str, value: Any, expire: float = 0, *args, **kwargs) -> None:
+        """Set a value. An `expire` of 0 means the value never expires, matching memcached."""
+        path = self._path(key)
+        fd = self._locked(path)
+        try:
+            self._write(path, value, expire)
+        finally:
+            os.close(fd)
+
+    def add(self, key: str, value: Any, expire: float = 0, *args, **kwargs) -> bool:
+        """Set the value only if the key is not already set, across every process on the machine. Returns whether
+        the value was stored."""
+        path = self._path(key)
+        fd = self._locked(path)
+        try:
+            if self._read(path) is not None:
+                return False
+            self._write(path, value, expire)
+            return True
+        finally:
+            os.close(fd)
+
+    def delete(self, key: str, *args, **kwargs) -> None:
+        path = self._path(key)
+        fd = self._locked(path)
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        finally:
+            os.close(fd)
+
+
+_PYMEMCACHE_CLIENTS = (Client, HashClient, PooledClient, RetryingClient)
+
+
+class AsyncCacheAdapter:
+    """Adapts a synchronous cache with pymemcache-style `get`, `set`, `add` and `delete` methods to the `AsyncCache`
+    protocol. Calls are made inline by default, which is fine for caches that never block such as `InMemoryCache`.
+    Pass an executor to run the calls off the event loop for caches that do network I/O, or set `threaded` to run them
+    in the event loop's default executor.
+
+    Caches without `add` are treated as always granting it, and caches without `delete` ignore deletes.
+
+    Args:
+        cache: The synchronous cache to wrap.
+        executor (Executor, optional): The executor to run cache calls in. Will default to None (run inline).
+        threaded (bool, optional): Whether to run cache calls in the default executor when no executor is given. Will
+                                    default to False.
+    """
+
+    def __init__(self, cache, executor: Optional[Executor] = None, threaded: bool = False):
+        self.cache = cache
+        self.executor = executor
+        self.threaded = threaded
+
+    async def _call(self, fn, *args, **kwargs):
+        if self.executor is None and not self.threaded:
+            return fn(*args, **kwargs)
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(fn, *args, **kwargs))
+
+    async def get(self, key: str) -> Any:
+        return await self._call(self.cache.get, key)
+
+    async def set(self, key: str, value: Any, ttl: int = 0) -> None:
+        await self._call(self.cache.set, key, value, ttl)
+
+    async def add(self, key: str, value: Any, ttl: int = 0) -> bool:
+        if not hasattr(self.cache, "add"):
+            return True
+        if isinstance(self.cache, _PYMEMCACHE_CLIENTS):
+            # pymemcache clients default to noreply, which always reports the add as stored
+            return await self._call(self.cache.add, key, value, ttl, noreply=False)
+        return await self._call(self.cache.add, key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        if hasattr(self.cache, "delete"):
+            await self._call(self.cache.delete, key)
+
+
+class AsyncMemcachedCache(AsyncCacheAdapter):
+    """Memcached cache that runs pymemcache calls in a bounded thread pool, so a slow memcached node never blocks the
+    event loop. Each worker thread borrows a connection from a pymemcache `PooledClient`.
+
+    Use `shared` to get the process-wide cache for a server rather than creating a connection pool and thread pool
+    for every client, and `close` to shut down a cache created directly.
+
+    Args:
+        server (str): The memcached server to connect to, e.g. "localhost" or "localhost:11211".
+        max_workers (int, optional): The maximum number of concurrent memcached calls. Will default to 4.
+        **kwargs: Additional arguments passed to `pymemcache.PooledClient`.
+    """
+
+    _shared: ClassVar[dict[str, "AsyncMemcachedCache"]] = {}
+    _shared_lock: ClassVar[threading.Lock] = threading.Lock()
+
+    def __init__(self, server: str, max_workers: int = 4, **kwargs):
+        kwargs.setdefault("serde", serde.pickle_serde)
+        super().__init__(
+            PooledClient(server, max_pool_size=max_workers, **kwargs),
+            ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="memcached"),
+        )
+
+    @classmethod
+    def shared(cls, server: str) -> "AsyncMemcachedCache":
+        """Get the process-wide cache for a memcached server, creating it if needed. It is closed when the interpreter
+        exits and must not be closed by the caller.
+
+        Args:
+            server (str): The memcached server to connect to.
+
+        Returns:
+            AsyncMemcachedCache: The shared cache.
+        """
+        with cls._shared_lock:
+            if server not in cls._shared:
+                cls._shared[server] = cls(server)
+            return cls._shared[server]
+
+    @classmethod
+    def close_shared(cls) -> None:
+        """Close every shared cache"""
+        with cls._shared_lock:
+            caches, cls._shared = list(cls._shared.values()), {}
+        for cache in caches:
+            cache.close()
+
+    @classmethod
+    def _reset_after_fork(cls) -> None:
+        """Forget the shared caches in a forked child, where the parent's worker threads do not exist and its
+        connections must not be reused"""
+        cls._shared = {}
+        cls._shared_lock = threading.Lock()
+
+    def close(self) -> None:
+        """Shut down the thread pool and close the connections to memcached"""
+        self.executor.shutdown(wait=False)
+        self.cache.close()
+
+
+class TieredCache:
+    """Two-tier cache with a small local `InMemoryCache` in front of a shared remote cache such as memcached. Reads are
+    served from the local tier when possible, so most lookups cost no network call, while the remote cache stays the
+    shared source of truth across processes. Local copies expire after at most `local_ttl` seconds, or when the token
+    they hold expires if that is sooner, after which they are read from the remote cache again.
+
+    Leases taken with `add` always go to the remote cache, as they must be visible to every process. The local tier can
+    be a `SharedFileCache`, so every process on a machine shares one local copy.
+
+    Args:
+        remote: The shared cache. Either an `AsyncCache` or a synchronous cache, which will be wrapped in an
+                `AsyncCacheAdapter`.
+        local (InMemoryCache | SharedFileCache, optional): The local cache. Will default to a new InMemoryCache.
+        local_ttl (float, optional): The maximum number of seconds to keep a local copy for. Will default to 60.
+    """
+
+    def __init__(self, remote, local: Optional[InMemoryCache | SharedFileCache] = None, local_ttl: float = 60):
+        self.remote = as_async_cache(remote)
+        self.local = local if local is not None else InMemoryCache()
+        self.local_ttl = local_ttl
+        # A SharedFileCache reads files and waits for its file lock, so its calls are made in a thread
+        self._local_call = (
+            partial(asyncio.to_thread, self._call_local) if isinstance(self.local, SharedFileCache) else self._local_now
+        )
+
+    def _call_local(self, method: str, *args) -> Any:
+        return getattr(self.local, method)(*args)
+
+    async def _local_now(self, method: str, *args) -> Any:
+        return self._call_local(method, *args)
+
+    def _local_expire(self, ttl: float) -> float:
+        return min(ttl, self.local_ttl) if ttl else self.local_ttl
+
+    def _read_through_expire(self, value: Any) -> float:
+        """The local TTL of a value read from the remote cache, whose own TTL is unknown. Tokens carry their expiry,
+        so their local copy never outlives them."""
+        expires_at = value.get("expires_at") if isinstance(value, Mapping) else None
+        return min(self.local_ttl, expires_at - time.time()) if expires_at else self.local_ttl
+
+    async def get(self, key: str) -> Any:
+        value = await self._local_call("get", key)
+        if value is not None:
+            return value
+        value = await self.remote.get(key)
+        if value is not None:
+            ttl = self._read_through_expire(value)
+            if ttl > 0:
+                await self._local_call("set", key, value, ttl)
+        return value
+
+    async def set(self, key: str, value: Any, ttl: int = 0) -> None:
+        await self.remote.set(key, value, ttl)
+        await self._local_call("set", key, value, self._local_expire(ttl))
+
+    async def add(self, key: str, value: Any, ttl: int = 0) -> bool:
+        return await self.remote.add(key, value, ttl)
+
+    async def delete(self, key: str) -> None:
+        await self._local_call("delete", key)
+        await self.remote.delete(key)
+
 
-    def __init__(self):
-        self.cache = {}
+def as_async_cache(cache) -> AsyncCache:
+    """Return the cache unchanged if it already implements the `AsyncCache` protocol, otherwise wrap it in an
+    `AsyncCacheAdapter`. A `SharedFileCache` is adapted to run its calls in a thread, as its locks block."""
+    if inspect.iscoroutinefunction(getattr(cache, "get", None)):
+        return cache
+    return AsyncCacheAdapter(cache, threaded=isinstance(cache, SharedFileCache))
 
-    def get(self, key: str) -> str:
-        return self.cache.get(key)
 
-    def set(self, key: str, value: str, *args, **kwargs) -> None:
-        self.cache[key] = value
+atexit.register(AsyncMemcachedCache.close_shared)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=AsyncMemcachedCache._reset_after_fork)
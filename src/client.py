@@ -1,14 +1,28 @@
 import os
 import logging
+import asyncio
+import random
+import time
+import weakref
+from contextlib import nullcontext
+from typing import ClassVar
 
 import httpx
 from authlib.integrations.httpx_client import AsyncOAuth2Client
-from pymemcache import Client, serde
+from httpx import USE_CLIENT_DEFAULT
 
-from .cache import InMemoryCache
+from .cache import AsyncCacheAdapter, AsyncMemcachedCache, InMemoryCache, SharedFileCache, TieredCache, as_async_cache
+from .instrumentation import Instrumentation, PhaseTimer, RequestTiming, get_instrumentation
+from .log import LogSampler
+from .ratelimit import RateLimiter, get_rate_limiter
+from .resilience import CircuitBreaker, RetryPolicy, get_circuit_breaker, is_failure
+from .response_cache import ResponseCache
+from .transport import TransportConfig
 
 
-logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+# Token lookups happen on every call, so messages about them are sampled
+_token_log = LogSampler()
 
 
 class M2MClient(AsyncOAuth2Client):
@@ -27,11 +41,52 @@ class M2MClient(AsyncOAuth2Client):
                                     environment variable.
         base_url (str, optional): The base url to use for the API. Will default to the {service}_URL environment
                                     variable.
-        cache (Cache, optional): The cache to use for storing tokens. Will default to an InMemoryCache.
+        cache (Cache, optional): The cache to use for storing tokens. Either an `AsyncCache` or a synchronous cache,
+                                    which will be wrapped in an `AsyncCacheAdapter`. Will default to the shared
+                                    `AsyncMemcachedCache` if the MEMCACHED_URL environment variable is set, otherwise
+                                    an InMemoryCache. If MEMCACHED_LOCAL_TTL is also set, memcached is fronted by a
+                                    local InMemoryCache that holds tokens for up to that many seconds.
         token_cache_buffer (int, optional): The number of seconds to subtract from the token expiry time to ensure the
                                     token is not expired. Will default to 60.
+        token_lease_ttl (int, optional): When set, a lease is taken in the cache with `add` before fetching a token
+                                    from the token endpoint, so that only one process sharing the cache fetches a new
+                                    token at a time. Other processes poll the cache for up to this many seconds
+                                    before fetching a token themselves. Will default to None (no lease).
+        auto_refresh (bool, optional): Whether to renew the token in a background task before it expires, so that
+                                    requests never wait on the token endpoint. The renewal is scheduled
+                                    `token_cache_buffer` seconds before expiry, plus a random jitter of up to
+                                    `refresh_jitter` seconds. The current token keeps being used until the new one is
+                                    in place. Will default to False.
+        refresh_jitter (float, optional): The maximum number of seconds of random jitter added to background refreshes
+                                    so that many clients do not refresh at once. Will default to 10.
+        retry_policy (RetryPolicy, optional): How to retry failed requests. Pass `RetryPolicy(max_retries=0)` to
+                                    disable retries. Will default to `RetryPolicy()`.
+        circuit_breaker (CircuitBreaker, optional): The circuit breaker to guard requests with. Will default to the
+                                    process-wide circuit breaker for the service.
+        rate_limiter (RateLimiter, optional): The rate limiter to shape requests with. Will default to the process-wide
+                                    rate limiter for the service, if one is configured.
+        response_cache (ResponseCache, optional): The cache to serve GET requests from. Will default to None (GET
+                                    responses are not cached).
+        validate_responses (bool, optional): Whether to validate response bodies against their schemas. Skipping
+                                    validation decodes responses faster, but should only be used for trusted services.
+                                    Will default to the {service}_VALIDATE_RESPONSES environment variable, or True if it
+                                    is not set.
+        instrumentation (Instrumentation, optional): Where to report request timings, token lookups and retries. Will
+                                    default to the process-wide instrumentation set with `set_instrumentation`.
+        transport (httpx.AsyncBaseTransport, optional): The transport to send requests with, e.g. an
+                                    `httpx.ASGITransport` to call an app in the same process. Will default to None (a
+                                    new connection pool).
+        transport_config (TransportConfig, optional): HTTP/2, connection pool limits and timeouts. Pool limits and
+                                    HTTP/2 are ignored when a `transport` is given. Will default to
+                                    `TransportConfig.from_env(service)`.
     """
 
+    # Token endpoint fetches that are in flight on each event loop, keyed by cache key. These are shared by every
+    # client in the process so that concurrent callers wait on a single request instead of stampeding the endpoint.
+    _inflight_tokens: ClassVar[weakref.WeakKeyDictionary] = weakref.WeakKeyDictionary()
+    token_lease_poll_interval: ClassVar[float] = 0.1
+    token_refresh_retry_interval: ClassVar[float] = 5
+
     def __init__(
         self,
         service: str = None,
@@ -42,7 +97,19 @@ class M2MClient(AsyncOAuth2Client):
         base_url: str = None,
         cache=None,
         token_cache_buffer=60,
+        token_lease_ttl: int = None,
+        auto_refresh: bool = False,
+        refresh_jitter: float = 10,
+        retry_policy: RetryPolicy = None,
+        circuit_breaker: CircuitBreaker = None,
+        rate_limiter: RateLimiter = None,
+        response_cache: ResponseCache = None,
+        validate_responses: bool = None,
+        instrumentation: Instrumentation = None,
+        transport: httpx.AsyncBaseTransport = None,
+        transport_config: TransportConfig = None,
     ):
+        self.service = None
         if service:
             self.service = service.upper()
         elif not all(
@@ -64,67 +131,350 @@ class M2MClient(AsyncOAuth2Client):
         self.auth_base_url = auth_base_url or os.getenv("TOKEN_ENDPOINT")
         self.audience = audience or os.getenv(f"{self.service}_AUDIENCE")
         self.base_url = base_url or str(os.getenv(f"{self.service}_URL"))
+        # Sampler keys for token lookups, built once as the memory lookup runs on every request
+        self._memory_log_key = f"memory:{self.service}"
+        self._cache_log_key = f"cache:{self.service}"
 
         self.token_cache_buffer = token_cache_buffer
+        self.token_lease_ttl = token_lease_ttl
+        self.auto_refresh = auto_refresh
+        self.refresh_jitter = refresh_jitter
+        self._refresh_task = None
         self.cache = self._init_cache(cache)
+        self.retry_policy = retry_policy or RetryPolicy()
+        self.circuit_breaker = circuit_breaker or get_circuit_breaker(self.service or self.base_url)
+        self.rate_limiter = rate_limiter or (get_rate_limiter(self.service) if self.service else None)
+        self.response_cache = response_cache
+        if validate_responses is None:
+            validate_responses = os.getenv(f"{self.service}_VALIDATE_RESPONSES", "true").lower() not in ("0", "false")
+        self.validate_responses = validate_responses
+        self._instrumentation = instrumentation
+        self.transport_config = transport_config or TransportConfig.from_env(self.service)
+        self._urls: dict[str, tuple[httpx.URL, httpx.URL]] = {}
 
         super().__init__(
             self.client_id,
             self.client_secret,
             base_url=self.base_url,
-            timeout=30,
             event_hooks={"response": [raise_on_4xx_5xx]},
+            transport=transport,
+            **self.transport_config.client_kwargs(),
         )
     
     @staticmethod
     def _init_cache(cache=None):
         """Initialise the cache to use for storing tokens"""
-        if cache:
-            return cache
+        if cache is not None:
+            return as_async_cache(cache)
     
+        # With TOKEN_CACHE_DIR set, every process on the machine shares tokens through files in that directory
+        shared = SharedFileCache(os.getenv("TOKEN_CACHE_DIR")) if os.getenv("TOKEN_CACHE_DIR") else None
         if os.getenv("MEMCACHED_URL"):
-            return Client(os.getenv("MEMCACHED_URL"), serde=serde.pickle_serde)
+            # Every client shares one connection pool and thread pool per server, closed when the interpreter exits
+            memcached = AsyncMemcachedCache.shared(os.getenv("MEMCACHED_URL"))
+            if os.getenv("MEMCACHED_LOCAL_TTL") or shared:
+                return TieredCache(memcached, local=shared, local_ttl=float(os.getenv("MEMCACHED_LOCAL_TTL", 60)))
+            return memcached
+        if shared:
+            return as_async_cache(shared)
         
-        logging.warning("No cache provided and no MEMCACHED_URL environment variable found. Using InMemoryCache")
-        return InMemoryCache()
+        logger.warning("No cache provided and no MEMCACHED_URL environment variable found. Using InMemoryCache")
+        return AsyncCacheAdapter(InMemoryCache())
         
     async def __aenter__(self):
         """Fetch the token when entering a context manager"""
         await self.fetch_token()
         return self
 
+    @property
+    def instrumentation(self) -> Instrumentation:
+        return self._instrumentation or get_instrumentation()
+
+    @property
+    def cache_key(self) -> str:
+        """The key the token for this client's credentials is stored under in the cache"""
+        return f"{self.client_id}{self.audience}"
+
+    def url_for(self, path: str) -> httpx.URL:
+        """Get the absolute url for a path relative to the base url. Urls are cached, so repeated requests to the same
+        endpoint do not parse and join the url again.
+
+        Args:
+            path (str): The path, e.g. "file_types".
+
+        Returns:
+            httpx.URL: The absolute url.
+        """
+        cached = self._urls.get(path)
+        if cached is None or cached[0] is not self.base_url:
+            cached = self._urls[path] = (self.base_url, self._merge_url(path))
+        return cached[1]
+
+    async def aclose(self) -> None:
+        """Stop any background token refresh and close the client"""
+        if self._refresh_task:
+            self._refresh_task.cancel()
+            self._refresh_task = None
+        await super().aclose()
+
+    async def request(self, method, url, withhold_token=False, auth=USE_CLIENT_DEFAULT, **kwargs) -> httpx.Response:
+        """Make a request, serving GET requests from the response cache if one is configured.
+
+        Requests made without the client's token, such as requests to the token endpoint, are sent as they are.
+        """
+        if withhold_token or auth is not USE_CLIENT_DEFAULT:
+            return await super().request(method, url, withhold_token=withhold_token, auth=auth, **kwargs)
+        if self.response_cache and method.upper() == "GET":
+            return await self.response_cache.get(self, url, **kwargs)
+        return await self.send_request(method, url, **kwargs)
+
+    async def send_request(self, method, url, **kwargs) -> httpx.Response:
+        """Make a request with the client's token, retrying transient failures according to the retry policy. Requests
+        are guarded by the circuit breaker for the service and shaped by its rate limiter, and a 401 response forces a
+        token refresh before the request is retried once."""
+        attempt = 0
+        refreshed = False
+        while True:
+            self.circuit_breaker.before_request()
+            try:
+                async with self.rate_limiter or nullcontext():
+                    response = await self._send(method, url, attempt, **kwargs)
+            except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                if self.rate_limiter and isinstance(error, httpx.HTTPStatusError):
+                    self.rate_limiter.update(error.response)
+                if is_failure(error):
+                    self.circuit_breaker.record_failure()
+                else:
+                    self.circuit_breaker.record_success()
+
+                response = getattr(error, "response", None)
+                if response is not None and response.status_code == 401 and not refreshed:
+                    logger.info(
+                        "Request unauthorised. Refreshing m2m token and retrying", extra={"service": self.service}
+                    )
+                    refreshed = True
+                    await self.invalidate_token()
+                    await self.fetch_token()
+                    continue
+                if not self.retry_policy.should_retry(method, attempt, error):
+                    raise
+
+                delay = self.retry_policy.delay(attempt, response)
+                if self.instrumentation.enabled:
+                    self.instrumentation.retry(self.service, method, str(url), attempt, error)
+                logger.info(
+                    "Request to %s failed with %r. Retrying in %.2f seconds",
+                    url,
+                    error,
+                    delay,
+                    extra={"service": self.service, "attempt": attempt},
+                )
+                await asyncio.sleep(delay)
+                attempt += 1
+            else:
+                self.circuit_breaker.record_success()
+                if self.rate_limiter:
+                    self.rate_limiter.update(response)
+                return response
+
+    async def _send(self, method, url, attempt: int, **kwargs) -> httpx.Response:
+        """Make a single attempt at a request, reporting its timing if instrumentation is enabled"""
+        instrumentation = self.instrumentation
+        if not instrumentation.enabled:
+            return await super().request(method, url, **kwargs)
+
+        timer = PhaseTimer()
+        kwargs["extensions"] = {**(kwargs.get("extensions") or {}), "trace": timer}
+        response = error = None
+        started = time.perf_counter()
+        try:
+            response = await super().request(method, url, **kwargs)
+            return response
+        except Exception as e:
+            error = e
+            response = getattr(e, "response", None)
+            raise
+        finally:
+            instrumentation.request(
+                RequestTiming(
+                    service=self.service,
+                    method=method,
+                    url=str(url),
+                    attempt=attempt,
+                    duration=time.perf_counter() - started,
+                    status_code=response.status_code if response is not None else None,
+                    error=error,
+                    **timer.phases,
+                )
+            )
+
+    async def invalidate_token(self) -> None:
+        """Forget the current token so that the next call to `fetch_token` fetches a new one. The cached token is only
+        removed if it is the same token, as another client may already have replaced it."""
+        if self.token:
+            cached = await self.cache.get(self.cache_key)
+            if cached and cached.get("access_token") == self.token.get("access_token"):
+                await self.cache.delete(self.cache_key)
+        self.token = None
+
     async def fetch_token(self, *args, **kwargs):
         # Get from memory
+        instrumentation = self.instrumentation
         if self.token and not self.token.is_expired():
-            logging.info("Using m2m token from memory")
+            _token_log.log(
+                logger,
+                logging.DEBUG,
+                self._memory_log_key,
+                "Using m2m token from memory",
+                extra={"service": self.service},
+            )
+            if instrumentation.enabled:
+                instrumentation.token(self.service, "memory")
             return self.token
         # Get from cache
-        logging.info("No m2m token found in memory. Fetching token from cache")
-        key = f"{self.client_id}{self.audience}"
-        token = self.cache.get(key)
-        if token and not token.is_expired():
-            logging.info("Retrieved token from the cache")
+        token = await self._get_cached_token()
+        if token:
+            _token_log.log(
+                logger,
+                logging.DEBUG,
+                self._cache_log_key,
+                "Retrieved m2m token from the cache",
+                extra={"service": self.service},
+            )
+            if instrumentation.enabled:
+                instrumentation.token(self.service, "cache")
             self.token = token
+            self._schedule_refresh()
             return token
         # Get from token endpoint
-        logging.info("No m2m token found in cache. Fetching token from token endpoint")
-        token = await super().fetch_token(
-            self.auth_base_url,
-            audience=self.audience,
-            grant_type="client_credentials",
-        )
+        if instrumentation.enabled:
+            instrumentation.token(self.service, "endpoint")
+        token = await self._fetch_shared_token()
+        self.token = token
+        self._schedule_refresh()
+        return token
+
+    async def _fetch_shared_token(self):
+        """Fetch a token from the token endpoint, joining any fetch for the same credentials that is already in
+        flight on this event loop"""
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight_tokens.setdefault(loop, {})
+        key = self.cache_key
+        task = inflight.get(key)
+        if task is None:
+            logger.info("Fetching m2m token from token endpoint", extra={"service": self.service})
+            task = inflight[key] = loop.create_task(self._fetch_and_cache_token())
+            task.add_done_callback(lambda t: inflight.pop(key) if inflight.get(key) is t else None)
+        else:
+            logger.debug("Waiting for in-flight m2m token fetch", extra={"service": self.service})
+
+        # Shield the shared fetch so that a cancelled caller does not cancel it for everyone else
+        return await asyncio.shield(task)
+
+    def _schedule_refresh(self) -> None:
+        """Start the background refresh task if auto refresh is enabled and it is not already running"""
+        if not self.auto_refresh or self.is_closed:
+            return
+        if self._refresh_task and not self._refresh_task.done():
+            return
+        self._refresh_task = asyncio.get_running_loop().create_task(self._refresh_loop())
+
+    def _seconds_until_refresh(self) -> float:
+        """The number of seconds to wait before renewing the current token"""
+        expires_at = self.token.get("expires_at")
+        now = time.time()
+        refresh_at = expires_at - self.token_cache_buffer - random.uniform(0, self.refresh_jitter)
+        if refresh_at <= now:
+            # The token lifetime is shorter than the buffer, so renew half way through what is left of it
+            return max((expires_at - now) / 2, 1)
+        return refresh_at - now
+
+    async def _refresh_loop(self) -> None:
+        """Renew the token ahead of expiry for as long as the client is open. The current token is only replaced once
+        a new one has been fetched, so requests keep using it in the meantime."""
+        while not self.is_closed and self.token and self.token.get("expires_at"):
+            await asyncio.sleep(self._seconds_until_refresh())
+            try:
+                current_expiry = self.token.get("expires_at")
+                # Another client or process may already have published a newer token
+                token = await self._get_cached_token()
+                if not token or token.get("expires_at") <= current_expiry:
+                    logger.info("Refreshing m2m token in the background", extra={"service": self.service})
+                    token = await self._fetch_shared_token()
+                self.token = token
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception(
+                    "Background m2m token refresh failed. Retrying shortly", extra={"service": self.service}
+                )
+                await asyncio.sleep(self.token_refresh_retry_interval)
+
+    async def _get_cached_token(self):
+        """Get an unexpired token from the cache, if there is one"""
+        token = await self.cache.get(self.cache_key)
+        if token and not token.is_expired():
+            return token
+        return None
+
+    async def _fetch_and_cache_token(self):
+        """Fetch a token from the token endpoint and save it to the cache. If a lease is configured, only fetch the
+        token if the lease is acquired, otherwise wait for the lease holder to publish its token to the cache."""
+        lease_key = f"{self.cache_key}:lease"
+        leased = False
+        if self.token_lease_ttl:
+            leased = await self.cache.add(lease_key, str(os.getpid()), self.token_lease_ttl)
+            if not leased:
+                logger.info(
+                    "Token lease held by another process. Waiting for token in cache", extra={"service": self.service}
+                )
+                token = await self._wait_for_cached_token()
+                if token:
+                    return token
+                logger.warning("Token lease expired without a token being cached", extra={"service": self.service})
 
-        # Save the token to the cache
-        logging.info("Saving m2m token to cache")
+        try:
+            token = await super().fetch_token(
+                self.auth_base_url,
+                audience=self.audience,
+                grant_type="client_credentials",
+            )
 
-        ttl = token.get("expires_in") - self.token_cache_buffer
-        if ttl < 0:
-            ttl = token.get("expires_in")
-        self.cache.set(key, token, ttl)
+            # Save the token to the cache
+            logger.debug("Saving m2m token to cache", extra={"service": self.service})
+
+            ttl = token.get("expires_in") - self.token_cache_buffer
+            if ttl < 0:
+                ttl = token.get("expires_in")
+            await self.cache.set(self.cache_key, token, ttl)
+        finally:
+            if leased:
+                await self.cache.delete(lease_key)
 
         return token
 
+    async def _wait_for_cached_token(self):
+        """Poll the cache for a token until the lease expires"""
+        deadline = time.monotonic() + self.token_lease_ttl
+        while time.monotonic() < deadline:
+            await asyncio.sleep(self.token_lease_poll_interval)
+            token = await self._get_cached_token()
+            if token:
+                return token
+        return None
+
+
+def _reset_after_fork() -> None:
+    # Fetches in flight in the parent belong to event loops that never run in a forked child
+    M2MClient._inflight_tokens = weakref.WeakKeyDictionary()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
 
 async def raise_on_4xx_5xx(response: httpx.Response) -> None:
-    """Always raise for status for 4xx and 5xx status codes"""
-    response.raise_for_status()
+    """Always raise for status for anything other than a success, except 304 Not Modified, which answers conditional
+    requests. Redirects are not followed, so they still raise."""
+    if response.status_code != 304:
+        response.raise_for_status()
@@ -0,0 +1,340 @@
+import asyncio
+import hashlib
+import json
+import logging
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Any, AsyncGenerator, Callable, Hashable, Optional, Union
+
+from .client import M2MClient
+from .pool import client_pool
+from .schema import LazyPage
+from .utilities import Paginator
+
+
+logger = logging.getLogger(__name__)
+
+
+def _hash(content: Union[str, bytes]) -> str:
+    if isinstance(content, str):
+        content = content.encode()
+    return hashlib.blake2b(content, digest_size=16).hexdigest()
+
+
+def _from_json(key: Any) -> Hashable:
+    """JSON has no tuples, so keys that were tuples are loaded as lists"""
+    return tuple(_from_json(part) for part in key) if isinstance(key, list) else key
+
+
+@dataclass
+class PageState:
+    """What a page held when it was last synced: its ETag, a hash of its body and the keys of its items"""
+
+    etag: Optional[str]
+    hash: str
+    keys: list
+
+
+@dataclass
+class Checkpoint:
+    """The state of a collection after its last complete sync.
+
+    Args:
+        collection (str): The name of the collection.
+        page_count (int): The number of pages the collection had.
+        high_water (Any): The highest `high_water` value of any item synced, if a `high_water` function was given.
+        pages (dict[int, PageState]): The state of each page, by page number.
+        items (dict[Hashable, str]): The hash of each item's JSON, by item key.
+    """
+
+    collection: str
+    page_count: int = 0
+    high_water: Any = None
+    pages: dict[int, PageState] = field(default_factory=dict)
+    items: dict[Hashable, str] = field(default_factory=dict)
+
+
+class CheckpointStore:
+    """Stores sync checkpoints in a local SQLite database. Calls run in a thread, so they never block the event loop.
+
+    Args:
+        path (str, optional): The path to the database file. Will default to ":memory:" (checkpoints are lost when the
+                                    process exits).
+    """
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS checkpoints (
+                collection TEXT PRIMARY KEY,
+                page_count INTEGER NOT NULL,
+                high_water TEXT,
+                pages TEXT NOT NULL,
+                items TEXT NOT NULL,
+                updated_at REAL NOT NULL
+            )
+            """
+        )
+        self._connection.commit()
+        self._lock = threading.Lock()
+
+    def _load(self, collection: str) -> Optional[Checkpoint]:
+        with self._lock:
+            row = self._connection.execute(
+                "SELECT page_count, high_water, pages, items FROM checkpoints WHERE collection = ?", (collection,)
+            ).fetchone()
+        if row is None:
+            return None
+        page_count, high_water, pages, items = row
+        return Checkpoint(
+            collection=collection,
+            page_count=page_count,
+            high_water=json.loads(high_water),
+            pages={
+                page: PageState(etag, hash_, [_from_json(key) if isinstance(key, list) else key for key in keys])
+                for page, etag, hash_, keys in json.loads(pages)
+            },
+            items={_from_json(key) if isinstance(key, list) else key: hash_ for key, hash_ in json.loads(items)},
+        )
+
+    def _save(self, checkpoint: Checkpoint) -> None:
+        pages = [[page, state.etag, state.hash, state.keys] for page, state in checkpoint.pages.items()]
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    checkpoint.collection,
+                    checkpoint.page_count,
+                    json.dumps(checkpoint.high_water),
+                    json.dumps(pages),
+                    json.dumps(list(checkpoint.items.items())),
+                    time.time(),
+                ),
+            )
+
+    async def load(self, collection: str) -> Optional[Checkpoint]:
+        """Load the checkpoint of a collection, or None if it has never been synced"""
+        return await asyncio.to_thread(self._load, collection)
+
+    async def save(self, checkpoint: Checkpoint) -> None:
+        """Save the checkpoint of a collection, replacing the previous one"""
+        await asyncio.to_thread(self._save, checkpoint)
+
+    def close(self) -> None:
+        """Close the database. The store cannot be used afterwards"""
+        self._connection.close()
+
+
+@dataclass
+class Change:
+    """An item that was added, updated or removed since the last sync. Removed items only have their key."""
+
+    kind: str
+    key: Hashable
+    item: Any = None
+
+
+@dataclass
+class _FetchedPage:
+    page: int
+    pages: int
+    not_modified: bool
+    etag: Optional[str] = None
+    hash: Optional[str] = None
+    items: Optional[LazyPage] = None
+
+
+class IncrementalSync:
+    """Syncs a paginated collection against a checkpoint from its last sync, yielding only the items that changed.
+
+    Every page is requested with the ETag it had last time, so a server that supports conditional requests answers
+    unchanged pages with an empty 304 response. Pages whose body is the same as last time are skipped without being
+    decoded, and on changed pages only items whose JSON differs from last time are decoded, unless `key` needs them.
+    Items that are no longer in the collection are reported as removed. The checkpoint is saved once every page has
+    been synced, so a sync that fails or is stopped early is repeated in full next time.
+
+    For collections that items are only ever appended to, in order, set `append_only` to resume from the last page of
+    the previous sync instead of requesting every page. For services that can filter a collection to items newer than
+    a value, e.g. `?since_id=`, pass a `high_water` function that gets the value from an item and the `since_param`
+    to send the highest value from the last sync as.
+
+    Args:
+        fn (Callable[..., Coroutine]): A paginated service function generated from the endpoint registry, e.g.
+                                    `authinator.get_organisations`.
+        store (CheckpointStore): Where checkpoints are kept.
+        collection (str, optional): The name to keep the checkpoint under. Will default to the service and name of the
+                                    function, plus any params.
+        per_page (int, optional): The number of items per page. Will default to 100.
+        key (Callable[[Any], Hashable], optional): Gets the key identifying an item, such as its id, so changes to an
+                                    item are reported as updates. Will default to None (items are identified by their
+                                    content, so a changed item is reported as removed and added).
+        high_water (Callable[[Any], Any], optional): Gets the value the high-water mark is kept of, such as an id or
+                                    an ISO updated time. It must be JSON serialisable. Will default to None.
+        since_param (str, optional): The query parameter to send the high-water mark as. Needs `high_water`. Will
+                                    default to None.
+        append_only (bool, optional): Whether to resume from the last page of the previous sync. Will default to False.
+        read_ahead (int, optional): The number of pages to request ahead of the current one. Will default to 4.
+        client (M2MClient, optional): The client to use to make the requests. Will default to None (a pooled client).
+        **params: Other query parameters to send with every request.
+    """
+
+    def __init__(
+        self,
+        fn: Callable,
+        store: CheckpointStore,
+        collection: Optional[str] = None,
+        per_page: int = 100,
+        key: Optional[Callable[[Any], Hashable]] = None,
+        high_water: Optional[Callable[[Any], Any]] = None,
+        since_param: Optional[str] = None,
+        append_only: bool = False,
+        read_ahead: int = 4,
+        client: Optional[M2MClient] = None,
+        **params,
+    ):
+        endpoint = getattr(fn, "endpoint", None)
+        if endpoint is None or not endpoint.paginated:
+            raise ValueError("fn must be a paginated service function generated from the endpoint registry")
+        if since_param and not high_water:
+            raise ValueError("since_param needs a high_water function")
+        self.endpoint = endpoint
+        self.store = store
+        self.collection = collection or ":".join(
+            [str(endpoint.service), endpoint.name] + ([json.dumps(params, sort_keys=True)] if params else [])
+        )
+        self.per_page = per_page
+        self.key = key
+        self.high_water = high_water
+        self.since_param = since_param
+        self.append_only = append_only
+        self.read_ahead = read_ahead
+        self.client = client
+        self.params = params
+        self.stats = {"requests": 0, "not_modified": 0, "changed_pages": 0, "changed_items": 0}
+
+    async def _fetch(
+        self, client: M2MClient, previous: Checkpoint, page: int, per_page: int, params: dict, conditional: bool
+    ) -> _FetchedPage:
+        state = previous.pages.get(page) if conditional else None
+        headers = {"If-None-Match": state.etag} if state and state.etag else None
+        response = await client.send_request(
+            "GET",
+            client.url_for(self.endpoint.path),
+            params={**params, "page": page, "per_page": per_page},
+            headers=headers,
+        )
+        self.stats["requests"] += 1
+        if response.status_code == 304:
+            self.stats["not_modified"] += 1
+            return _FetchedPage(page, previous.page_count, not_modified=True)
+
+        body_hash = _hash(response.content)
+        if state and state.hash == body_hash:
+            return _FetchedPage(page, previous.page_count, not_modified=True)
+        items = LazyPage.decode(response.content, self.endpoint.item_type, validate=client.validate_responses)
+        return _FetchedPage(page, items.pages, False, response.headers.get("ETag"), body_hash, items)
+
+    async def changes(self) -> AsyncGenerator[Change, None]:
+        """Sync the collection, yielding each item that was added, updated or removed since the last sync.
+
+        Yields:
+            Change: Each change.
+        """
+        # Stats are for the latest sync only
+        self.stats = dict.fromkeys(self.stats, 0)
+        if self.client is not None:
+            async for change in self._changes(self.client):
+                yield change
+            return
+        async with client_pool.borrow(str(self.endpoint.service)) as client:
+            async for change in self._changes(client):
+                yield change
+
+    async def _changes(self, client: M2MClient) -> AsyncGenerator[Change, None]:
+        previous = await self.store.load(self.collection) or Checkpoint(self.collection)
+        current = Checkpoint(self.collection, high_water=previous.high_water)
+        params = dict(self.params)
+        since = self.since_param is not None and previous.high_water is not None
+        if since:
+            # Only newer items are returned, so nothing else can be compared and the previous state is kept
+            params[self.since_param] = previous.high_water
+            current.page_count = previous.page_count
+            current.pages = previous.pages
+            current.items = dict(previous.items)
+
+        start = 1
+        if self.append_only and previous.page_count and not since:
+            start = previous.page_count
+            for page in range(1, start):
+                state = current.pages[page] = previous.pages[page]
+                for key in state.keys:
+                    current.items[key] = previous.items[key]
+
+        async def fetch(page: int, per_page: int) -> _FetchedPage:
+            return await self._fetch(client, previous, page, per_page, params, conditional=not since)
+
+        async with Paginator(fetch, per_page=self.per_page, read_ahead=self.read_ahead) as paginator:
+            paginator.page = start
+            async for fetched in paginator:
+                if not since:
+                    current.page_count = fetched.pages
+                if fetched.not_modified:
+                    state = current.pages[fetched.page] = previous.pages[fetched.page]
+                    for key in state.keys:
+                        current.items[key] = previous.items[key]
+                    continue
+
+                self.stats["changed_pages"] += 1
+                keys = []
+                for change in self._page_changes(fetched.items.items, previous, current, keys):
+                    yield change
+                if not since:
+                    current.pages[fetched.page] = PageState(fetched.etag, fetched.hash, keys)
+
+        if not since:
+            for key in previous.items.keys() - current.items.keys():
+                yield Change("removed", key)
+        await self.store.save(current)
+        logger.debug(
+            "Synced %s: %s",
+            self.collection,
+            self.stats,
+            extra={"service": str(self.endpoint.service)},
+        )
+
+    def _page_changes(self, items, previous: Checkpoint, current: Checkpoint, keys: list):
+        """Compare the items of a changed page with the previous sync, recording their keys and hashes"""
+        for index in range(len(items)):
+            item_hash = _hash(items.raw(index))
+            item = None
+            if self.key is None:
+                key = item_hash
+            else:
+                item = items[index]
+                key = self.key(item)
+            keys.append(key)
+            current.items[key] = item_hash
+
+            old_hash = previous.items.get(key)
+            if old_hash == item_hash:
+                continue
+            if item is None:
+                item = items[index]
+            self.stats["changed_items"] += 1
+            if self.high_water is not None:
+                value = self.high_water(item)
+                if current.high_water is None or value > current.high_water:
+                    current.high_water = value
+            yield Change("added" if old_hash is None else "updated", key, item)
+
+    async def sync(self) -> list[Change]:
+        """Sync the collection, returning every change since the last sync.
+
+        Returns:
+            list[Change]: The changes.
+        """
+        return [change async for change in self.changes()]
@@ -0,0 +1,242 @@
+import collections
+import statistics
+import threading
+import time
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class RequestTiming:
+    """The timing of one attempt at a request made by an `M2MClient`. All durations are in seconds.
+
+    The phases come from the httpx `trace` extension, so they are None when the transport does not report them (e.g.
+    mocked transports), and `connect` and `tls` are None when an existing connection was reused. `transfer` covers both
+    sending the request and reading the response body, and `wait` is the time spent waiting for the response headers.
+    """
+
+    service: Optional[str]
+    method: str
+    url: str
+    attempt: int
+    duration: float
+    status_code: Optional[int] = None
+    error: Optional[BaseException] = None
+    connect: Optional[float] = None
+    tls: Optional[float] = None
+    wait: Optional[float] = None
+    transfer: Optional[float] = None
+
+
+@dataclass
+class PageTiming:
+    """The time taken to fetch one page with `Paginator`, `iter_pages`, `iter_all` or `fetch_all`."""
+
+    function: str
+    page: int
+    duration: float
+    error: Optional[BaseException] = None
+
+
+class Instrumentation:
+    """The interface instrumentation hooks are reported to. Every hook does nothing, so subclasses only need to
+    override the ones they are interested in.
+
+    Hooks are only called when `enabled` is True. It is False here, so the default instrumentation costs a single
+    attribute check on each hot path.
+    """
+
+    enabled: bool = False
+
+    def request(self, timing: RequestTiming) -> None:
+        """Called after every attempt at a request, including attempts that fail"""
+
+    def token(self, service: Optional[str], source: str) -> None:
+        """Called whenever a client needs a token, with where the token came from: "memory", "cache" or "endpoint"
+        (a cache miss)"""
+
+    def retry(self, service: Optional[str], method: str, url: str, attempt: int, error: Exception) -> None:
+        """Called before a failed request is retried"""
+
+    def pool(self, service: str, event: str, size: int) -> None:
+        """Called when the client pool is used, with the event ("hit", "miss" or "evict") and the number of clients
+        pooled on the event loop afterwards"""
+
+    def page(self, timing: PageTiming) -> None:
+        """Called after every page is fetched by the pagination helpers"""
+
+
+_instrumentation = Instrumentation()
+
+
+def get_instrumentation() -> Instrumentation:
+    """Get the process-wide instrumentation, which clients without their own instrumentation report to"""
+    return _instrumentation
+
+
+def set_instrumentation(instrumentation: Optional[Instrumentation]) -> None:
+    """Set the process-wide instrumentation. Pass None to go back to the no-op default.
+
+    Args:
+        instrumentation (Instrumentation): The instrumentation to report to.
+    """
+    global _instrumentation
+    _instrumentation = instrumentation or Instrumentation()
+
+
+# The trace events that make up each phase of a request
+_TRACE_PHASES = {
+    "connect_tcp": "connect",
+    "connect_unix_socket": "connect",
+    "start_tls": "tls",
+    "send_request_headers": "transfer",
+    "send_request_body": "transfer",
+    "receive_response_headers": "wait",
+    "receive_response_body": "transfer",
+}
+
+
+class PhaseTimer:
+    """An httpx `trace` extension that adds up the time spent in each phase of a request"""
+
+    __slots__ = ("phases", "_started")
+
+    def __init__(self):
+        self.phases: dict[str, float] = {}
+        self._started: dict[str, float] = {}
+
+    async def __call__(self, name: str, info: dict) -> None:
+        # Event names look like "http11.receive_response_headers.started"
+        _, _, name = name.partition(".")
+        step, _, event = name.rpartition(".")
+        phase = _TRACE_PHASES.get(step)
+        if phase is None:
+            return
+        now = time.perf_counter()
+        if event == "started":
+            self._started[step] = now
+        elif step in self._started:
+            self.phases[phase] = self.phases.get(phase, 0.0) + now - self._started.pop(step)
+
+
+class MetricsCollector(Instrumentation):
+    """Instrumentation that keeps counters and the most recent request and page timings in memory.
+
+    Counters are keyed by name: "requests", "requests.errors", "token.memory", "token.cache", "token.endpoint",
+    "retries", "pool.hit", "pool.miss", "pool.evict" and "pages".
+
+    Args:
+        max_samples (int, optional): The number of request and page timings to keep. Will default to 10000.
+    """
+
+    enabled = True
+
+    def __init__(self, max_samples: int = 10000):
+        self.counters: collections.Counter[str] = collections.Counter()
+        self.requests: collections.deque[RequestTiming] = collections.deque(maxlen=max_samples)
+        self.pages: collections.deque[PageTiming] = collections.deque(maxlen=max_samples)
+        self.pool_size: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def request(self, timing: RequestTiming) -> None:
+        with self._lock:
+            self.counters["requests"] += 1
+            if timing.error is not None:
+                self.counters["requests.errors"] += 1
+            self.requests.append(timing)
+
+    def token(self, service: Optional[str], source: str) -> None:
+        with self._lock:
+            self.counters[f"token.{source}"] += 1
+
+    def retry(self, service: Optional[str], method: str, url: str, attempt: int, error: Exception) -> None:
+        with self._lock:
+            self.counters["retries"] += 1
+
+    def pool(self, service: str, event: str, size: int) -> None:
+        with self._lock:
+            self.counters[f"pool.{event}"] += 1
+            self.pool_size[service] = size
+
+    def page(self, timing: PageTiming) -> None:
+        with self._lock:
+            self.counters["pages"] += 1
+            self.pages.append(timing)
+
+    def summary(self) -> dict:
+        """Summarise the collected metrics, with the median and 99th percentile of each request phase and of page
+        fetches, in seconds"""
+        with self._lock:
+            requests = list(self.requests)
+            pages = list(self.pages)
+            summary = {"counters": dict(self.counters), "pool_size": dict(self.pool_size)}
+
+        def percentiles(values: list[float]) -> Optional[dict]:
+            if not values:
+                return None
+            if len(values) == 1:
+                return {"p50": values[0], "p99": values[0]}
+            quantiles = statistics.quantiles(values, n=100, method="inclusive")
+            return {"p50": quantiles[49], "p99": quantiles[98]}
+
+        summary["requests"] = {
+            phase: percentiles([getattr(t, phase) for t in requests if getattr(t, phase) is not None])
+            for phase in ("duration", "connect", "tls", "wait", "transfer")
+        }
+        summary["pages"] = percentiles([t.duration for t in pages])
+        return summary
+
+
+class OpenTelemetryInstrumentation(Instrumentation):
+    """Instrumentation that records metrics with OpenTelemetry. Requires the `opentelemetry-api` package.
+
+    Args:
+        meter (opentelemetry.metrics.Meter, optional): The meter to record with. Will default to the meter for this
+                                    package from the global meter provider.
+    """
+
+    enabled = True
+
+    def __init__(self, meter=None):
+        if meter is None:
+            # Imported here so OpenTelemetry is only needed by those who use it
+            from opentelemetry import metrics
+
+            meter = metrics.get_meter("microservice_rest_client")
+        self.meter = meter
+        self._duration = self.meter.create_histogram(
+            "http.client.request.duration", unit="s", description="The duration of requests made by M2MClient"
+        )
+        self._phase = self.meter.create_histogram(
+            "m2m_client.request.phase.duration", unit="s", description="The duration of each phase of a request"
+        )
+        self._tokens = self.meter.create_counter("m2m_client.token.lookups", description="Token lookups by source")
+        self._retries = self.meter.create_counter("m2m_client.retries", description="Retried requests")
+        self._pool = self.meter.create_counter("m2m_client.pool.events", description="Client pool hits and misses")
+        self._pages = self.meter.create_histogram(
+            "m2m_client.page.duration", unit="s", description="The time taken to fetch a page"
+        )
+
+    def request(self, timing: RequestTiming) -> None:
+        attributes = {"service": timing.service or "", "http.request.method": timing.method}
+        if timing.status_code is not None:
+            attributes["http.response.status_code"] = timing.status_code
+        if timing.error is not None:
+            attributes["error.type"] = type(timing.error).__name__
+        self._duration.record(timing.duration, attributes)
+        for phase in ("connect", "tls", "wait", "transfer"):
+            value = getattr(timing, phase)
+            if value is not None:
+                self._phase.record(value, {"service": timing.service or "", "phase": phase})
+
+    def token(self, service: Optional[str], source: str) -> None:
+        self._tokens.add(1, {"service": service or "", "source": source})
+
+    def retry(self, service: Optional[str], method: str, url: str, attempt: int, error: Exception) -> None:
+        self._retries.add(1, {"service": service or "", "http.request.method": method})
+
+    def pool(self, service: str, event: str, size: int) -> None:
+        self._pool.add(1, {"service": service, "event": event})
+
+    def page(self, timing: PageTiming) -> None:
+        self._pages.record(timing.duration, {"function": timing.function})
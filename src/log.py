@@ -0,0 +1,38 @@
+import logging
+import threading
+import time
+
+
+class LogSampler:
+    """Rate limits log messages that would otherwise be emitted on every call, such as token cache hits. Each key is
+    logged at most once every `interval` seconds, and the next message that gets through says how many were
+    suppressed in between, both in its text and in the `suppressed` attribute of its record.
+
+    The level is checked before anything else, so a sampled message that is disabled costs the same as a normal
+    `logger.debug` call.
+
+    Args:
+        interval (float, optional): The minimum number of seconds between messages with the same key. Will default
+                                    to 60.
+    """
+
+    def __init__(self, interval: float = 60):
+        self.interval = interval
+        self._last: dict[str, float] = {}
+        self._suppressed: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def log(self, logger: logging.Logger, level: int, key: str, msg: str, *args, extra: dict = None) -> None:
+        """Log a message if no message with the same key was logged in the last `interval` seconds"""
+        if not logger.isEnabledFor(level):
+            return
+        now = time.monotonic()
+        with self._lock:
+            if now - self._last.get(key, -self.interval) < self.interval:
+                self._suppressed[key] = self._suppressed.get(key, 0) + 1
+                return
+            self._last[key] = now
+            suppressed = self._suppressed.pop(key, 0)
+        if suppressed:
+            msg, args = f"{msg} (%d similar messages suppressed)", (*args, suppressed)
+        logger.log(level, msg, *args, extra={**(extra or {}), "suppressed": suppressed})
@@ -0,0 +1,265 @@
+import asyncio
+import atexit
+import itertools
+import logging
+import os
+import threading
+import time
+import weakref
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+import httpx
+
+from .client import M2MClient
+from .instrumentation import get_instrumentation
+
+
+logger = logging.getLogger(__name__)
+
+
+# Pool key for the unauthenticated client used to upload files to signed urls
+_UPLOAD_KEY = ("__UPLOAD__",)
+
+
+@dataclass
+class _PooledClient:
+    client: httpx.AsyncClient
+    last_used: float = field(default_factory=time.monotonic)
+    # The number of callers using the client. Borrowed clients are never closed for being idle
+    borrowed: int = 0
+
+
+class _Borrow:
+    """Lends a pooled client for the duration of an `async with` block"""
+
+    __slots__ = ("_pool", "_key", "_create", "_fetch_token", "_entry")
+
+    def __init__(self, pool: "ClientPool", key: tuple, create: Callable[[], httpx.AsyncClient], fetch_token: bool):
+        self._pool = pool
+        self._key = key
+        self._create = create
+        self._fetch_token = fetch_token
+        self._entry = None
+
+    async def __aenter__(self) -> httpx.AsyncClient:
+        self._entry = self._pool._entry(self._key, self._create, borrow=True)
+        if self._fetch_token:
+            try:
+                await self._entry.client.fetch_token()
+            except BaseException:
+                self._pool._release(self._entry)
+                raise
+        return self._entry.client
+
+    async def __aexit__(self, *args) -> None:
+        self._pool._release(self._entry)
+
+
+class ClientPool:
+    """A process-wide pool of long-lived clients. Clients are keyed by the event loop they were created on, the
+    service they talk to, the credentials they were configured with and the arguments set with `configure`, so repeated
+    calls from the same loop reuse the same connection pool and in-memory token instead of building a new client every
+    time.
+
+    Clients that have not been used for `idle_timeout` seconds are closed the next time the pool is accessed. Clients
+    lent out with `borrow` are never closed while they are in use, and are idle from when they are returned. Clients
+    handed out by `get` and `acquire` are not tracked, so with `idle_timeout` set only `borrow` is safe for work that
+    may outlast it. Remaining
+    clients are closed when the interpreter exits, but only on loops that are still open then. Loops run with
+    `asyncio.run` are closed before that, so call `await client_pool.aclose()` before the loop finishes to close its
+    connections cleanly. Otherwise they are dropped without being shut down.
+
+    Args:
+        idle_timeout (float, optional): The number of seconds a client can sit unused before it is closed. Set to
+                                    None to keep clients open until the pool is closed. Will default to 300.
+    """
+
+    def __init__(self, idle_timeout: Optional[float] = 300):
+        self.idle_timeout = idle_timeout
+        self._loops: weakref.WeakKeyDictionary[
+            asyncio.AbstractEventLoop, dict[tuple, _PooledClient]
+        ] = weakref.WeakKeyDictionary()
+        self._closing: set[asyncio.Task] = set()
+        self._client_kwargs: dict[str, dict] = {}
+        # Every call to `configure` gets a new id, which is part of the pool key, so reconfigured services get new
+        # clients
+        self._config_ids: dict[str, int] = {}
+        self._next_config_id = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def configure(self, service: str, **kwargs) -> None:
+        """Set the arguments pooled clients for a service are created with, e.g. a response cache or retry policy.
+        Clients that are already pooled keep their arguments, but are no longer handed out, and are closed once idle.
+
+        Args:
+            service (str): The service to configure.
+            **kwargs: Arguments to pass to `M2MClient`.
+        """
+        with self._lock:
+            self._client_kwargs[service.upper()] = kwargs
+            self._config_ids[service.upper()] = next(self._next_config_id)
+
+    def _key(self, service: str) -> tuple:
+        """Build the pool key for a service from the credentials and arguments the client would be configured with"""
+        service = service.upper()
+        kwargs = self._client_kwargs.get(service, {})
+        return (
+            service,
+            kwargs.get("client_id") or os.getenv("AUTH0_CLIENT_ID"),
+            kwargs.get("auth_base_url") or os.getenv("TOKEN_ENDPOINT"),
+            kwargs.get("audience") or os.getenv(f"{service}_AUDIENCE"),
+            kwargs.get("base_url") or os.getenv(f"{service}_URL"),
+            self._config_ids.get(service, 0),
+        )
+
+    def _create_client(self, service: str) -> Callable[[], M2MClient]:
+        kwargs = self._client_kwargs.get(service.upper(), {})
+        return lambda: M2MClient(service, **kwargs)
+
+    @staticmethod
+    def _create_upload_client() -> httpx.AsyncClient:
+        return httpx.AsyncClient(timeout=httpx.Timeout(30, write=None))
+
+    def get(self, service: str) -> M2MClient:
+        """Get the pooled client for a service on the running event loop, creating it if needed. The client is not
+        marked as in use, so it can be closed for being idle while the caller still holds it. Only `borrow` is safe
+        for anything that may outlast `idle_timeout`.
+
+        Args:
+            service (str): The service to get a client for.
+
+        Returns:
+            M2MClient: The pooled client. It must not be closed by the caller.
+        """
+        return self._entry(self._key(service), self._create_client(service)).client
+
+    def get_upload_client(self) -> httpx.AsyncClient:
+        """Get the pooled client for uploading files to signed urls on the running event loop, creating it if needed.
+        The client sends no credentials, and its write timeout is disabled as uploads can be large. As with `get`, use
+        `borrow_upload_client` for uploads that may outlast `idle_timeout`.
+
+        Returns:
+            httpx.AsyncClient: The pooled upload client. It must not be closed by the caller.
+        """
+        return self._entry(_UPLOAD_KEY, self._create_upload_client).client
+
+    def borrow(self, service: str) -> _Borrow:
+        """Borrow the pooled client for a service, with a valid token, for the duration of an `async with` block. The
+        client is not closed for being idle until it is returned.
+
+        Args:
+            service (str): The service to borrow a client for.
+
+        Returns:
+            An async context manager that yields the `M2MClient`. It must not be closed by the caller.
+        """
+        return _Borrow(self, self._key(service), self._create_client(service), fetch_token=True)
+
+    def borrow_upload_client(self) -> _Borrow:
+        """Borrow the pooled upload client for the duration of an `async with` block, as `borrow` does.
+
+        Returns:
+            An async context manager that yields the upload `httpx.AsyncClient`. It must not be closed by the caller.
+        """
+        return _Borrow(self, _UPLOAD_KEY, self._create_upload_client, fetch_token=False)
+
+    def _entry(self, key: tuple, create: Callable[[], httpx.AsyncClient], borrow: bool = False) -> _PooledClient:
+        """Get the pool entry for a key on the running event loop, creating its client if needed"""
+        loop = asyncio.get_running_loop()
+        now = time.monotonic()
+        with self._lock:
+            self._evict(loop, now)
+            clients = self._loops.setdefault(loop, {})
+            entry = clients.get(key)
+            hit = entry is not None and not entry.client.is_closed
+            if not hit:
+                entry = clients[key] = _PooledClient(create())
+            entry.last_used = now
+            if borrow:
+                entry.borrowed += 1
+            instrumentation = get_instrumentation()
+            if instrumentation.enabled:
+                instrumentation.pool(key[0], "hit" if hit else "miss", len(clients))
+            return entry
+
+    def _release(self, entry: _PooledClient) -> None:
+        """Return a borrowed client, which is idle from now"""
+        with self._lock:
+            entry.borrowed -= 1
+            entry.last_used = time.monotonic()
+
+    async def acquire(self, service: str) -> M2MClient:
+        """Get the pooled client for a service and make sure it holds a valid token. As with `get`, the client is not
+        marked as in use, so only `borrow` is safe for anything that may outlast `idle_timeout`.
+
+        Args:
+            service (str): The service to get a client for.
+
+        Returns:
+            M2MClient: The pooled client with a token.
+        """
+        client = self.get(service)
+        await client.fetch_token()
+        return client
+
+    def _evict(self, loop: asyncio.AbstractEventLoop, now: float) -> None:
+        """Drop clients belonging to closed loops and close clients on this loop that have been idle for too long"""
+        for other in list(self._loops.keys()):
+            if other.is_closed():
+                del self._loops[other]
+
+        if self.idle_timeout is None:
+            return
+
+        clients = self._loops.get(loop, {})
+        for key, entry in list(clients.items()):
+            if not entry.borrowed and now - entry.last_used > self.idle_timeout:
+                del clients[key]
+                logger.debug("Closing idle %s client", key[0])
+                instrumentation = get_instrumentation()
+                if instrumentation.enabled:
+                    instrumentation.pool(key[0], "evict", len(clients))
+                task = loop.create_task(entry.client.aclose())
+                self._closing.add(task)
+                task.add_done_callback(self._closing.discard)
+
+    def reset(self) -> None:
+        """Drop every pooled client without closing it. This is called in a child process after a fork for the
+        process-wide `client_pool`, as the child shares its parent's connections and must neither use nor close them.
+        New clients are created on first use."""
+        self._loops = weakref.WeakKeyDictionary()
+        self._closing = set()
+        self._lock = threading.Lock()
+
+    async def aclose(self) -> None:
+        """Close every pooled client that belongs to the running event loop"""
+        with self._lock:
+            clients = self._loops.pop(asyncio.get_running_loop(), {})
+        await _aclose_all(clients)
+
+    def close(self) -> None:
+        """Close every pooled client on every loop that can still run. Clients on loops that have already been
+        closed are dropped, as their connections can no longer be shut down gracefully."""
+        with self._lock:
+            loops = list(self._loops.items())
+            self._loops.clear()
+
+        for loop, clients in loops:
+            if loop.is_closed() or not clients:
+                continue
+            coro = _aclose_all(clients)
+            if loop.is_running():
+                asyncio.run_coroutine_threadsafe(coro, loop).result(timeout=10)
+            else:
+                loop.run_until_complete(coro)
+
+
+async def _aclose_all(clients: dict[tuple, _PooledClient]) -> None:
+    await asyncio.gather(*(entry.client.aclose() for entry in clients.values()))
+
+
+client_pool = ClientPool()
+atexit.register(client_pool.close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=client_pool.reset)
@@ -0,0 +1,182 @@
+import asyncio
+import os
+import threading
+import time
+import weakref
+from typing import Optional
+
+import httpx
+
+from .resilience import parse_retry_after
+
+
+class RateLimiter:
+    """An async token-bucket rate limiter. Requests are let through at `rate` per second, with bursts of up to `burst`
+    requests after a quiet period, and at most `max_in_flight` requests are outstanding at once.
+
+    Requests are never rejected. Each request is given the next free slot in the order it arrives and waits for it,
+    so queued requests are scheduled first come, first served. Slots are shared by every event loop in the process,
+    while the in-flight limit applies to each event loop.
+
+    With `adaptive` set, the rate is lowered to match any `RateLimit-Remaining`/`RateLimit-Reset` (or `X-RateLimit-*`)
+    headers the service returns, and requests are paused for the duration of any Retry-After on a 429 response.
+
+    Args:
+        rate (float, optional): The number of requests per second. Will default to None (only limit the number of
+                                    requests in flight).
+        burst (int, optional): The number of requests that can be made at once after a quiet period. Will default to 1.
+        max_in_flight (int, optional): The maximum number of outstanding requests. Will default to None (no limit).
+        adaptive (bool, optional): Whether to adapt the rate to rate limit headers. Will default to False.
+    """
+
+    def __init__(
+        self,
+        rate: Optional[float] = None,
+        burst: int = 1,
+        max_in_flight: Optional[int] = None,
+        adaptive: bool = False,
+    ):
+        if (rate is not None and rate <= 0) or burst < 1:
+            raise ValueError("rate must be positive and burst must be at least 1")
+        self.rate = rate
+        self.max_rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.adaptive = adaptive
+        # The time the next request would be sent if the bucket were empty
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+        self._semaphores: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def _reserve(self) -> float:
+        """Reserve the next slot and return the number of seconds to wait for it"""
+        if self.rate is None:
+            return 0
+        with self._lock:
+            now = time.monotonic()
+            interval = 1 / self.rate
+            slot = max(self._next_slot, now)
+            self._next_slot = slot + interval
+            # The bucket lets `burst` requests through ahead of the steady rate
+            return max(slot - (self.burst - 1) * interval - now, 0)
+
+    def _semaphore(self) -> Optional[asyncio.Semaphore]:
+        if self.max_in_flight is None:
+            return None
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            if loop not in self._semaphores:
+                self._semaphores[loop] = asyncio.Semaphore(self.max_in_flight)
+            return self._semaphores[loop]
+
+    async def acquire(self) -> None:
+        """Wait until a request can be made"""
+        semaphore = self._semaphore()
+        if semaphore is not None:
+            await semaphore.acquire()
+        try:
+            delay = self._reserve()
+            if delay:
+                await asyncio.sleep(delay)
+        except BaseException:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+
+    def release(self) -> None:
+        """Mark a request as finished"""
+        semaphore = self._semaphore()
+        if semaphore is not None:
+            semaphore.release()
+
+    async def __aenter__(self) -> "RateLimiter":
+        await self.acquire()
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        self.release()
+
+    def update(self, response: httpx.Response) -> None:
+        """Adapt the rate to the rate limit headers of a response, if adaptive rate limiting is enabled"""
+        if not self.adaptive:
+            return
+
+        if response.status_code == 429:
+            retry_after = parse_retry_after(response)
+            if retry_after:
+                with self._lock:
+                    self._next_slot = max(self._next_slot, time.monotonic() + retry_after)
+
+        headers = response.headers
+        remaining = headers.get("RateLimit-Remaining", headers.get("X-RateLimit-Remaining"))
+        reset = headers.get("RateLimit-Reset", headers.get("X-RateLimit-Reset"))
+        try:
+            remaining, reset = float(remaining), float(reset)
+        except (TypeError, ValueError):
+            return
+        if reset <= 0 or self.max_rate is None:
+            return
+        with self._lock:
+            # Spread the remaining allowance over the rest of the window, but never exceed the configured rate
+            self.rate = min(self.max_rate, max(remaining / reset, self.max_rate / 100))
+
+
+_rate_limiters: dict[str, Optional[RateLimiter]] = {}
+_rate_limiters_lock = threading.Lock()
+
+
+def configure_rate_limit(
+    service: str,
+    rate: Optional[float] = None,
+    burst: int = 1,
+    max_in_flight: Optional[int] = None,
+    adaptive: bool = False,
+) -> RateLimiter:
+    """Configure the process-wide rate limiter for a service. Clients created afterwards will use it.
+
+    Args:
+        service (str): The service to limit.
+        rate (float, optional): The number of requests per second. Will default to None (only limit the number of
+                                    requests in flight).
+        burst (int, optional): The number of requests that can be made at once after a quiet period. Will default to 1.
+        max_in_flight (int, optional): The maximum number of outstanding requests. Will default to None (no limit).
+        adaptive (bool, optional): Whether to adapt the rate to rate limit headers. Will default to False.
+
+    Returns:
+        RateLimiter: The rate limiter for the service.
+    """
+    limiter = RateLimiter(rate, burst=burst, max_in_flight=max_in_flight, adaptive=adaptive)
+    with _rate_limiters_lock:
+        _rate_limiters[service.upper()] = limiter
+    return limiter
+
+
+def get_rate_limiter(service: str) -> Optional[RateLimiter]:
+    """Get the process-wide rate limiter for a service. If one has not been configured, it is created from the
+    {service}_RATE_LIMIT (requests per second), {service}_RATE_LIMIT_BURST, {service}_MAX_IN_FLIGHT and
+    {service}_RATE_LIMIT_ADAPTIVE environment variables.
+
+    Args:
+        service (str): The service to get the rate limiter for.
+
+    Returns:
+        Optional[RateLimiter]: The rate limiter for the service, or None if the service is not rate limited.
+    """
+    service = service.upper()
+    with _rate_limiters_lock:
+        if service not in _rate_limiters:
+            rate = os.getenv(f"{service}_RATE_LIMIT")
+            max_in_flight = os.getenv(f"{service}_MAX_IN_FLIGHT")
+            _rate_limiters[service] = (
+                RateLimiter(
+                    float(rate) if rate else None,
+                    burst=int(os.getenv(f"{service}_RATE_LIMIT_BURST", 1)),
+                    max_in_flight=int(max_in_flight) if max_in_flight else None,
+                    adaptive=os.getenv(f"{service}_RATE_LIMIT_ADAPTIVE", "").lower() in ("1", "true"),
+                )
+                if rate or max_in_flight
+                else None
+            )
+        return _rate_limiters[service]
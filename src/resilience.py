@@ -0,0 +1,160 @@
+import random
+import threading
+import time
+from dataclasses import dataclass
+from email.utils import parsedate_to_datetime
+from typing import Optional
+
+import httpx
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of making a request when the circuit breaker for a service is open."""
+
+    def __init__(self, name: str, retry_in: float):
+        self.name = name
+        self.retry_in = retry_in
+        super().__init__(f"Circuit breaker for {name} is open. Retry in {retry_in:.1f} seconds")
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Controls how failed requests are retried.
+
+    Requests that fail with a transport error or one of `retry_statuses` are retried with jittered exponential
+    backoff, as long as their method is idempotent. Requests that were never sent (connection errors) and requests
+    rejected with a 429 are safe to retry whatever their method.
+
+    Args:
+        max_retries (int, optional): The maximum number of times to retry a request. Will default to 3.
+        backoff_factor (float, optional): The base delay in seconds. The delay before retry `n` is a random value
+                                    between 0 and `backoff_factor * 2 ** n`. Will default to 0.5.
+        max_backoff (float, optional): The maximum delay in seconds between retries, including delays requested with
+                                    a Retry-After header. Will default to 30.
+        retry_statuses (frozenset[int], optional): The status codes to retry. Will default to 429, 502, 503 and 504.
+        retry_methods (frozenset[str], optional): The methods that are safe to retry. Will default to the idempotent
+                                    methods.
+    """
+
+    max_retries: int = 3
+    backoff_factor: float = 0.5
+    max_backoff: float = 30
+    retry_statuses: frozenset[int] = frozenset({429, 502, 503, 504})
+    retry_methods: frozenset[str] = frozenset({"GET", "HEAD", "OPTIONS", "PUT", "DELETE"})
+
+    def should_retry(self, method: str, attempt: int, error: Exception) -> bool:
+        """Whether a request that failed with `error` on the given attempt (starting from 0) should be retried"""
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(error, httpx.HTTPStatusError):
+            status = error.response.status_code
+            if status not in self.retry_statuses:
+                return False
+            return status == 429 or method.upper() in self.retry_methods
+        if isinstance(error, (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)):
+            return True
+        return isinstance(error, httpx.TransportError) and method.upper() in self.retry_methods
+
+    def delay(self, attempt: int, response: Optional[httpx.Response] = None) -> float:
+        """The number of seconds to wait before the next attempt, honouring any Retry-After header"""
+        retry_after = parse_retry_after(response) if response is not None else None
+        if retry_after is not None:
+            return min(retry_after, self.max_backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff_factor * 2**attempt))
+
+
+def parse_retry_after(response: httpx.Response) -> Optional[float]:
+    """Parse the Retry-After header of a response, which may be a number of seconds or an HTTP date"""
+    value = response.headers.get("Retry-After")
+    if not value:
+        return None
+    try:
+        return max(float(value), 0)
+    except ValueError:
+        pass
+    try:
+        return max(parsedate_to_datetime(value).timestamp() - time.time(), 0)
+    except (TypeError, ValueError):
+        return None
+
+
+class CircuitBreaker:
+    """A circuit breaker that stops requests to a service that keeps failing, so callers fail fast instead of piling
+    up timeouts.
+
+    After `failure_threshold` consecutive failures the circuit opens and requests raise `CircuitOpenError`. Once
+    `reset_timeout` seconds have passed a single trial request is let through. If it succeeds the circuit closes,
+    otherwise it opens again.
+
+    Args:
+        name (str): The name of the service, used in errors.
+        failure_threshold (int, optional): The number of consecutive failures that opens the circuit. Will default
+                                    to 5.
+        reset_timeout (float, optional): The number of seconds to wait before letting a trial request through. Will
+                                    default to 30.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half-open"
+
+    def __init__(self, name: str, failure_threshold: int = 5, reset_timeout: float = 30):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_request(self) -> None:
+        """Raise CircuitOpenError if the request should not be made"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return
+            now = time.monotonic()
+            retry_in = self.opened_at + self.reset_timeout - now
+            if retry_in <= 0:
+                # Let a trial request through. If it never reports back, another is allowed after reset_timeout
+                self.state = self.HALF_OPEN
+                self.opened_at = now
+                return
+            raise CircuitOpenError(self.name, max(retry_in, 0))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+_circuit_breakers: dict[str, CircuitBreaker] = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str) -> CircuitBreaker:
+    """Get the process-wide circuit breaker for a service, creating it if needed.
+
+    Args:
+        name (str): The name of the service.
+
+    Returns:
+        CircuitBreaker: The circuit breaker shared by every client for the service.
+    """
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name)
+        return _circuit_breakers[name]
+
+
+def is_failure(error: Exception) -> bool:
+    """Whether an error means the service is unhealthy and should count towards opening its circuit"""
+    if isinstance(error, httpx.HTTPStatusError):
+        return error.response.status_code >= 500
+    return isinstance(error, httpx.TransportError)
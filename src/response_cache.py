@@ -0,0 +1,150 @@
+import asyncio
+import hashlib
+import time
+import weakref
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Optional
+
+import httpx
+
+from .cache import InMemoryCache, as_async_cache
+
+if TYPE_CHECKING:
+    from .client import M2MClient
+
+
+# Headers that describe how the body was sent rather than the body itself. Cached bodies are stored decoded.
+_TRANSPORT_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection"})
+
+
+@dataclass
+class CachedResponse:
+    status_code: int
+    headers: list[tuple[str, str]]
+    content: bytes
+    etag: Optional[str]
+    expires_at: float
+
+    @classmethod
+    def from_response(cls, response: httpx.Response, ttl: float) -> "CachedResponse":
+        return cls(
+            status_code=response.status_code,
+            headers=[(k, v) for k, v in response.headers.items() if k.lower() not in _TRANSPORT_HEADERS],
+            content=response.content,
+            etag=response.headers.get("ETag"),
+            expires_at=time.time() + ttl,
+        )
+
+    @property
+    def is_fresh(self) -> bool:
+        return time.time() < self.expires_at
+
+    def to_response(self, request: httpx.Request, from_cache: bool = False) -> httpx.Response:
+        return httpx.Response(
+            self.status_code,
+            headers=self.headers,
+            content=self.content,
+            request=request,
+            extensions={"from_cache": from_cache},
+        )
+
+
+class ResponseCache:
+    """An HTTP response cache for GET requests made by an `M2MClient`.
+
+    Responses are cached for `ttl` seconds, or for the TTL given for their endpoint in `ttls`. Once an entry is stale
+    it is revalidated with `If-None-Match` if the service returned an `ETag`, so unchanged data is not downloaded again.
+    Identical GET requests that are in flight at the same time are coalesced into a single request. Responses with
+    `Cache-Control: no-store` are never cached.
+
+    Entries are scoped by the client id and audience of the client that made the request, so data cached for one set of
+    credentials is never returned to another.
+
+    Args:
+        cache (optional): The cache to store responses in. Either an `AsyncCache` or a synchronous cache, which will be
+                                    wrapped in an `AsyncCacheAdapter`. Will default to a new InMemoryCache.
+        ttl (float, optional): The number of seconds a response is fresh for. Will default to 60.
+        ttls (dict[str, float], optional): The number of seconds responses are fresh for, by endpoint path (the url
+                                    passed to the client, e.g. "file_types"). Will default to None.
+        stale_ttl (float, optional): The number of seconds stale entries are kept for revalidation. Will default to
+                                    3600.
+    """
+
+    def __init__(
+        self,
+        cache=None,
+        ttl: float = 60,
+        ttls: Optional[dict[str, float]] = None,
+        stale_ttl: float = 3600,
+    ):
+        self.cache = as_async_cache(cache if cache is not None else InMemoryCache())
+        self.ttl = ttl
+        self.ttls = {path.strip("/"): ttl for path, ttl in (ttls or {}).items()}
+        self.stale_ttl = stale_ttl
+        self._inflight: weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, dict[str, asyncio.Task]] = (
+            weakref.WeakKeyDictionary()
+        )
+
+    def ttl_for(self, url: str) -> float:
+        """The number of seconds a response from the endpoint is fresh for"""
+        return self.ttls.get(str(url).strip("/"), self.ttl)
+
+    @staticmethod
+    def key(client: "M2MClient", request: httpx.Request) -> str:
+        """The cache key for a request. Hashed so it is a valid memcached key whatever the URL."""
+        scope = f"{client.client_id}|{client.audience}|{request.url}"
+        return f"response:{hashlib.sha256(scope.encode()).hexdigest()}"
+
+    async def get(self, client: "M2MClient", url, **kwargs) -> httpx.Response:
+        """Make a GET request through the cache.
+
+        Args:
+            client (M2MClient): The client to make the request with.
+            url: The url to request.
+            **kwargs: Additional arguments for the request.
+
+        Returns:
+            httpx.Response: The response, either from the cache or the service.
+        """
+        request = client.build_request("GET", url, params=kwargs.get("params"))
+        key = self.key(client, request)
+
+        entry = await self.cache.get(key)
+        if entry is not None and entry.is_fresh:
+            return entry.to_response(request, from_cache=True)
+
+        loop = asyncio.get_running_loop()
+        inflight = self._inflight.setdefault(loop, {})
+        task = inflight.get(key)
+        if task is None:
+            task = inflight[key] = loop.create_task(self._fetch(client, url, key, entry, kwargs))
+            task.add_done_callback(lambda t: inflight.pop(key) if inflight.get(key) is t else None)
+
+        entry = await asyncio.shield(task)
+        return entry.to_response(request)
+
+    async def _fetch(
+        self,
+        client: "M2MClient",
+        url,
+        key: str,
+        entry: Optional[CachedResponse],
+        kwargs: dict,
+    ) -> CachedResponse:
+        """Fetch a response from the service, revalidating the stale entry if there is one"""
+        kwargs = dict(kwargs)
+        if entry is not None and entry.etag:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), "If-None-Match": entry.etag}
+
+        response = await client.send_request("GET", url, **kwargs)
+        ttl = self.ttl_for(url)
+        if response.status_code == 304 and entry is not None:
+            entry.expires_at = time.time() + ttl
+        else:
+            entry = CachedResponse.from_response(response, ttl)
+            if response.status_code != 200 or "no-store" in response.headers.get("Cache-Control", ""):
+                # Hand the response to every waiting caller, but do not keep it
+                return entry
+
+        await self.cache.set(key, entry, ttl + self.stale_ttl)
+        return entry
@@ -1,7 +1,92 @@
+from array import array
+import ast
+from collections.abc import Sequence
+from dataclasses import dataclass
 from datetime import datetime
+import functools
 import json
+import re
+from json.decoder import WHITESPACE, scanstring
+import typing
+from typing import Any, Callable, Generic, Iterator, TypeVar, Union
 
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, TypeAdapter, field_validator
+
+T = TypeVar("T")
+
+
+@functools.cache
+def type_adapter(type_: Any) -> TypeAdapter:
+    """Get a cached TypeAdapter for a type, so its validator is only built once"""
+    return TypeAdapter(type_)
+
+
+def decode(type_: type[T], content: Union[str, bytes], validate: bool = True) -> T:
+    """Decode a JSON response body into a schema.
+
+    With `validate` set, the body is validated straight from the raw JSON, without building intermediate dicts first.
+    Otherwise it is parsed with `json.loads` and the models are built without validation, which is faster but trusts
+    the service to send data matching the schema. Values are not converted, so dates are left as strings.
+
+    Args:
+        type_ (type): The schema to decode into, e.g. `PageOfOrganisations` or `list[Organisation]`.
+        content (str | bytes): The JSON response body.
+        validate (bool, optional): Whether to validate the body against the schema. Will default to True.
+
+    Returns:
+        The decoded schema.
+    """
+    if validate:
+        return type_adapter(type_).validate_json(content)
+    return _builder(type_)(json.loads(content))
+
+
+def _new_model(model: type[BaseModel], values: dict) -> BaseModel:
+    """Create a model instance from trusted values, as `model_construct` does without its per-call overhead"""
+    instance = model.__new__(model)
+    object.__setattr__(instance, "__dict__", values)
+    object.__setattr__(instance, "__pydantic_fields_set__", set(values))
+    object.__setattr__(instance, "__pydantic_extra__", None)
+    object.__setattr__(instance, "__pydantic_private__", None)
+    return instance
+
+
+@functools.cache
+def _builder(type_: Any) -> Callable[[Any], Any]:
+    """Build a function that creates a type from parsed JSON without validating it"""
+    if isinstance(type_, type) and issubclass(type_, BaseModel):
+        fields = [
+            (name, field.alias or name, _builder(field.annotation), field)
+            for name, field in type_.model_fields.items()
+        ]
+
+        names = type_.model_fields.keys()
+        flat = all(build is _identity and key == name for name, key, build, _ in fields)
+
+        def build_model(data: dict) -> BaseModel:
+            if flat and data.keys() == names:
+                # The parsed dict already holds exactly the fields, so it can be used as is
+                return _new_model(type_, data)
+            values = {}
+            for name, key, build, field in fields:
+                if key in data:
+                    value = data[key]
+                    values[name] = value if build is _identity or value is None else build(value)
+                elif not field.is_required():
+                    values[name] = field.get_default(call_default_factory=True)
+            return _new_model(type_, values)
+
+        return build_model
+
+    if typing.get_origin(type_) is list and typing.get_args(type_):
+        build_item = _builder(typing.get_args(type_)[0])
+        if build_item is not _identity:
+            return lambda data: [build_item(item) for item in data]
+    return _identity
+
+
+def _identity(value: Any) -> Any:
+    return value
 
 
 class FileType(BaseModel):
@@ -40,6 +125,35 @@ class SignedURL(BaseModel):
     signed_url: str
 
 
+class SignedPartURL(BaseModel):
+    part_number: int
+    signed_url: str
+
+
+class MultipartSignedURL(BaseModel):
+    upload_id: str
+    file_path: str
+    parts: list[SignedPartURL]
+
+
+class UploadedPart(BaseModel):
+    part_number: int
+    etag: str
+
+
+class FeedParams(BaseModel):
+    feed_identifier: str
+    feed_version: int
+
+
+class FileRecordParams(BaseModel):
+    feed_identifier: str
+    feed_version: int
+    file_location: str
+    file_meta: dict
+    organisation: str = "atheon"
+
+
 class FileRecord(BaseModel):
     feed_identifier: str
     feed_version: int
@@ -52,5 +166,242 @@ class FileRecord(BaseModel):
     @field_validator("file_meta", mode="before")
     def validate_file_meta(cls, v):
         if isinstance(v, str):
-            return json.loads(v.replace("'", '"'))
+            return parse_file_meta(v)
         return v
+
+
+def parse_file_meta(value: str) -> dict:
+    """Parse file metadata sent as a string. Most records hold JSON, which is parsed directly. Older records hold the
+    repr of a Python dict. Simple dicts are converted to JSON, and anything else is parsed with `ast.literal_eval`, so
+    quotes inside values and Python literals such as True and None are handled without evaluating any code.
+
+    Args:
+        value (str): The metadata, as JSON or a Python dict literal.
+
+    Raises:
+        ValueError: If the metadata is not a JSON object or a dict literal.
+
+    Returns:
+        dict: The parsed metadata.
+    """
+    try:
+        # A JSON object always contains double quotes, so without any this is a dict literal. repr only quotes strings
+        # with single quotes when none of them contain one, so swapping the quotes gives the equivalent JSON.
+        meta = json.loads(value if '"' in value else value.replace("'", '"'))
+    except json.JSONDecodeError:
+        # Dict literals with quotes in their values, or with Python literals like True and None
+        meta = _literal_eval(value)
+    if not isinstance(meta, dict):
+        raise ValueError("file_meta must be a JSON object or a Python dict literal")
+    return meta
+
+
+def _literal_eval(value: str) -> Any:
+    try:
+        return ast.literal_eval(value)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        raise ValueError("file_meta must be a JSON object or a Python dict literal") from None
+
+
+_decoder = json.JSONDecoder()
+
+
+def _skip_whitespace(text: str, index: int) -> int:
+    return WHITESPACE.match(text, index).end()
+
+
+_STRING = r'"[^"\\]*+(?:\\.[^"\\]*+)*+"'
+
+
+def _container_pattern(depth: int) -> str:
+    """A pattern matching an object or array nested at most `depth` deep, skipping over strings"""
+    inner = r'[^"{}\[\]]++|' + _STRING + ("|" + _container_pattern(depth - 1) if depth > 1 else "")
+    return r"[{\[](?:" + inner + r")*+[}\]]"
+
+
+# Most items are matched whole by one regex. Possessive quantifiers stop it backtracking on deeper nesting
+_CONTAINER = re.compile(_container_pattern(4), re.DOTALL)
+# The characters that open or close a nested value, or start a string
+_STRUCTURE = re.compile(r'["{}\[\]]')
+# The rest of a string after its opening quote, up to and including the closing quote
+_STRING_TAIL = re.compile(_STRING[1:], re.DOTALL)
+# A number, true, false or null
+_SCALAR = re.compile(r"[^\s,\]}]+")
+
+
+def _skip_string(text: str, index: int) -> int:
+    match = _STRING_TAIL.match(text, index + 1)
+    if match is None:
+        raise json.JSONDecodeError("Unterminated string", text, index)
+    return match.end()
+
+
+def _skip_value(text: str, index: int) -> int:
+    """Find where the JSON value starting at `index` ends without decoding it, by matching brackets outside strings.
+    The value itself is only checked when it is decoded."""
+    char = text[index]
+    if char == '"':
+        return _skip_string(text, index)
+    if char not in "{[":
+        match = _SCALAR.match(text, index)
+        if match is None:
+            raise json.JSONDecodeError("Expecting value", text, index)
+        return match.end()
+    match = _CONTAINER.match(text, index)
+    if match is not None:
+        return match.end()
+    # Nested too deep for the pattern, so match brackets one at a time
+    depth = 0
+    while True:
+        match = _STRUCTURE.search(text, index)
+        if match is None:
+            raise json.JSONDecodeError("Unterminated value", text, len(text))
+        index = match.start()
+        if text[index] == '"':
+            index = _skip_string(text, index)
+            continue
+        depth += 1 if text[index] in "{[" else -1
+        index += 1
+        if depth == 0:
+            return index
+
+
+class LazyItems(Sequence[T]):
+    """The items of a page, kept as the raw JSON of the page and decoded one at a time when they are accessed. Only the
+    start and end offset of each item is stored, so a page takes little more memory than its response body.
+
+    Items are decoded again each time they are accessed, so keep hold of any you need to use more than once.
+    """
+
+    __slots__ = ("_text", "_offsets", "_item_type", "_validate")
+
+    def __init__(self, text: str, offsets: array, item_type: Any = Any, validate: bool = True):
+        self._text = text
+        self._offsets = offsets
+        self._item_type = item_type
+        self._validate = validate
+
+    def __len__(self) -> int:
+        return len(self._offsets) // 2
+
+    def _decode(self, index: int) -> T:
+        return decode(self._item_type, self.raw(index), validate=self._validate)
+
+    def raw(self, index: int) -> str:
+        """Get the raw JSON of an item without decoding it"""
+        return self._text[self._offsets[2 * index]:self._offsets[2 * index + 1]]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._decode(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("page index out of range")
+        return self._decode(index)
+
+    def __iter__(self) -> Iterator[T]:
+        for index in range(len(self)):
+            yield self._decode(index)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, Sequence) and not isinstance(other, str):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"LazyItems({len(self)} items)"
+
+
+@dataclass(eq=False)
+class LazyPage(Generic[T]):
+    """A page whose items are only decoded when they are accessed. Has the same attributes as `PaginatedResponse`, so
+    it can be used anywhere a page can, e.g. with `Paginator` or `iter_all`."""
+
+    items: LazyItems[T]
+    page: int
+    pages: int
+    per_page: int
+
+    @property
+    def claims(self) -> LazyItems[T]:
+        return self.items
+
+    @classmethod
+    def decode(cls, content: Union[str, bytes], item_type: Any = Any, validate: bool = True) -> "LazyPage[T]":
+        """Decode the envelope of a page, finding where each item starts and ends without decoding any of them.
+
+        Args:
+            content (str | bytes): The JSON response body.
+            item_type (type, optional): The schema to decode each item into. Will default to Any (plain JSON).
+            validate (bool, optional): Whether to validate items against their schema when they are decoded. Will
+                                    default to True.
+
+        Returns:
+            LazyPage: The page.
+        """
+        text = content.decode() if isinstance(content, (bytes, bytearray)) else content
+        envelope, offsets = _scan_page(text)
+        build_envelope = type_adapter(_PageEnvelope).validate_python if validate else _builder(_PageEnvelope)
+        envelope = build_envelope(envelope)
+        return cls(
+            items=LazyItems(text, offsets, item_type=item_type, validate=validate),
+            page=envelope.page,
+            pages=envelope.pages,
+            per_page=envelope.per_page,
+        )
+
+
+class _PageEnvelope(BaseModel):
+    page: int
+    pages: int
+    per_page: int
+
+
+def _scan_page(text: str) -> tuple[dict, array]:
+    """Parse the fields of a page other than its items, and the offsets of each item"""
+    envelope = {}
+    offsets = array("Q")
+    try:
+        index = _skip_whitespace(text, 0)
+        if text[index] != "{":
+            raise json.JSONDecodeError("Expecting object", text, index)
+        index = _skip_whitespace(text, index + 1)
+        while text[index] != "}":
+            if text[index] != '"':
+                raise json.JSONDecodeError("Expecting property name enclosed in double quotes", text, index)
+            key, index = scanstring(text, index + 1)
+            index = _skip_whitespace(text, index)
+            if text[index] != ":":
+                raise json.JSONDecodeError("Expecting ':' delimiter", text, index)
+            index = _skip_whitespace(text, index + 1)
+            if key == "items" and text[index] == "[":
+                index = _scan_items(text, index, offsets)
+            else:
+                envelope[key], index = _decoder.raw_decode(text, index)
+            index = _skip_whitespace(text, index)
+            if text[index] == ",":
+                index = _skip_whitespace(text, index + 1)
+            elif text[index] != "}":
+                raise json.JSONDecodeError("Expecting ',' delimiter", text, index)
+    except IndexError:
+        raise json.JSONDecodeError("Unterminated page", text, len(text)) from None
+    return envelope, offsets
+
+
+def _scan_items(text: str, index: int, offsets: array) -> int:
+    """Record the offsets of each item in the array starting at `index`, returning the index after the array"""
+    index = _skip_whitespace(text, index + 1)
+    if text[index] == "]":
+        return index + 1
+    while True:
+        start = index
+        index = _skip_value(text, index)
+        offsets.append(start)
+        offsets.append(index)
+        index = _skip_whitespace(text, index)
+        if text[index] == "]":
+            return index + 1
+        if text[index] != ",":
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, index)
+        index = _skip_whitespace(text, index + 1)
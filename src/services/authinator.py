@@ -1,16 +1,21 @@
-from ..client import M2MClient
-from ..utilities import inject_client
-from ..schema import PageOfOrganisations, PageOfClaims
+from ..schema import PageOfClaims, PageOfOrganisations
+from .registry import Endpoint, register
 from .service import Service
 
 
-@inject_client(service=Service.AUTHINATOR)
-async def get_organisations(client: M2MClient, **kwargs) -> PageOfOrganisations:
-    resp = await client.get("organisations", params=kwargs)
-    return PageOfOrganisations(**resp.json())
+get_organisations = register(
+    Endpoint(
+        Service.AUTHINATOR,
+        "get_organisations",
+        "GET",
+        "organisations",
+        response_model=PageOfOrganisations,
+        paginated=True,
+    ),
+    __name__,
+)
 
-
-@inject_client(service=Service.AUTHINATOR)
-async def get_claims(client: M2MClient, **kwargs) -> PageOfClaims:
-    resp = await client.get("claims", params=kwargs)
-    return PageOfClaims(**resp.json())
+get_claims = register(
+    Endpoint(Service.AUTHINATOR, "get_claims", "GET", "claims", response_model=PageOfClaims, paginated=True),
+    __name__,
+)
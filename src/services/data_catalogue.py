@@ -1,55 +1,210 @@
-from typing import IO, AnyStr
+import asyncio
+import base64
+import hashlib
+import json
+import logging
+import math
+import os
+import time
+from contextlib import nullcontext
+from dataclasses import dataclass, field
+from typing import IO, AnyStr, AsyncIterable, Iterable, Iterator, Mapping, Optional, Union
 
 import httpx
 
 from ..client import M2MClient
+from ..pool import client_pool
+from ..resilience import RetryPolicy
+from ..uploads import DEFAULT_CHUNK_SIZE, MultipartFileStream, PartReader, ProgressCallback
 from ..utilities import inject_client
-from ..schema import FileType, SignedURL, FileRecord
+from ..schema import (
+    decode,
+    FeedParams,
+    FileType,
+    SignedURL,
+    FileRecord,
+    FileRecordParams,
+    MultipartSignedURL,
+    UploadedPart,
+)
+from .registry import Endpoint, register
 from .service import Service
 
 
-@inject_client(service=Service.DATA_CATALOGUE)
-async def get_file_type(
-    client: M2MClient, feed_identifier: str, feed_version: int
-) -> FileType:
-    resp = await client.get(
-        "file_types",
-        params={"feed_identifier": feed_identifier, "feed_version": feed_version},
-    )
-    return FileType(**resp.json())
+logger = logging.getLogger(__name__)
 
 
-@inject_client(service=Service.DATA_CATALOGUE)
-async def get_signed_url(
-    client: M2MClient, feed_identifier: str, feed_version: int
-) -> SignedURL:
-    resp = await client.post(
+get_file_type = register(
+    Endpoint(
+        Service.DATA_CATALOGUE, "get_file_type", "GET", "file_types", params_model=FeedParams, response_model=FileType
+    ),
+    __name__,
+)
+
+get_signed_url = register(
+    Endpoint(
+        Service.DATA_CATALOGUE,
+        "get_signed_url",
+        "POST",
         "signed_url/",
-        json={"feed_identifier": feed_identifier, "feed_version": feed_version},
-    )
-    return SignedURL(**resp.json())
+        params_model=FeedParams,
+        response_model=SignedURL,
+    ),
+    __name__,
+)
+
+post_file_record = register(
+    Endpoint(
+        Service.DATA_CATALOGUE,
+        "post_file_record",
+        "POST",
+        "records",
+        params_model=FileRecordParams,
+        response_model=FileRecord,
+    ),
+    __name__,
+)
+
+
+# The number of seconds to post records one at a time after finding a data catalogue has no batch route, before
+# trying the batch route again
+NO_BATCH_ROUTE_TTL = 300
+
+# Base urls of data catalogues that have no batch route, so later calls go straight to single posts, mapped to when
+# to try the batch route again
+_no_batch_route: dict[str, float] = {}
+
+
+def _has_batch_route(base_url: str) -> bool:
+    expires = _no_batch_route.get(base_url)
+    if expires is not None and time.monotonic() >= expires:
+        _no_batch_route.pop(base_url, None)
+        expires = None
+    return expires is None
+
+
+def reset_batch_routes() -> None:
+    """Forget which data catalogues have no batch route, so the next call to `post_file_records` tries it again, e.g.
+    after the data catalogue has been upgraded. This is called in a child process after a fork."""
+    _no_batch_route.clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=reset_batch_routes)
+
+
+def _batches(records: list[bytes], max_batch_size: int, max_batch_bytes: int) -> Iterator[tuple[int, list[bytes]]]:
+    """Split encoded records into batches of at most `max_batch_size` records and roughly `max_batch_bytes` bytes,
+    yielding the index of the first record in each batch along with the batch"""
+    start, batch, size = 0, [], 0
+    for index, record in enumerate(records):
+        if batch and (len(batch) >= max_batch_size or size + len(record) > max_batch_bytes):
+            yield start, batch
+            start, batch, size = index, [], 0
+        batch.append(record)
+        size += len(record) + 1
+    if batch:
+        yield start, batch
+
+
+async def _run_workers(jobs: Iterable[tuple], fn, concurrency: int) -> None:
+    """Run `fn` on every job with at most `concurrency` running at once, raising the first error"""
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    jobs = iter(jobs)
+
+    async def worker() -> None:
+        for job in jobs:
+            await fn(*job)
+
+    try:
+        async with asyncio.TaskGroup() as group:
+            for _ in range(concurrency):
+                group.create_task(worker())
+    except ExceptionGroup as error:
+        raise error.exceptions[0] from None
+
+
+class FileRecordsError(Exception):
+    """Raised when some of the records given to `post_file_records` could not be created. The records that were
+    created are kept in `results`, in the same order as the input, with None for each record that was not."""
+
+    def __init__(self, results: list[Optional[FileRecord]], error: Exception):
+        self.results = results
+        self.error = error
+        created = sum(result is not None for result in results)
+        super().__init__(f"Created {created} of {len(results)} records before failing: {error!r}")
 
 
 @inject_client(service=Service.DATA_CATALOGUE)
-async def post_file_record(
+async def post_file_records(
     client: M2MClient,
-    feed_identifier: str,
-    feed_version: int,
-    file_location: str,
-    file_meta: dict,
-    organisation: str = "atheon",
-) -> FileRecord:
-    resp = await client.post(
-        "records",
-        json={
-            "feed_identifier": feed_identifier,
-            "feed_version": feed_version,
-            "file_location": file_location,
-            "organisation": organisation,
-            "file_meta": file_meta,
-        },
-    )
-    return FileRecord(**resp.json())
+    records: Iterable[Mapping],
+    max_batch_size: int = 500,
+    max_batch_bytes: int = 1024 * 1024,
+    concurrency: int = 4,
+) -> list[FileRecord]:
+    """Catalogue many files at once. Records are sent to the `records/batch` route in batches bounded by both number
+    of records and size. If the data catalogue has no batch route, each record is posted on its own instead, and
+    later calls skip the batch route for `NO_BATCH_ROUTE_TTL` seconds.
+
+    Args:
+        client (M2MClient): The client to use to make the requests.
+        records (Iterable[Mapping]): The records to post. Each has the same keys as the arguments of `post_file_record`.
+        max_batch_size (int, optional): The maximum number of records in a batch. Will default to 500.
+        max_batch_bytes (int, optional): The maximum size in bytes of a batch, unless a single record is larger. Will
+                                    default to 1 MiB.
+        concurrency (int, optional): The maximum number of requests to make at once. Will default to 4.
+
+    Raises:
+        ValueError: If `concurrency` is less than 1.
+        FileRecordsError: If a request fails. No further requests are started, and the records already created are
+                                    attached to the error, so only the missing ones need to be posted again.
+
+    Returns:
+        list[FileRecord]: The created records, in the same order as `records`.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    payloads = [{"organisation": "atheon", **record} for record in records]
+    results: list[Optional[FileRecord]] = [None] * len(payloads)
+
+    async def post_batch(start: int, batch: list[bytes]) -> None:
+        resp = await client.post(
+            "records/batch",
+            content=b'{"records":[' + b",".join(batch) + b"]}",
+            headers={"Content-Type": "application/json"},
+        )
+        created = decode(list[FileRecord], resp.content, validate=client.validate_responses)
+        if len(created) != len(batch):
+            raise ValueError(f"Expected {len(batch)} records from the batch route, got {len(created)}")
+        results[start:start + len(batch)] = created
+
+    async def post_single(index: int, payload: dict) -> None:
+        results[index] = await post_file_record(client=client, **payload)
+
+    async def post_all() -> None:
+        if payloads and _has_batch_route(str(client.base_url)):
+            batches = _batches([json.dumps(payload).encode() for payload in payloads], max_batch_size, max_batch_bytes)
+            first = next(batches)
+            try:
+                await post_batch(*first)
+            except httpx.HTTPStatusError as error:
+                if error.response.status_code not in (404, 405):
+                    raise
+                logger.info("No batch route at %s, posting records one at a time", client.base_url)
+                _no_batch_route[str(client.base_url)] = time.monotonic() + NO_BATCH_ROUTE_TTL
+            else:
+                await _run_workers(batches, post_batch, concurrency)
+                return
+
+        await _run_workers(enumerate(payloads), post_single, concurrency)
+
+    try:
+        await post_all()
+    except Exception as error:
+        raise FileRecordsError(results, error) from error
+    return results
 
 
 @inject_client(service=Service.DATA_CATALOGUE)
@@ -59,11 +214,12 @@ async def upload_and_catalogue_file(
     feed_identifier: str,
     feed_version: int,
     file_meta: dict,
+    progress: Optional[ProgressCallback] = None,
 ) -> FileRecord:
     signed_url = await get_signed_url(
         client=client, feed_identifier=feed_identifier, feed_version=feed_version
     )
-    await upload_using_signed_url(file, signed_url)
+    await upload_using_signed_url(file, signed_url, progress=progress)
     return await post_file_record(
         client=client,
         feed_identifier=feed_identifier,
@@ -73,11 +229,375 @@ async def upload_and_catalogue_file(
     )
 
 
-async def upload_using_signed_url(file: IO[AnyStr], signed_url: SignedURL) -> None:
-    files = {"file": (signed_url.fields["key"], file)}
-    async with httpx.AsyncClient() as client:
-        http_response = await client.post(
-            signed_url.signed_url, data=signed_url.fields, files=files
+async def upload_using_signed_url(
+    file: IO[AnyStr],
+    signed_url: SignedURL,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    progress: Optional[ProgressCallback] = None,
+    upload_client: Optional[httpx.AsyncClient] = None,
+) -> int:
+    """Upload a file to a signed url. The file is streamed in chunks of `chunk_size` bytes, so memory use stays flat
+    whatever the size of the file.
+
+    Args:
+        file (IO[AnyStr]): The file to upload.
+        signed_url (SignedURL): The signed url to upload the file to.
+        chunk_size (int, optional): The number of bytes to read from the file at a time. Will default to 1 MiB.
+        progress (Callable[[int, Optional[int]], None], optional): Called with the number of bytes sent so far and the
+                                    total number of bytes, if known. Will default to None.
+        upload_client (httpx.AsyncClient, optional): The client to upload with. Will default to the pooled upload
+                                    client.
+
+    Returns:
+        int: The number of bytes sent.
+    """
+    body = MultipartFileStream(
+        signed_url.fields, file, signed_url.fields["key"], chunk_size=chunk_size, progress=progress
+    )
+    async with nullcontext(upload_client) if upload_client else client_pool.borrow_upload_client() as client:
+        http_response = await client.post(signed_url.signed_url, content=body, headers=body.headers)
+    http_response.raise_for_status()
+    logger.debug("Uploaded %d bytes to %s", body.bytes_sent, signed_url.file_path)
+    return body.bytes_sent
+
+
+FileInput = Union[IO[AnyStr], str, os.PathLike]
+
+
+@dataclass
+class CatalogueResult:
+    """The outcome of cataloguing one file with `upload_and_catalogue_files`."""
+
+    index: int
+    file: FileInput
+    feed_identifier: str
+    feed_version: int
+    file_meta: dict
+    signed_url: Optional[SignedURL] = None
+    record: Optional[FileRecord] = None
+    error: Optional[Exception] = None
+
+    @property
+    def ok(self) -> bool:
+        return self.record is not None
+
+
+async def _upload(result: CatalogueResult) -> None:
+    """Upload a file to its signed url, opening and closing it if a path was given"""
+    if isinstance(result.file, (str, os.PathLike)):
+        with open(result.file, "rb") as file:
+            await upload_using_signed_url(file, result.signed_url)
+    else:
+        await upload_using_signed_url(result.file, result.signed_url)
+
+
+@inject_client(service=Service.DATA_CATALOGUE)
+async def upload_and_catalogue_files(
+    client: M2MClient,
+    files: Union[Iterable[tuple], AsyncIterable[tuple]],
+    signed_url_concurrency: int = 10,
+    upload_concurrency: int = 4,
+    record_concurrency: int = 10,
+) -> list[CatalogueResult]:
+    """Upload and catalogue many files. The signed url, upload and record stages run as a pipeline, so signed urls for
+    later files are fetched while earlier files upload, and each stage has its own concurrency limit. A file that fails
+    at any stage is reported in its result and does not stop the rest of the batch.
+
+    Args:
+        client (M2MClient): The client to use to make the requests.
+        files (Iterable[tuple] | AsyncIterable[tuple]): `(file, feed_identifier, feed_version, file_meta)` tuples. The
+                                    file may be a file object or a path, which is opened when it is uploaded.
+        signed_url_concurrency (int, optional): The maximum number of signed urls to request at once. Will default
+                                    to 10.
+        upload_concurrency (int, optional): The maximum number of files to upload at once. Will default to 4.
+        record_concurrency (int, optional): The maximum number of file records to post at once. Will default to 10.
+
+    Raises:
+        ValueError: If any of the concurrency limits is less than 1.
+
+    Returns:
+        list[CatalogueResult]: The result for each file, in input order.
+    """
+    concurrencies = {
+        "signed_url_concurrency": signed_url_concurrency,
+        "upload_concurrency": upload_concurrency,
+        "record_concurrency": record_concurrency,
+    }
+    for name, concurrency in concurrencies.items():
+        # A limit of 0 would make an unbounded queue with no workers to empty it
+        if concurrency < 1:
+            raise ValueError(f"{name} must be at least 1, got {concurrency}")
+    results: list[CatalogueResult] = []
+    # Bounded queues apply backpressure, so a slow stage stops earlier stages from running too far ahead
+    to_sign: asyncio.Queue = asyncio.Queue(signed_url_concurrency)
+    to_upload: asyncio.Queue = asyncio.Queue(upload_concurrency)
+    to_record: asyncio.Queue = asyncio.Queue(record_concurrency)
+
+    async def feed() -> None:
+        async def add(item: tuple) -> None:
+            result = CatalogueResult(len(results), *item)
+            results.append(result)
+            await to_sign.put(result)
+
+        if isinstance(files, AsyncIterable):
+            async for item in files:
+                await add(item)
+        else:
+            for item in files:
+                await add(item)
+
+    async def sign(result: CatalogueResult) -> None:
+        result.signed_url = await get_signed_url(
+            client=client, feed_identifier=result.feed_identifier, feed_version=result.feed_version
+        )
+
+    async def record(result: CatalogueResult) -> None:
+        result.record = await post_file_record(
+            client=client,
+            feed_identifier=result.feed_identifier,
+            feed_version=result.feed_version,
+            file_location=result.signed_url.file_path,
+            file_meta=result.file_meta,
+        )
+
+    async def run_stage(stage, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue]) -> None:
+        while (result := await inbox.get()) is not None:
+            try:
+                await stage(result)
+            except Exception as error:
+                logger.warning("Failed to catalogue file %s: %r", result.index, error)
+                result.error = error
+                continue
+            if outbox is not None:
+                await outbox.put(result)
+
+    async def run_stages(
+        stage, workers: int, inbox: asyncio.Queue, outbox: Optional[asyncio.Queue], next_workers: int = 0
+    ) -> None:
+        await asyncio.gather(*(run_stage(stage, inbox, outbox) for _ in range(workers)))
+        # Tell each worker of the next stage that there is nothing more to come
+        for _ in range(next_workers):
+            await outbox.put(None)
+
+    async def run_feed() -> None:
+        await feed()
+        for _ in range(signed_url_concurrency):
+            await to_sign.put(None)
+
+    async with asyncio.TaskGroup() as group:
+        group.create_task(run_feed())
+        group.create_task(run_stages(sign, signed_url_concurrency, to_sign, to_upload, upload_concurrency))
+        group.create_task(run_stages(_upload, upload_concurrency, to_upload, to_record, record_concurrency))
+        group.create_task(run_stages(record, record_concurrency, to_record, None))
+    return results
+
+
+DEFAULT_PART_SIZE = 16 * 1024 * 1024
+
+# Parts are idempotent PUTs, so server errors are safe to retry. A 400, such as an expired signature or a checksum
+# mismatch, is not retried, as sending the same request again would fail the same way
+PART_RETRY_POLICY = RetryPolicy(retry_statuses=frozenset({408, 429, 500, 502, 503, 504}))
+
+
+@dataclass
+class MultipartUpload:
+    """The state of a multipart upload. If an upload fails part way through, pass this back as `resume` to upload only
+    the parts that are missing."""
+
+    signed_url: MultipartSignedURL
+    part_size: int
+    completed: dict[int, UploadedPart] = field(default_factory=dict)
+
+
+class MultipartUploadError(Exception):
+    """Raised when parts of a multipart upload still fail after being retried."""
+
+    def __init__(self, upload: MultipartUpload, errors: dict[int, Exception]):
+        self.upload = upload
+        self.errors = errors
+        super().__init__(f"{len(errors)} parts of upload {upload.signed_url.upload_id} failed: {sorted(errors)}")
+
+
+@inject_client(service=Service.DATA_CATALOGUE)
+async def get_multipart_signed_url(
+    client: M2MClient, feed_identifier: str, feed_version: int, part_count: int
+) -> MultipartSignedURL:
+    resp = await client.post(
+        "signed_url/multipart/",
+        json={"feed_identifier": feed_identifier, "feed_version": feed_version, "part_count": part_count},
+    )
+    return decode(MultipartSignedURL, resp.content, validate=client.validate_responses)
+
+
+@inject_client(service=Service.DATA_CATALOGUE)
+async def complete_multipart_upload(
+    client: M2MClient, signed_url: MultipartSignedURL, parts: list[UploadedPart]
+) -> None:
+    await client.post(
+        "signed_url/multipart/complete",
+        json={
+            "upload_id": signed_url.upload_id,
+            "file_path": signed_url.file_path,
+            "parts": [part.model_dump() for part in sorted(parts, key=lambda part: part.part_number)],
+        },
+    )
+
+
+async def upload_parts(
+    file: IO[bytes],
+    upload: MultipartUpload,
+    concurrency: int = 4,
+    retry_policy: Optional[RetryPolicy] = None,
+    progress: Optional[ProgressCallback] = None,
+    upload_client: Optional[httpx.AsyncClient] = None,
+) -> list[UploadedPart]:
+    """Upload the parts of a file that are not yet in `upload.completed` to their signed urls. Each part is sent with
+    a Content-MD5 checksum, and failed parts are retried according to the retry policy.
+
+    Args:
+        file (IO[bytes]): The file to upload, opened in binary mode.
+        upload (MultipartUpload): The upload to send parts for. Completed parts are added to it as they finish.
+        concurrency (int, optional): The maximum number of parts to upload at once. Will default to 4.
+        retry_policy (RetryPolicy, optional): How to retry failed parts. Will default to `PART_RETRY_POLICY`.
+        progress (Callable[[int, Optional[int]], None], optional): Called with the number of bytes uploaded so far and
+                                    the size of the file. Will default to None.
+        upload_client (httpx.AsyncClient, optional): The client to upload with. Will default to the pooled upload
+                                    client.
+
+    Raises:
+        ValueError: If `concurrency` is less than 1.
+        MultipartUploadError: If any part still fails after being retried. The upload can be resumed with the state
+                                    attached to the error.
+
+    Returns:
+        list[UploadedPart]: Every completed part of the upload.
+    """
+    if concurrency < 1:
+        raise ValueError(f"concurrency must be at least 1, got {concurrency}")
+    reader = PartReader(file)
+    retry_policy = retry_policy or PART_RETRY_POLICY
+    semaphore = asyncio.Semaphore(concurrency)
+    uploaded = sum(min(upload.part_size, reader.size - (n - 1) * upload.part_size) for n in upload.completed)
+    errors: dict[int, Exception] = {}
+
+    async def upload_part(part_number: int, signed_url: str) -> None:
+        nonlocal uploaded
+        offset = (part_number - 1) * upload.part_size
+        async with semaphore:
+            content = await reader.read(offset, min(upload.part_size, reader.size - offset))
+            checksum = base64.b64encode(hashlib.md5(content, usedforsecurity=False).digest()).decode()
+            attempt = 0
+            while True:
+                try:
+                    response = await client.put(signed_url, content=content, headers={"Content-MD5": checksum})
+                    response.raise_for_status()
+                    break
+                except (httpx.HTTPStatusError, httpx.TransportError) as error:
+                    if not retry_policy.should_retry("PUT", attempt, error):
+                        errors[part_number] = error
+                        return
+                    await asyncio.sleep(retry_policy.delay(attempt, getattr(error, "response", None)))
+                    attempt += 1
+
+        upload.completed[part_number] = UploadedPart(
+            part_number=part_number, etag=response.headers.get("ETag", "").strip('"')
+        )
+        uploaded += len(content)
+        if progress:
+            progress(uploaded, reader.size)
+
+    # Any other error cancels the remaining parts before the client is returned
+    async with nullcontext(upload_client) if upload_client else client_pool.borrow_upload_client() as client:
+        try:
+            async with asyncio.TaskGroup() as group:
+                for part in upload.signed_url.parts:
+                    if part.part_number not in upload.completed:
+                        group.create_task(upload_part(part.part_number, part.signed_url))
+        except ExceptionGroup as error:
+            raise error.exceptions[0] from None
+    if errors:
+        raise MultipartUploadError(upload, errors)
+    return list(upload.completed.values())
+
+
+@inject_client(service=Service.DATA_CATALOGUE)
+async def upload_and_catalogue_large_file(
+    client: M2MClient,
+    file: FileInput,
+    feed_identifier: str,
+    feed_version: int,
+    file_meta: dict,
+    part_size: int = DEFAULT_PART_SIZE,
+    concurrency: int = 4,
+    resume: Optional[MultipartUpload] = None,
+    retry_policy: Optional[RetryPolicy] = None,
+    progress: Optional[ProgressCallback] = None,
+    upload_client: Optional[httpx.AsyncClient] = None,
+) -> FileRecord:
+    """Upload a large file in parts over parallel requests and catalogue it. Parts are checksummed and failed parts are
+    retried. If parts still fail, a `MultipartUploadError` is raised, and its `upload` can be passed back as `resume`
+    to upload only the missing parts.
+
+    Args:
+        client (M2MClient): The client to use to make the requests.
+        file (IO[bytes] | str | os.PathLike): The file to upload, opened in binary mode, or its path.
+        feed_identifier (str): The feed identifier of the file.
+        feed_version (int): The feed version of the file.
+        file_meta (dict): The metadata to catalogue the file with.
+        part_size (int, optional): The size of each part in bytes. Will default to 16 MiB.
+        concurrency (int, optional): The maximum number of parts to upload at once. Will default to 4.
+        resume (MultipartUpload, optional): The state of an earlier upload of the same file to resume. Will default
+                                    to None.
+        retry_policy (RetryPolicy, optional): How to retry failed parts. Will default to `PART_RETRY_POLICY`.
+        progress (Callable[[int, Optional[int]], None], optional): Called with the number of bytes uploaded so far and
+                                    the size of the file. Will default to None.
+        upload_client (httpx.AsyncClient, optional): The client to upload the parts with. Will default to the pooled
+                                    upload client.
+
+    Raises:
+        ValueError: If `concurrency` is less than 1.
+        MultipartUploadError: If any part still fails after being retried.
+
+    Returns:
+        FileRecord: The record of the catalogued file.
+    """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, "rb") as opened:
+            return await upload_and_catalogue_large_file(
+                client=client,
+                file=opened,
+                feed_identifier=feed_identifier,
+                feed_version=feed_version,
+                file_meta=file_meta,
+                part_size=part_size,
+                concurrency=concurrency,
+                resume=resume,
+                retry_policy=retry_policy,
+                progress=progress,
+                upload_client=upload_client,
+            )
+
+    upload = resume
+    if upload is None:
+        part_count = max(math.ceil(PartReader(file).size / part_size), 1)
+        signed_url = await get_multipart_signed_url(
+            client=client, feed_identifier=feed_identifier, feed_version=feed_version, part_count=part_count
         )
-        http_response.raise_for_status()
-        print("File uploaded successfully")
+        upload = MultipartUpload(signed_url=signed_url, part_size=part_size)
+
+    parts = await upload_parts(
+        file,
+        upload,
+        concurrency=concurrency,
+        retry_policy=retry_policy,
+        progress=progress,
+        upload_client=upload_client,
+    )
+    await complete_multipart_upload(client=client, signed_url=upload.signed_url, parts=parts)
+    return await post_file_record(
+        client=client,
+        feed_identifier=feed_identifier,
+        feed_version=feed_version,
+        file_location=upload.signed_url.file_path,
+        file_meta=file_meta,
+    )
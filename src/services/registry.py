@@ -0,0 +1,127 @@
+import inspect
+import typing
+from dataclasses import dataclass
+from typing import Any, Callable, Coroutine, Optional
+
+from pydantic import BaseModel
+
+from ..client import M2MClient
+from ..pool import client_pool
+from ..schema import LazyPage, decode, type_adapter
+from .service import Service
+
+
+@dataclass(frozen=True)
+class Endpoint:
+    """A service endpoint, from which a call function is generated with `register`.
+
+    Args:
+        service (Service): The service the endpoint belongs to.
+        name (str): The name of the generated function, e.g. "get_file_type".
+        method (str): The HTTP method.
+        path (str): The path relative to the service's base url.
+        params_model (type[BaseModel], optional): The keyword arguments the function takes. They are sent as query
+                                    parameters for GET and DELETE requests and as a JSON body otherwise. Will default to
+                                    None (any keyword arguments are sent as they are).
+        response_model (Any): The schema the response body is decoded into.
+        paginated (bool, optional): Whether the response is a page, in which case the function also takes `lazy` to
+                                    decode the page into a `LazyPage`. Will default to False.
+    """
+
+    service: Service
+    name: str
+    method: str
+    path: str
+    params_model: Optional[type[BaseModel]] = None
+    response_model: Any = None
+    paginated: bool = False
+
+    @property
+    def item_type(self) -> Any:
+        """The type of the items of a paginated response, or Any if they are not typed"""
+        args = typing.get_args(self.response_model.model_fields["items"].annotation)
+        return args[0] if args else Any
+
+
+# Every registered endpoint, by service and name
+registry: dict[Service, dict[str, Endpoint]] = {}
+
+
+def _signature(endpoint: Endpoint) -> inspect.Signature:
+    keyword = inspect.Parameter.KEYWORD_ONLY
+    parameters = [inspect.Parameter("client", keyword, default=None, annotation=Optional[M2MClient])]
+    if endpoint.paginated:
+        parameters.append(inspect.Parameter("lazy", keyword, default=False, annotation=bool))
+    if endpoint.params_model is None:
+        parameters.append(inspect.Parameter("kwargs", inspect.Parameter.VAR_KEYWORD))
+    else:
+        for name, field in endpoint.params_model.model_fields.items():
+            default = inspect.Parameter.empty if field.is_required() else field.get_default()
+            parameters.append(inspect.Parameter(name, keyword, default=default, annotation=field.annotation))
+    return inspect.Signature(parameters, return_annotation=endpoint.response_model)
+
+
+def register(endpoint: Endpoint, module: str) -> Callable[..., Coroutine[Any, Any, Any]]:
+    """Register an endpoint and generate its call function. Everything that does not change between calls, such as
+    the arguments the function takes, the defaults of optional arguments and the response validator, is worked out
+    here once, and the url is resolved once per client.
+
+    The generated function takes keyword arguments only. As with `inject_client`, calls that are not given a `client`
+    borrow one from the process-wide `client_pool`.
+
+    Args:
+        endpoint (Endpoint): The endpoint.
+        module (str): The module the function is exported from, usually `__name__`.
+
+    Returns:
+        Callable[..., Coroutine]: The async call function.
+    """
+    service = str(endpoint.service)
+    method = endpoint.method.upper()
+    path = endpoint.path
+    response_model = endpoint.response_model
+    as_query = method in ("GET", "DELETE")
+    paginated = endpoint.paginated
+    item_type = endpoint.item_type if paginated else None
+    # Build the validators now rather than on the first call
+    type_adapter(response_model)
+
+    fields = required = defaults = None
+    if endpoint.params_model is not None:
+        model_fields = endpoint.params_model.model_fields
+        fields = frozenset(model_fields)
+        required = frozenset(name for name, field in model_fields.items() if field.is_required())
+        defaults = {name: field.get_default() for name, field in model_fields.items() if not field.is_required()}
+
+    async def call(*, client: Optional[M2MClient] = None, **kwargs) -> Any:
+        lazy = kwargs.pop("lazy", False) if paginated else False
+        if fields is not None:
+            if unexpected := kwargs.keys() - fields:
+                raise TypeError(f"{endpoint.name}() got unexpected keyword arguments: {', '.join(sorted(unexpected))}")
+            if missing := required - kwargs.keys():
+                raise TypeError(f"{endpoint.name}() missing required keyword arguments: {', '.join(sorted(missing))}")
+            if defaults:
+                kwargs = {**defaults, **kwargs}
+        if client is not None:
+            return await send(client, lazy, kwargs)
+        async with client_pool.borrow(service) as client:
+            return await send(client, lazy, kwargs)
+
+    async def send(client: M2MClient, lazy: bool, kwargs: dict) -> Any:
+        # Response cache TTLs are configured by path, so cached clients are given the path rather than the full url
+        url = path if client.response_cache else client.url_for(path)
+        if as_query:
+            resp = await client.request(method, url, params=kwargs)
+        else:
+            resp = await client.request(method, url, json=kwargs)
+        if lazy:
+            return LazyPage.decode(resp.content, item_type, validate=client.validate_responses)
+        return decode(response_model, resp.content, validate=client.validate_responses)
+
+    call.__name__ = call.__qualname__ = endpoint.name
+    call.__module__ = module
+    call.__doc__ = f"{method} {path} on the {service} service"
+    call.__signature__ = _signature(endpoint)
+    call.endpoint = endpoint
+    registry.setdefault(endpoint.service, {})[endpoint.name] = endpoint
+    return call
@@ -6,3 +6,10 @@ class Service(StrEnum):
 
     DATA_CATALOGUE = "data-catalogue"
     AUTHINATOR = "authinator"
+
+    @property
+    def endpoints(self) -> dict:
+        """The endpoints registered for the service, by name"""
+        from .registry import registry
+
+        return registry.get(self, {})
@@ -0,0 +1,117 @@
+import logging
+import os
+from dataclasses import dataclass
+from typing import Optional
+
+import httpx
+
+
+logger = logging.getLogger(__name__)
+
+
+def _optional_float(value: str) -> Optional[float]:
+    return None if value.lower() == "none" else float(value)
+
+
+def _optional_int(value: str) -> Optional[int]:
+    return None if value.lower() == "none" else int(value)
+
+
+def http2_available() -> bool:
+    """Whether the `h2` package needed for HTTP/2 is installed"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+@dataclass(frozen=True)
+class TransportConfig:
+    """Connection settings for an `M2MClient`. The defaults match the settings clients had before this was
+    configurable: HTTP/1.1, httpx's default pool limits and a 30 second timeout.
+
+    Size `max_connections` and `max_keepalive_connections` to the number of requests made at once, e.g. the
+    `max_concurrency` of `fetch_all`, so requests do not queue for a connection or reconnect after every request. With
+    `http2` set, many requests are multiplexed over a single connection to each host. HTTP/2 needs the `h2` package
+    (`pip install httpx[http2]`). Without it clients fall back to HTTP/1.1 with a warning.
+
+    Args:
+        http2 (bool, optional): Whether to use HTTP/2 where the server supports it. Will default to False.
+        max_connections (int, optional): The maximum number of open connections. Will default to 100.
+        max_keepalive_connections (int, optional): The maximum number of idle connections kept open. Will default to
+                                    20.
+        keepalive_expiry (float, optional): The number of seconds an idle connection is kept open. Will default to 5.
+        connect_timeout (float, optional): The number of seconds to wait for a connection. Will default to 30.
+        read_timeout (float, optional): The number of seconds to wait for each chunk of a response. Will default to 30.
+        write_timeout (float, optional): The number of seconds to wait to send each chunk of a request. Will default to
+                                    30.
+        pool_timeout (float, optional): The number of seconds to wait for a connection from the pool. Will default to
+                                    30.
+
+    Any limit or timeout can be None for no limit.
+    """
+
+    http2: bool = False
+    max_connections: Optional[int] = 100
+    max_keepalive_connections: Optional[int] = 20
+    keepalive_expiry: Optional[float] = 5.0
+    connect_timeout: Optional[float] = 30
+    read_timeout: Optional[float] = 30
+    write_timeout: Optional[float] = 30
+    pool_timeout: Optional[float] = 30
+
+    @classmethod
+    def from_env(cls, service: Optional[str] = None) -> "TransportConfig":
+        """Create a config from the {service}_HTTP2, {service}_MAX_CONNECTIONS, {service}_MAX_KEEPALIVE_CONNECTIONS,
+        {service}_KEEPALIVE_EXPIRY, {service}_CONNECT_TIMEOUT, {service}_READ_TIMEOUT, {service}_WRITE_TIMEOUT and
+        {service}_POOL_TIMEOUT environment variables. Settings that are not set keep their defaults, and limits and
+        timeouts can be set to "none".
+
+        Args:
+            service (str, optional): The service to read the settings of. Will default to None (the defaults).
+
+        Returns:
+            TransportConfig: The config.
+        """
+        if not service:
+            return cls()
+        service = service.upper()
+        settings = {}
+        if os.getenv(f"{service}_HTTP2"):
+            settings["http2"] = os.getenv(f"{service}_HTTP2").lower() in ("1", "true")
+        for name, parse in (
+            ("max_connections", _optional_int),
+            ("max_keepalive_connections", _optional_int),
+            ("keepalive_expiry", _optional_float),
+            ("connect_timeout", _optional_float),
+            ("read_timeout", _optional_float),
+            ("write_timeout", _optional_float),
+            ("pool_timeout", _optional_float),
+        ):
+            value = os.getenv(f"{service}_{name.upper()}")
+            if value:
+                settings[name] = parse(value)
+        return cls(**settings)
+
+    @property
+    def limits(self) -> httpx.Limits:
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def timeout(self) -> httpx.Timeout:
+        return httpx.Timeout(
+            connect=self.connect_timeout, read=self.read_timeout, write=self.write_timeout, pool=self.pool_timeout
+        )
+
+    def client_kwargs(self) -> dict:
+        """The arguments to create an httpx client with"""
+        http2 = self.http2
+        if http2 and not http2_available():
+            logger.warning("HTTP/2 was requested but the h2 package is not installed. Using HTTP/1.1")
+            http2 = False
+        return {"http2": http2, "limits": self.limits, "timeout": self.timeout}
@@ -0,0 +1,158 @@
+import asyncio
+import io
+import os
+import uuid
+from typing import IO, AnyStr, AsyncIterator, Callable, Optional
+
+ProgressCallback = Callable[[int, Optional[int]], None]
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+
+def _quote(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', "%22")
+
+
+def _binary(file: IO[AnyStr]) -> IO[bytes]:
+    """Get a binary file object for a file opened in either text or binary mode"""
+    if isinstance(file, io.TextIOBase):
+        if hasattr(file, "buffer"):
+            return file.buffer
+        # In-memory text with no underlying buffer is already held in memory, so encoding it costs nothing extra
+        return io.BytesIO(file.read().encode())
+    return file
+
+
+def _remaining_size(file: IO[bytes]) -> Optional[int]:
+    """The number of bytes left to read from a file, or None if it cannot be known without reading it"""
+    try:
+        position = file.tell()
+        size = file.seek(0, os.SEEK_END)
+        file.seek(position)
+    except (OSError, ValueError, AttributeError):
+        return None
+    return size - position
+
+
+class MultipartFileStream:
+    """A `multipart/form-data` request body that streams a file in fixed-size chunks, so uploads use the same amount of
+    memory whatever the size of the file. Files on disk are read in a worker thread so the event loop is never blocked
+    on disk I/O, and in-memory file objects are read directly.
+
+    The stream can be passed to httpx as `content`, along with the `headers` it provides.
+
+    Args:
+        fields (dict): The form fields to send before the file.
+        file (IO[AnyStr]): The file to upload, from its current position.
+        filename (str): The filename to send with the file.
+        file_field (str, optional): The name of the form field for the file. Will default to "file".
+        chunk_size (int, optional): The number of bytes to read at a time. Will default to 1 MiB.
+        progress (Callable[[int, Optional[int]], None], optional): Called after each chunk is sent with the number of
+                                    bytes sent so far and the total number of bytes, if known. Will default to None.
+    """
+
+    def __init__(
+        self,
+        fields: dict,
+        file: IO[AnyStr],
+        filename: str,
+        file_field: str = "file",
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        progress: Optional[ProgressCallback] = None,
+    ):
+        self.boundary = uuid.uuid4().hex
+        self.file = _binary(file)
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.bytes_sent = 0
+
+        delimiter = f"--{self.boundary}\r\n".encode()
+        preamble = bytearray()
+        for name, value in fields.items():
+            preamble += delimiter
+            preamble += f'Content-Disposition: form-data; name="{_quote(str(name))}"\r\n\r\n'.encode()
+            preamble += f"{value}\r\n".encode()
+        preamble += delimiter
+        preamble += (
+            f'Content-Disposition: form-data; name="{_quote(file_field)}"; filename="{_quote(filename)}"\r\n'
+            "Content-Type: application/octet-stream\r\n\r\n"
+        ).encode()
+        self.preamble = bytes(preamble)
+        self.epilogue = f"\r\n--{self.boundary}--\r\n".encode()
+
+        self.file_size = _remaining_size(self.file)
+        self.content_length = (
+            None if self.file_size is None else len(self.preamble) + self.file_size + len(self.epilogue)
+        )
+
+    @property
+    def headers(self) -> dict[str, str]:
+        headers = {"Content-Type": f"multipart/form-data; boundary={self.boundary}"}
+        if self.content_length is not None:
+            headers["Content-Length"] = str(self.content_length)
+        return headers
+
+    def _sent(self, chunk: bytes) -> bytes:
+        self.bytes_sent += len(chunk)
+        if self.progress:
+            self.progress(self.bytes_sent, self.content_length)
+        return chunk
+
+    async def _file_chunks(self) -> AsyncIterator[bytes]:
+        try:
+            self.file.fileno()
+            on_disk = True
+        except (OSError, AttributeError, io.UnsupportedOperation):
+            on_disk = False
+
+        while True:
+            if on_disk:
+                chunk = await asyncio.to_thread(self.file.read, self.chunk_size)
+            else:
+                chunk = self.file.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    async def __aiter__(self) -> AsyncIterator[bytes]:
+        yield self._sent(self.preamble)
+        async for chunk in self._file_chunks():
+            yield self._sent(chunk)
+        yield self._sent(self.epilogue)
+
+
+def file_size(file: IO[bytes]) -> int:
+    """The size of a file in bytes"""
+    try:
+        return os.fstat(file.fileno()).st_size
+    except (OSError, AttributeError, io.UnsupportedOperation):
+        position = file.tell()
+        size = file.seek(0, os.SEEK_END)
+        file.seek(position)
+        return size
+
+
+class PartReader:
+    """Reads byte ranges of a file for parallel part uploads. Files on disk are read with `os.pread` in a worker
+    thread, so parts can be read concurrently without blocking the event loop or moving the file position. Other
+    seekable file objects are read one part at a time.
+
+    Args:
+        file (IO[bytes]): The file to read from.
+    """
+
+    def __init__(self, file: IO[bytes]):
+        self.file = file
+        self.size = file_size(file)
+        try:
+            self.fileno = file.fileno()
+        except (OSError, AttributeError, io.UnsupportedOperation):
+            self.fileno = None
+        self._lock = asyncio.Lock()
+
+    async def read(self, offset: int, size: int) -> bytes:
+        if self.fileno is not None:
+            return await asyncio.to_thread(os.pread, self.fileno, size, offset)
+        async with self._lock:
+            self.file.seek(offset)
+            return self.file.read(size)
@@ -1,11 +1,16 @@
 from functools import wraps
-from contextlib import asynccontextmanager
+from contextlib import aclosing, asynccontextmanager
 from typing import Any, Callable, Coroutine, Optional, cast, AsyncGenerator
 import asyncio
+import collections
+import time
+import warnings
 
 from typing_extensions import ParamSpec
 
 from .client import M2MClient
+from .instrumentation import PageTiming, get_instrumentation
+from .pool import client_pool
 from .schema import PaginatedResponse
 
 
@@ -55,7 +60,7 @@ def get_or_create_client(
     return M2MClient(service), False
 
 
-def inject_client(service: str):
+def inject_client(service: str, pooled: bool = True):
     """
     Simple helper to provide a context managed client to an asynchronous function.
 
@@ -63,8 +68,13 @@ def inject_client(service: str):
     called it will be used instead of creating a new one, but it will not be context
     managed as it is assumed that the caller is managing the context.
 
+    By default, calls that are not given a client borrow a long-lived client from the
+    process-wide `client_pool`, so repeated calls reuse warm connections and tokens.
+
     Args:
         service (str): The service to create a client for.
+        pooled (bool, optional): Whether to borrow a client from the pool instead of creating
+                                    and closing a new client on every call. Will default to True.
     """
 
     def decorator(
@@ -73,12 +83,16 @@ def inject_client(service: str):
         @wraps(fn)
         async def with_injected_client(*args: P.args, **kwargs: P.kwargs) -> Any:
             client = cast(Optional[M2MClient], kwargs.pop("client", None))
-            client, inferred = get_or_create_client(service, client)
-            if not inferred:
-                context = client
+            if client is None and pooled:
+                # Borrowed, so the pool does not close the client for being idle while the call is using it
+                context = client_pool.borrow(service)
             else:
-                # If the client was inferred from context, we don't want to close it so open a null context
-                context = async_null_context()
+                client, inferred = get_or_create_client(service, client)
+                if not inferred:
+                    context = client
+                else:
+                    # If the client was inferred from context, we don't want to close it so open a null context
+                    context = async_null_context()
 
             async with context as new_client:
                 kwargs.setdefault("client", new_client or client)
@@ -89,12 +103,43 @@ def inject_client(service: str):
     return decorator
 
 
+async def _fetch_page(fn: Callable[..., Coroutine[Any, Any, PaginatedResponse]], *args, page: int, **kwargs):
+    """Fetch a page, reporting how long it took if instrumentation is enabled"""
+    client = kwargs.get("client")
+    instrumentation = client.instrumentation if isinstance(client, M2MClient) else get_instrumentation()
+    if not instrumentation.enabled:
+        return await fn(*args, page=page, **kwargs)
+
+    error = None
+    started = time.perf_counter()
+    try:
+        return await fn(*args, page=page, **kwargs)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        instrumentation.page(
+            PageTiming(
+                function=getattr(fn, "__qualname__", repr(fn)),
+                page=page,
+                duration=time.perf_counter() - started,
+                error=error,
+            )
+        )
+
+
 class Paginator:
     """A simple paginator for paginated API responses.
 
+    With `read_ahead` set, the next pages are requested in the background while the caller works on the current one.
+    Pages are still returned in order, and at most `read_ahead` pages are buffered. Prefetched requests are cancelled
+    when a page fails and when the paginator is closed, either with `aclose` or by using it as an async context manager.
+    A paginator that is garbage collected with requests still in flight warns with a `ResourceWarning`.
+
     Args:
         fn (Callable[..., Coroutine[Any, Any, PaginatedResponse]): The async function to call to get a page of results.
         per_page (int): The number of items per page.
+        read_ahead (int, optional): The number of pages to prefetch ahead of the current page. Will default to 0.
     """
 
     def __init__(
@@ -102,19 +147,71 @@ class Paginator:
         fn: Callable[..., Coroutine[Any, Any, PaginatedResponse]],
         *args,
         per_page: int,
+        read_ahead: int = 0,
         **kwargs,
     ) -> None:
         self.fn = fn
         self.per_page = per_page
+        self.read_ahead = read_ahead
         self.page = 1
         self.pages = None
         self.args = args
         self.kwargs = kwargs
+        self._prefetched: dict[int, asyncio.Task] = {}
 
     def __aiter__(self) -> "Paginator":
         """Return the paginator as an async iterator."""
         return self
 
+    async def __aenter__(self) -> "Paginator":
+        return self
+
+    async def __aexit__(self, *args) -> None:
+        await self.aclose()
+
+    def __del__(self) -> None:
+        # Tasks cannot be safely cancelled from a finaliser, which may run on another thread or after the loop closed
+        if getattr(self, "_prefetched", None):
+            warnings.warn(
+                f"Paginator for {getattr(self.fn, '__name__', self.fn)} was not closed with prefetched requests in "
+                "flight. Use it with `async with` or call `aclose`",
+                ResourceWarning,
+                source=self,
+            )
+
+    async def _fetch(self, page: int) -> PaginatedResponse:
+        return await _fetch_page(self.fn, *self.args, page=page, per_page=self.per_page, **self.kwargs)
+
+    def _prefetch(self) -> None:
+        """Request the pages after the current one that are not already in flight"""
+        if not self.read_ahead or self.pages is None:
+            return
+        for page in range(self.page, min(self.page + self.read_ahead, self.pages + 1)):
+            if page not in self._prefetched:
+                self._prefetched[page] = asyncio.ensure_future(self._fetch(page))
+
+    def _cancel_prefetched(self) -> list[asyncio.Task]:
+        tasks = list(self._prefetched.values())
+        self._prefetched.clear()
+        for task in tasks:
+            task.cancel()
+        return tasks
+
+    async def aclose(self) -> None:
+        """Cancel any prefetched requests."""
+        tasks = self._cancel_prefetched()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _get(self, page: int) -> PaginatedResponse:
+        task = self._prefetched.pop(page, None)
+        try:
+            return await (task if task is not None else self._fetch(page))
+        except BaseException:
+            # The pages after a failed one will not be read, so stop requesting them
+            self._cancel_prefetched()
+            raise
+
     async def __anext__(self) -> PaginatedResponse:
         """Get the next page of results. This will raise a StopAsyncIteration if there are no more pages.
 
@@ -124,11 +221,10 @@ class Paginator:
         if self.pages is not None and self.page > self.pages:
             raise StopAsyncIteration
 
-        response = await self.fn(
-            *self.args, page=self.page, per_page=self.per_page, **self.kwargs
-        )
+        response = await self._get(self.page)
         self.pages = response.pages
         self.page += 1
+        self._prefetch()
         return response
 
     async def get(self, page: int) -> PaginatedResponse:
@@ -140,19 +236,141 @@ class Paginator:
         Returns:
             PaginatedResponse: A page response from the API.
         """
-        response = await self.fn(
-            *self.args, page=page, per_page=self.per_page, **self.kwargs
-        )
+        task = self._prefetched.pop(page, None)
+        await self.aclose()
+        if task is not None:
+            self._prefetched[page] = task
+        response = await self._get(page)
         self.pages = response.pages
         self.page = page
         return response
 
 
+async def _gather_pages(
+    fetch: Callable[[int], Coroutine[Any, Any, PaginatedResponse]],
+    pages: range,
+    max_concurrency: int,
+    ordered: bool,
+) -> AsyncGenerator[PaginatedResponse, None]:
+    """Fetch pages with at most `max_concurrency` requests in flight, yielding each page in page order or as soon as it
+    arrives. Outstanding requests are cancelled if one fails or the generator is closed early."""
+    if max_concurrency < 1:
+        raise ValueError("max_concurrency must be at least 1")
+
+    page_numbers = iter(pages)
+    pending: dict[asyncio.Task, int] = {}
+    in_order: collections.deque[asyncio.Task] = collections.deque()
+
+    def schedule() -> None:
+        while len(pending) < max_concurrency:
+            page = next(page_numbers, None)
+            if page is None:
+                return
+            task = asyncio.ensure_future(fetch(page))
+            pending[task] = page
+            in_order.append(task)
+
+    try:
+        schedule()
+        while pending:
+            if ordered:
+                head = in_order[0]
+                while not head.done():
+                    # Wait on every unfinished request, not just the head, so a failure on a later page is raised
+                    # straight away. Finished requests are left out, as waiting on them would return immediately.
+                    running = [task for task in pending if not task.done()]
+                    finished, _ = await asyncio.wait(running, return_when=asyncio.FIRST_COMPLETED)
+                    for task in finished:
+                        if not task.cancelled() and task.exception():
+                            raise task.exception()
+                done = [in_order.popleft()]
+            else:
+                done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del pending[task]
+                if not ordered:
+                    in_order.remove(task)
+            # Top up the window before handing pages back so requests keep flowing while the caller works
+            schedule()
+            for task in done:
+                yield task.result()
+    finally:
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+
+async def iter_pages(
+    fn: Callable[..., Coroutine[Any, Any, PaginatedResponse]],
+    client: M2MClient,
+    *args,
+    per_page: int,
+    max_concurrency: int = 10,
+    ordered: bool = True,
+    **kwargs,
+) -> AsyncGenerator[PaginatedResponse, None]:
+    """Stream every page of a paginated API response, with a bounded number of requests in flight.
+
+    Args:
+        fn (Callable[..., Coroutine[Any, Any, PaginatedResponse]): The async function to call to get a page of results.
+        client (M2MClient): The client to use to make the requests.
+        per_page (int): The number of items per page.
+        max_concurrency (int, optional): The maximum number of pages to request at once. Will default to 10.
+        ordered (bool, optional): Whether to yield pages in page order, or in the order they arrive. Will default to
+                                    True.
+
+    Yields:
+        PaginatedResponse: Each page response from the API.
+    """
+    first_page = await _fetch_page(fn, *args, client=client, page=1, per_page=per_page, **kwargs)
+    yield first_page
+
+    async def fetch(page: int) -> PaginatedResponse:
+        return await _fetch_page(fn, *args, client=client, page=page, per_page=per_page, **kwargs)
+
+    async with aclosing(_gather_pages(fetch, range(2, first_page.pages + 1), max_concurrency, ordered)) as pages:
+        async for page in pages:
+            yield page
+
+
+async def iter_all(
+    fn: Callable[..., Coroutine[Any, Any, PaginatedResponse]],
+    client: M2MClient,
+    *args,
+    per_page: int,
+    max_concurrency: int = 10,
+    ordered: bool = True,
+    **kwargs,
+) -> AsyncGenerator[Any, None]:
+    """Stream every item of a paginated API response as pages arrive, with a bounded number of requests in flight.
+
+    Args:
+        fn (Callable[..., Coroutine[Any, Any, PaginatedResponse]): The async function to call to get a page of results.
+        client (M2MClient): The client to use to make the requests.
+        per_page (int): The number of items per page.
+        max_concurrency (int, optional): The maximum number of pages to request at once. Will default to 10.
+        ordered (bool, optional): Whether to yield items in page order, or in the order their pages arrive. Will
+                                    default to True.
+
+    Yields:
+        Any: Each item from each page.
+    """
+    pages = iter_pages(
+        fn, client, *args, per_page=per_page, max_concurrency=max_concurrency, ordered=ordered, **kwargs
+    )
+    async with aclosing(pages):
+        async for page in pages:
+            for item in page.items:
+                yield item
+
+
 async def fetch_all(
     fn: Callable[..., Coroutine[Any, Any, PaginatedResponse]],
     client: M2MClient,
     *args,
     per_page: int,
+    max_concurrency: int = 10,
     **kwargs,
 ) -> list:
     """Fetch all pages of a paginated API response.
@@ -161,20 +379,11 @@ async def fetch_all(
         fn (Callable[..., Coroutine[Any, Any, PaginatedResponse]): The async function to call to get a page of results.
         client (M2MClient): The client to use to make the requests.
         per_page (int): The number of items per page.
+        max_concurrency (int, optional): The maximum number of pages to request at once. Will default to 10.
 
     Returns:
         list: A list of all items from all pages.
     """
-    first_page = await fn(*args, client=client, page=1, per_page=per_page, **kwargs)
-
-    if first_page.pages == 1:
-        return first_page.items
-
-    remaining_pages = await asyncio.gather(
-        *[
-            fn(*args, client=client, page=i, per_page=per_page, **kwargs)
-            for i in range(2, first_page.pages + 1)
-        ]
-    )
-    first_page.items.extend([item for page in remaining_pages for item in page.items])
-    return first_page.items
+    items = iter_all(fn, client, *args, per_page=per_page, max_concurrency=max_concurrency, **kwargs)
+    async with aclosing(items):
+        return [item async for item in items]
@@ -1,3 +1,6 @@
+import asyncio
+import heapq
+import itertools
 import time
 
 import pytest
@@ -18,3 +21,57 @@ def client_responses(httpx_mock: HTTPXMock) -> HTTPXMock:
     )
     return httpx_mock
 
+
+class FakeClock:
+    """Stands in for the `time` module and `asyncio.sleep`, so tests that wait run instantly and deterministically.
+    Sleepers only wake when the test advances the clock past their wake time."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self._epoch = time.time() - self.now
+        self._sleepers: list = []
+        self._order = itertools.count()
+        self._sleep = asyncio.sleep
+
+    def monotonic(self) -> float:
+        return self.now
+
+    perf_counter = monotonic
+
+    def time(self) -> float:
+        return self._epoch + self.now
+
+    async def sleep(self, delay: float, result=None):
+        if delay <= 0:
+            await self._sleep(0)
+            return result
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._sleepers, (self.now + delay, next(self._order), future))
+        await future
+        return result
+
+    async def _settle(self) -> None:
+        # Let woken tasks run until they finish or sleep again
+        for _ in range(20):
+            await self._sleep(0)
+
+    async def advance(self, seconds: float) -> None:
+        """Move the clock forward, waking each sleeper in turn at its wake time"""
+        target = self.now + seconds
+        await self._settle()
+        while self._sleepers and self._sleepers[0][0] <= target:
+            wake, _, future = heapq.heappop(self._sleepers)
+            self.now = max(self.now, wake)
+            if not future.done():
+                future.set_result(None)
+            await self._settle()
+        self.now = target
+
+
+@pytest.fixture()
+def fake_clock(monkeypatch) -> FakeClock:
+    """A fake clock that `asyncio.sleep` waits on. Patch it in as the `time` module of the code under test with
+    `monkeypatch.setattr(module, "time", fake_clock)`."""
+    clock = FakeClock()
+    monkeypatch.setattr(asyncio, "sleep", clock.sleep)
+    return clock
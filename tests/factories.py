@@ -1,6 +1,9 @@
+from polyfactory import Use
 from polyfactory.factories.pydantic_factory import ModelFactory
 
 from src import schema
+from src.client import M2MClient
+from src.utilities import inject_client
 
 
 class FileTypeFactory(ModelFactory[schema.FileType]):
@@ -13,3 +16,19 @@ class OrganisationFactory(ModelFactory[schema.PageOfOrganisations]):
 
 class ClaimFactory(ModelFactory[schema.PageOfClaims]):
     __model__ = schema.PageOfClaims
+
+    # Claims are untyped, so keep them to values that survive a round trip through JSON
+    items = Use(ModelFactory.__faker__.words)
+
+
+@inject_client(service="test")
+async def inject_function(client: M2MClient, page: int = 1, per_page: int = 100) -> schema.PaginatedResponse:
+    """Function to test client injection."""
+    assert isinstance(client, M2MClient)
+    assert client.token["access_token"] == "test_access_token"
+    return schema.PaginatedResponse(
+        items=[f"item_{page}"],
+        page=page,
+        pages=3,
+        per_page=per_page,
+    )
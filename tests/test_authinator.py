@@ -1,5 +1,7 @@
 import pytest
 
+from src.client import M2MClient
+from src.schema import LazyPage
 from src.services import authinator
 from .factories import OrganisationFactory, ClaimFactory
 
@@ -26,3 +28,32 @@ async def test_get_claims(client_responses):
     )
     response = await authinator.get_claims()
     assert response == claims
+
+
+@pytest.mark.asyncio
+async def test_get_organisations_without_validation(client_responses, monkeypatch):
+    monkeypatch.setenv("AUTHINATOR_VALIDATE_RESPONSES", "false")
+    organisation = OrganisationFactory.build()
+    client_responses.add_response(
+        url="https://authinator.test.com/organisations",
+        method="GET",
+        json=organisation.model_dump(),
+    )
+    async with M2MClient(service="authinator") as client:
+        await client.fetch_token()
+        assert not client.validate_responses
+        response = await authinator.get_organisations(client=client)
+    assert response == organisation
+
+
+@pytest.mark.asyncio
+async def test_get_claims_lazy(client_responses):
+    claims = ClaimFactory.build()
+    client_responses.add_response(
+        url="https://authinator.test.com/claims",
+        method="GET",
+        json=claims.model_dump(by_alias=True),
+    )
+    response = await authinator.get_claims(lazy=True)
+    assert isinstance(response, LazyPage)
+    assert response.claims == claims.claims
@@ -0,0 +1,20 @@
+import json
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).parent.parent
+
+
+def test_client_benchmarks_run():
+    # Run in a subprocess, as the benchmarks point the environment and client pool at the mock services
+    output = subprocess.run(
+        [sys.executable, "-m", "benchmarks.bench_client", "--quick", "--only", "fetch_token", "pagination"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    ).stdout
+    results = {result["name"]: result for result in json.loads(output)["results"]}
+    assert {"fetch_token.memory", "fetch_all.organisations", "paginator.claims_read_ahead_4"} <= set(results)
+    assert all(result["ops_per_second"] > 0 and result["p99_ms"] >= result["p50_ms"] for result in results.values())
@@ -0,0 +1,90 @@
+import asyncio
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import httpx
+import pytest
+
+from src import blocking
+from src.blocking import BackgroundLoop
+from .factories import OrganisationFactory
+
+
+@pytest.fixture(autouse=True)
+def close_background_loop():
+    yield
+    blocking.background_loop.close()
+
+
+def test_run_returns_result_and_raises_errors():
+    loop = BackgroundLoop()
+
+    async def running_loop():
+        return asyncio.get_running_loop()
+
+    async def fail():
+        raise ValueError("failed")
+
+    assert loop.run(running_loop()) is loop.run(running_loop())
+    with pytest.raises(ValueError, match="failed"):
+        loop.run(fail())
+    loop.close()
+
+
+def test_run_cancels_on_timeout():
+    loop = BackgroundLoop()
+    cancelled = threading.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    with pytest.raises(TimeoutError):
+        loop.run(slow(), timeout=0.01)
+    assert cancelled.wait(1)
+    loop.close()
+
+
+def test_run_from_background_loop_raises():
+    loop = BackgroundLoop()
+
+    async def nested():
+        return loop.run(asyncio.sleep(0))
+
+    with pytest.raises(RuntimeError):
+        loop.run(nested())
+    loop.close()
+
+
+def test_service_functions_share_a_pooled_client(client_responses):
+    organisation = OrganisationFactory.build()
+    client_responses.add_response(
+        url="https://authinator.test.com/organisations",
+        method="GET",
+        json=organisation.model_dump(),
+    )
+    client_responses.add_response(
+        url="https://authinator.test.com/organisations",
+        method="GET",
+        json=organisation.model_dump(),
+    )
+
+    with ThreadPoolExecutor(2) as executor:
+        responses = list(executor.map(lambda _: blocking.authinator.get_organisations(), range(2)))
+    assert responses == [organisation, organisation]
+    # The token was fetched once, by the pooled client on the background loop
+    assert len(client_responses.get_requests(url="https://test.auth0.com/oauth/token")) == 1
+
+
+def test_fetch_all(client_responses):
+    def page(request: httpx.Request) -> httpx.Response:
+        number = int(request.url.params["page"])
+        return httpx.Response(200, json={"items": [number], "page": number, "pages": 3, "per_page": 1})
+
+    client_responses.add_callback(page, url=re.compile(r"https://authinator.test.com/claims.*"))
+
+    assert blocking.fetch_all(blocking.authinator.get_claims, per_page=1) == [1, 2, 3]
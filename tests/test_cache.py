@@ -0,0 +1,275 @@
+import asyncio
+import json
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from src.client import M2MClient
+from src.cache import (
+    AsyncCache,
+    AsyncCacheAdapter,
+    AsyncMemcachedCache,
+    InMemoryCache,
+    SharedFileCache,
+    TieredCache,
+    as_async_cache,
+)
+
+
+class GetSetCache:
+    """Custom cache that only implements get and set, recording the thread each call was made on."""
+
+    def __init__(self):
+        self.cache = {}
+        self.threads = set()
+
+    def get(self, key):
+        self.threads.add(threading.current_thread().name)
+        return self.cache.get(key)
+
+    def set(self, key, value, ttl=0):
+        self.threads.add(threading.current_thread().name)
+        self.cache[key] = value
+
+
+@pytest.mark.asyncio
+async def test_adapter_in_memory_cache():
+    cache = as_async_cache(InMemoryCache())
+    assert isinstance(cache, AsyncCache)
+    await cache.set("key", "value", 10)
+    assert await cache.get("key") == "value"
+    assert await cache.add("key", "other") is False
+    assert await cache.add("lease", "owner") is True
+    await cache.delete("lease")
+    assert await cache.get("lease") is None
+
+
+@pytest.mark.asyncio
+async def test_adapter_custom_cache_with_executor():
+    custom = GetSetCache()
+    cache = AsyncCacheAdapter(custom, ThreadPoolExecutor(1, thread_name_prefix="cache"))
+    await cache.set("key", "value")
+    assert await cache.get("key") == "value"
+    # Caches without add or delete grant every add and ignore deletes
+    assert await cache.add("key", "other") is True
+    await cache.delete("key")
+    assert await cache.get("key") == "value"
+    assert custom.threads == {"cache_0"}
+
+
+def test_as_async_cache_passes_through_async_caches():
+    cache = AsyncCacheAdapter(InMemoryCache())
+    assert as_async_cache(cache) is cache
+
+
+def test_memcached_cache_is_async():
+    cache = AsyncMemcachedCache("localhost")
+    assert isinstance(cache, AsyncCache)
+    assert cache.executor._max_workers == 4
+    cache.close()
+    assert cache.executor._shutdown
+
+
+def test_memcached_cache_is_shared_per_server(monkeypatch):
+    monkeypatch.setattr(AsyncMemcachedCache, "_shared", {})
+    cache = AsyncMemcachedCache.shared("localhost")
+    assert AsyncMemcachedCache.shared("localhost") is cache
+    assert AsyncMemcachedCache.shared("localhost:11212") is not cache
+    AsyncMemcachedCache.close_shared()
+    assert cache.executor._shutdown
+    assert AsyncMemcachedCache.shared("localhost") is not cache
+    AsyncMemcachedCache.close_shared()
+
+
+@pytest.mark.asyncio
+async def test_adapter_add_only_passes_noreply_to_pymemcache():
+    class AddCache(GetSetCache):
+        def add(self, key, value, ttl=0):
+            return self.cache.setdefault(key, value) is value
+
+    cache = AsyncCacheAdapter(AddCache())
+    assert await cache.add("lease", "owner") is True
+    assert await cache.add("lease", "other") is False
+
+
+def test_in_memory_cache_ttl(monkeypatch):
+    now = 1000.0
+    monkeypatch.setattr("src.cache.time.monotonic", lambda: now)
+    cache = InMemoryCache()
+    cache.set("short", "value", 10)
+    cache.set("forever", "value")
+    now += 11
+    assert cache.get("short") is None
+    assert cache.get("forever") == "value"
+    assert cache.add("short", "again", 10) is True
+    assert cache.stats == {"hits": 1, "misses": 1, "evictions": 0, "size": 2}
+
+
+def test_in_memory_cache_lru_eviction():
+    cache = InMemoryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache():
+    remote = InMemoryCache()
+    cache = TieredCache(remote, local_ttl=30)
+    await cache.set("key", "value", 60)
+    assert remote.get("key") == "value"
+    assert await cache.get("key") == "value"
+    assert cache.local.hits == 1
+
+    # Values set by other processes are read through from the remote cache and kept locally
+    remote.set("other", "value")
+    assert await cache.get("other") == "value"
+    assert cache.local.get("other") == "value"
+
+    # Leases are only taken in the remote cache
+    assert await cache.add("lease", "owner") is True
+    assert cache.local.get("lease") is None
+    assert await cache.add("lease", "owner") is False
+
+    await cache.delete("key")
+    assert await cache.get("key") is None
+
+
+@pytest.mark.asyncio
+async def test_tiered_cache_local_copies_do_not_outlive_tokens():
+    remote = InMemoryCache()
+    cache = TieredCache(remote, local_ttl=60)
+    remote.set("token", {"access_token": "token", "expires_at": time.time() + 10})
+    remote.set("expired", {"access_token": "token", "expires_at": time.time() - 1})
+    assert await cache.get("token")
+    assert await cache.get("expired")
+
+    expires, _ = cache.local.cache["token"]
+    assert expires - time.monotonic() <= 10
+    assert cache.local.get("expired") is None
+
+
+def test_shared_file_cache(tmp_path, monkeypatch):
+    cache = SharedFileCache(str(tmp_path))
+    assert cache.get("key") is None
+    cache.set("key", {"access_token": "token"})
+    assert SharedFileCache(str(tmp_path)).get("key") == {"access_token": "token"}
+
+    assert not cache.add("key", "other")
+    cache.delete("key")
+    assert cache.get("key") is None
+    assert cache.add("key", "other", 10)
+    assert cache.get("key") == "other"
+
+    monkeypatch.setattr(time, "time", lambda: 1e12)
+    assert cache.get("key") is None
+    assert cache.add("key", "newer")
+
+
+def test_shared_file_cache_refuses_directories_others_can_access(tmp_path):
+    directory = tmp_path / "tokens"
+    directory.mkdir(mode=0o755)
+    directory.chmod(0o755)
+    with pytest.raises(PermissionError):
+        SharedFileCache(str(directory))
+
+    (tmp_path / "link").symlink_to(directory)
+    directory.chmod(0o700)
+    with pytest.raises(PermissionError):
+        SharedFileCache(str(tmp_path / "link"))
+
+
+@pytest.mark.asyncio
+async def test_shared_file_cache_locks_off_the_event_loop(tmp_path, monkeypatch):
+    threads = set()
+    locked = SharedFileCache._locked
+
+    def record_thread(self, path):
+        threads.add(threading.current_thread())
+        return locked(self, path)
+
+    read = SharedFileCache._read
+
+    def record_read_thread(self, path):
+        threads.add(threading.current_thread())
+        return read(self, path)
+
+    monkeypatch.setattr(SharedFileCache, "_locked", record_thread)
+    monkeypatch.setattr(SharedFileCache, "_read", record_read_thread)
+    shared = SharedFileCache(str(tmp_path))
+    await as_async_cache(shared).set("key", "value")
+    tiered = TieredCache(InMemoryCache(), local=shared)
+    await tiered.set("other", "value")
+    assert await tiered.get("other") == "value"
+    assert threads and threading.current_thread() not in threads
+
+
+class TokenHandler(BaseHTTPRequestHandler):
+    requests = 0
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        type(self).requests += 1
+        # Give other workers time to find the lease taken
+        time.sleep(0.2)
+        body = json.dumps({"access_token": f"token_{self.requests}", "token_type": "Bearer", "expires_in": 3600})
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body.encode())
+
+    def log_message(self, *args):
+        pass
+
+
+def fetch_token_in_worker(directory: str, token_endpoint: str, tokens: multiprocessing.Queue) -> None:
+    async def fetch() -> str:
+        client = M2MClient(
+            client_id="id",
+            client_secret="secret",
+            auth_base_url=token_endpoint,
+            audience="https://test.test.com",
+            base_url="https://test.test.com",
+            cache=SharedFileCache(directory),
+            token_lease_ttl=5,
+        )
+        token = await client.fetch_token()
+        await client.aclose()
+        return token["access_token"]
+
+    tokens.put(asyncio.run(fetch()))
+
+
+def test_worker_processes_share_one_token(tmp_path):
+    TokenHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), TokenHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    token_endpoint = f"http://127.0.0.1:{server.server_port}/oauth/token"
+
+    context = multiprocessing.get_context("fork")
+    tokens = context.Queue()
+    workers = [
+        context.Process(target=fetch_token_in_worker, args=(str(tmp_path), token_endpoint, tokens)) for _ in range(4)
+    ]
+    try:
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join(10)
+            assert worker.exitcode == 0
+        assert [tokens.get(timeout=1) for _ in workers] == ["token_1"] * 4
+        assert TokenHandler.requests == 1
+    finally:
+        server.shutdown()
@@ -0,0 +1,120 @@
+import asyncio
+import time
+
+import httpx
+import pytest
+from authlib.oauth2.rfc6749 import OAuth2Token
+
+from src import client as client_module
+from src.cache import AsyncMemcachedCache, InMemoryCache
+from src.client import M2MClient
+
+
+def make_token(expires_in: int = 86400) -> OAuth2Token:
+    return OAuth2Token(
+        {
+            "access_token": "cached_access_token",
+            "expires_in": expires_in,
+            "token_type": "Bearer",
+            "expires_at": time.time() + expires_in,
+        }
+    )
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_single_flight(client_responses):
+    cache = InMemoryCache()
+    clients = [M2MClient(service="test", cache=cache) for _ in range(10)]
+    tokens = await asyncio.gather(*(client.fetch_token() for client in clients))
+    assert len(client_responses.get_requests()) == 1
+    assert all(token["access_token"] == "test_access_token" for token in tokens)
+    assert all(client.token["access_token"] == "test_access_token" for client in clients)
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_from_cache(httpx_mock):
+    cache = InMemoryCache()
+    client = M2MClient(service="test", cache=cache)
+    cache.set(client.cache_key, make_token())
+    token = await client.fetch_token()
+    assert token["access_token"] == "cached_access_token"
+    assert not httpx_mock.get_requests()
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_waits_for_lease_holder(httpx_mock):
+    cache = InMemoryCache()
+    client = M2MClient(service="test", cache=cache, token_lease_ttl=5)
+    client.token_lease_poll_interval = 0.01
+    # Simulate another process holding the lease and publishing its token shortly after
+    assert cache.add(f"{client.cache_key}:lease", "other")
+    asyncio.get_running_loop().call_later(0.05, cache.set, client.cache_key, make_token())
+
+    token = await client.fetch_token()
+    assert token["access_token"] == "cached_access_token"
+    assert not httpx_mock.get_requests()
+
+
+@pytest.mark.asyncio
+async def test_fetch_token_releases_lease(client_responses):
+    cache = InMemoryCache()
+    client = M2MClient(service="test", cache=cache, token_lease_ttl=5)
+    token = await client.fetch_token()
+    assert token["access_token"] == "test_access_token"
+    assert cache.get(f"{client.cache_key}:lease") is None
+    assert cache.get(client.cache_key)["access_token"] == "test_access_token"
+
+
+def add_token_response(httpx_mock, access_token: str, expires_in: int):
+    httpx_mock.add_response(
+        url="https://test.auth0.com/oauth/token",
+        method="POST",
+        json={
+            "access_token": access_token,
+            "expires_in": expires_in,
+            "token_type": "Bearer",
+            "expires_at": time.time() + expires_in,
+        },
+    )
+
+
+@pytest.mark.asyncio
+async def test_auto_refresh(httpx_mock, fake_clock, monkeypatch):
+    monkeypatch.setattr(client_module, "time", fake_clock)
+    add_token_response(httpx_mock, "first_access_token", 2)
+    add_token_response(httpx_mock, "second_access_token", 86400)
+    client = M2MClient(
+        service="test", cache=InMemoryCache(), auto_refresh=True, token_cache_buffer=1.5, refresh_jitter=0
+    )
+    token = await client.fetch_token()
+    assert token["access_token"] == "first_access_token"
+
+    await fake_clock.advance(1.2)
+    assert client.token["access_token"] == "second_access_token"
+    assert len(httpx_mock.get_requests()) == 2
+
+    await client.aclose()
+    assert client._refresh_task is None
+
+
+@pytest.mark.asyncio
+async def test_auto_refresh_disabled(client_responses):
+    client = M2MClient(service="test", cache=InMemoryCache())
+    await client.fetch_token()
+    assert client._refresh_task is None
+    await client.aclose()
+
+
+def test_clients_share_memcached_cache(monkeypatch):
+    monkeypatch.setenv("MEMCACHED_URL", "localhost")
+    monkeypatch.setattr(AsyncMemcachedCache, "_shared", {})
+    assert M2MClient("test").cache is M2MClient("test").cache
+    AsyncMemcachedCache.close_shared()
+
+
+@pytest.mark.asyncio
+async def test_redirects_raise(client_responses):
+    client_responses.add_response(url="https://test.test.com/moved", status_code=302, headers={"Location": "/new"})
+    async with M2MClient("test", cache=InMemoryCache()) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get("moved")
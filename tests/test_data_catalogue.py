@@ -1,5 +1,17 @@
+import asyncio
+import base64
+import collections
+import hashlib
+import io
+import json
+import os
+import re
+
+import httpx
 import pytest
 
+from src.resilience import RetryPolicy
+from src.schema import FileRecord, MultipartSignedURL
 from src.services import data_catalogue
 from .factories import FileTypeFactory
 
@@ -15,3 +27,415 @@ async def test_get_file_type(client_responses):
     response = await data_catalogue.get_file_type(feed_identifier="test", feed_version=1)
     assert response == file_type
 
+
+async def read_upload(request: httpx.Request) -> httpx.Response:
+    """Stand in for the object store, reading the streamed upload"""
+    await request.aread()
+    return httpx.Response(204)
+
+
+@pytest.mark.asyncio
+async def test_upload_and_catalogue_file(client_responses, tmp_path):
+    client_responses.add_response(
+        url="https://data-catalogue.test.com/signed_url/",
+        method="POST",
+        json={
+            "fields": {"key": "uploads/data.csv"},
+            "file_path": "s3://bucket/uploads/data.csv",
+            "signed_url": "https://bucket.test.com/",
+        },
+    )
+    client_responses.add_callback(read_upload, url="https://bucket.test.com/", method="POST")
+    record = {
+        "feed_identifier": "test",
+        "feed_version": 1,
+        "file_location": "s3://bucket/uploads/data.csv",
+        "catalogued_time": "2024-01-01T00:00:00",
+        "posted_by": "test",
+        "organisation": "atheon",
+        "file_meta": {"rows": 2},
+    }
+    client_responses.add_response(url="https://data-catalogue.test.com/records", method="POST", json=record)
+
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n1,2\n")
+    progress = []
+    with open(path, "rb") as file:
+        response = await data_catalogue.upload_and_catalogue_file(
+            file=file,
+            feed_identifier="test",
+            feed_version=1,
+            file_meta={"rows": 2},
+            progress=lambda sent, total: progress.append(sent),
+        )
+
+    assert response == FileRecord(**record)
+    upload = client_responses.get_request(url="https://bucket.test.com/")
+    assert b"a,b\n1,2\n" in upload.content
+    assert "authorization" not in upload.headers
+    assert progress[-1] == len(upload.content)
+
+
+def signed_url_callback(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    key = f"uploads/{body['feed_identifier']}.csv"
+    return httpx.Response(
+        200,
+        json={
+            "fields": {"key": key},
+            "file_path": f"s3://bucket/{key}",
+            "signed_url": f"https://bucket.test.com/{body['feed_identifier']}",
+        },
+    )
+
+
+def record_callback(request: httpx.Request) -> httpx.Response:
+    body = json.loads(request.content)
+    if body["feed_identifier"] == "bad_record":
+        return httpx.Response(400, json={"detail": "invalid"})
+    return httpx.Response(
+        200, json={**body, "catalogued_time": "2024-01-01T00:00:00", "posted_by": "test"}
+    )
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("async_input", [False, True])
+async def test_upload_and_catalogue_files(client_responses, tmp_path, async_input):
+    client_responses.add_callback(signed_url_callback, url="https://data-catalogue.test.com/signed_url/")
+    client_responses.add_callback(record_callback, url="https://data-catalogue.test.com/records")
+    client_responses.add_response(url="https://bucket.test.com/bad_upload", status_code=403)
+    client_responses.add_callback(read_upload, url=re.compile(r"https://bucket\.test\.com/(feed_\d+|bad_record)"))
+
+    names = [f"feed_{i}" for i in range(8)] + ["bad_upload", "bad_record"]
+    files = []
+    for name in names:
+        path = tmp_path / f"{name}.csv"
+        path.write_text(name)
+        files.append((path, name, 1, {"name": name}))
+
+    async def async_files():
+        for item in files:
+            yield item
+
+    results = await data_catalogue.upload_and_catalogue_files(
+        files=async_files() if async_input else files,
+        signed_url_concurrency=3,
+        upload_concurrency=2,
+        record_concurrency=2,
+    )
+
+    assert [result.feed_identifier for result in results] == names
+    assert [result.ok for result in results] == [True] * 8 + [False, False]
+    assert all(
+        result.record.file_location == f"s3://bucket/uploads/{result.feed_identifier}.csv" for result in results[:8]
+    )
+    assert isinstance(results[8].error, httpx.HTTPStatusError)
+    assert results[8].record is None
+    assert results[9].error.response.status_code == 400
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("stage", ["signed_url_concurrency", "upload_concurrency", "record_concurrency"])
+async def test_upload_and_catalogue_files_needs_concurrency(client_responses, stage):
+    with pytest.raises(ValueError, match=stage):
+        await data_catalogue.upload_and_catalogue_files(files=[], **{stage: 0})
+
+
+class ObjectStore:
+    """A stub object store that accepts multipart uploads, checking the checksum of every part"""
+
+    def __init__(self, fail_once=(), fail_always=(), expired=()):
+        self.parts = {}
+        self.fail_once = set(fail_once)
+        self.fail_always = set(fail_always)
+        self.expired = set(expired)
+        self.attempts = collections.Counter()
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        part_number = int(request.url.params["partNumber"])
+        self.attempts[part_number] += 1
+        if part_number in self.fail_always:
+            return httpx.Response(500)
+        if part_number in self.expired:
+            return httpx.Response(400, text="ExpiredToken")
+        if part_number in self.fail_once:
+            self.fail_once.remove(part_number)
+            return httpx.Response(503)
+        checksum = base64.b64encode(hashlib.md5(request.content).digest()).decode()
+        if request.headers["Content-MD5"] != checksum:
+            return httpx.Response(400, text="BadDigest")
+        self.parts[part_number] = request.content
+        return httpx.Response(200, headers={"ETag": f'"{checksum}"'})
+
+    def assembled(self) -> bytes:
+        return b"".join(self.parts[number] for number in sorted(self.parts))
+
+
+def add_multipart_responses(client_responses, store: ObjectStore, completed: list):
+    def signed_url(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        return httpx.Response(
+            200,
+            json={
+                "upload_id": "upload-1",
+                "file_path": "s3://bucket/uploads/large.bin",
+                "parts": [
+                    {"part_number": n, "signed_url": f"https://bucket.test.com/large.bin?partNumber={n}"}
+                    for n in range(1, body["part_count"] + 1)
+                ],
+            },
+        )
+
+    def complete(request: httpx.Request) -> httpx.Response:
+        completed.append(json.loads(request.content))
+        return httpx.Response(204)
+
+    client_responses.add_callback(signed_url, url="https://data-catalogue.test.com/signed_url/multipart/")
+    client_responses.add_callback(complete, url="https://data-catalogue.test.com/signed_url/multipart/complete")
+    client_responses.add_callback(store, url=re.compile(r"https://bucket\.test\.com/large\.bin.*"), method="PUT")
+    client_responses.add_callback(record_callback, url="https://data-catalogue.test.com/records")
+
+
+@pytest.mark.asyncio
+async def test_upload_and_catalogue_large_file(client_responses, tmp_path):
+    store, completed = ObjectStore(fail_once={2}), []
+    add_multipart_responses(client_responses, store, completed)
+    content = os.urandom(10 * 1024 + 7)
+    path = tmp_path / "large.bin"
+    path.write_bytes(content)
+    progress = []
+
+    record = await data_catalogue.upload_and_catalogue_large_file(
+        file=path,
+        feed_identifier="test",
+        feed_version=1,
+        file_meta={},
+        part_size=1024,
+        concurrency=3,
+        retry_policy=RetryPolicy(backoff_factor=0),
+        progress=lambda sent, total: progress.append((sent, total)),
+    )
+
+    assert record.file_location == "s3://bucket/uploads/large.bin"
+    assert store.assembled() == content
+    assert store.attempts[2] == 2
+    assert [part["part_number"] for part in completed[0]["parts"]] == list(range(1, 12))
+    assert progress[-1] == (len(content), len(content))
+
+
+@pytest.mark.asyncio
+async def test_bad_requests_are_not_retried(client_responses):
+    store = ObjectStore(expired={2})
+    add_multipart_responses(client_responses, store, [])
+    file = io.BytesIO(os.urandom(2048))
+    kwargs = dict(file=file, feed_identifier="test", feed_version=1, file_meta={}, part_size=1024)
+    with pytest.raises(data_catalogue.MultipartUploadError) as error:
+        await data_catalogue.upload_and_catalogue_large_file(**kwargs)
+    assert set(error.value.errors) == {2}
+    assert store.attempts[2] == 1
+
+    store.expired.clear()
+    await data_catalogue.upload_and_catalogue_large_file(resume=error.value.upload, **kwargs)
+    assert store.assembled() == file.getvalue()
+
+
+@pytest.mark.asyncio
+async def test_resume_large_file_upload(client_responses):
+    store, completed = ObjectStore(fail_always={3}), []
+    add_multipart_responses(client_responses, store, completed)
+    file = io.BytesIO(os.urandom(4096))
+
+    with pytest.raises(data_catalogue.MultipartUploadError) as error:
+        await data_catalogue.upload_and_catalogue_large_file(
+            file=file,
+            feed_identifier="test",
+            feed_version=1,
+            file_meta={},
+            part_size=1024,
+            retry_policy=RetryPolicy(max_retries=1, backoff_factor=0),
+        )
+    upload = error.value.upload
+    assert set(error.value.errors) == {3}
+    assert set(upload.completed) == {1, 2, 4}
+    assert not completed
+
+    store.fail_always.clear()
+    store.attempts.clear()
+    await data_catalogue.upload_and_catalogue_large_file(
+        file=file, feed_identifier="test", feed_version=1, file_meta={}, resume=upload
+    )
+    assert dict(store.attempts) == {3: 1}
+    assert store.assembled() == file.getvalue()
+    assert len(completed[0]["parts"]) == 4
+
+
+def make_upload(part_count: int) -> data_catalogue.MultipartUpload:
+    signed_url = MultipartSignedURL(
+        upload_id="upload-1",
+        file_path="s3://bucket/uploads/large.bin",
+        parts=[
+            {"part_number": n, "signed_url": f"https://bucket.test.com/large.bin?partNumber={n}"}
+            for n in range(1, part_count + 1)
+        ],
+    )
+    return data_catalogue.MultipartUpload(signed_url=signed_url, part_size=1024)
+
+
+@pytest.mark.asyncio
+async def test_upload_parts_needs_concurrency():
+    with pytest.raises(ValueError, match="concurrency"):
+        await data_catalogue.upload_parts(io.BytesIO(b"data"), make_upload(1), concurrency=0)
+
+
+@pytest.mark.asyncio
+async def test_upload_parts_cancels_other_parts_on_error():
+    cancelled = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        part_number = int(request.url.params["partNumber"])
+        if part_number == 1:
+            return httpx.Response(200, headers={"ETag": '"1"'})
+        try:
+            await asyncio.Event().wait()
+        except asyncio.CancelledError:
+            cancelled.append(part_number)
+            raise
+
+    def progress(sent, total):
+        raise RuntimeError("progress failed")
+
+    async with httpx.AsyncClient(transport=httpx.MockTransport(handler)) as upload_client:
+        with pytest.raises(RuntimeError, match="progress failed"):
+            await data_catalogue.upload_parts(
+                io.BytesIO(os.urandom(4096)), make_upload(4), progress=progress, upload_client=upload_client
+            )
+    assert sorted(cancelled) == [2, 3, 4]
+
+
+def make_records(count: int) -> list[dict]:
+    return [
+        {
+            "feed_identifier": f"feed_{i}",
+            "feed_version": 1,
+            "file_location": f"s3://bucket/{i}.csv",
+            "file_meta": {"i": i},
+        }
+        for i in range(count)
+    ]
+
+
+def created(record: dict) -> dict:
+    return {**record, "catalogued_time": "2024-01-01T00:00:00", "posted_by": "test"}
+
+
+@pytest.mark.asyncio
+async def test_post_file_records_in_batches(client_responses, monkeypatch):
+    monkeypatch.setattr(data_catalogue, "_no_batch_route", {})
+    batch_sizes = []
+
+    async def batch_callback(request: httpx.Request) -> httpx.Response:
+        records = json.loads(request.content)["records"]
+        batch_sizes.append(len(records))
+        # Answer later batches first, so results have to be put back in order
+        await asyncio.sleep(0.001 * (10 - len(batch_sizes)))
+        return httpx.Response(200, json=[created(record) for record in records])
+
+    client_responses.add_callback(batch_callback, url="https://data-catalogue.test.com/records/batch")
+
+    records = make_records(23)
+    results = await data_catalogue.post_file_records(records=records, max_batch_size=5, concurrency=3)
+
+    assert [result.feed_identifier for result in results] == [record["feed_identifier"] for record in records]
+    assert all(result.organisation == "atheon" for result in results)
+    assert sorted(batch_sizes) == [3, 5, 5, 5, 5]
+
+
+@pytest.mark.asyncio
+async def test_post_file_records_bounds_batch_bytes(client_responses, monkeypatch):
+    monkeypatch.setattr(data_catalogue, "_no_batch_route", {})
+
+    def batch_callback(request: httpx.Request) -> httpx.Response:
+        assert len(request.content) < 600
+        records = json.loads(request.content)["records"]
+        return httpx.Response(200, json=[created(record) for record in records])
+
+    client_responses.add_callback(batch_callback, url="https://data-catalogue.test.com/records/batch")
+    results = await data_catalogue.post_file_records(records=make_records(20), max_batch_bytes=500)
+    assert len(results) == 20
+    assert len(client_responses.get_requests(url="https://data-catalogue.test.com/records/batch")) > 1
+
+
+@pytest.mark.asyncio
+async def test_post_file_records_without_batch_route(client_responses, monkeypatch):
+    monkeypatch.setattr(data_catalogue, "_no_batch_route", {})
+    in_flight, max_in_flight = 0, 0
+
+    async def single_callback(request: httpx.Request) -> httpx.Response:
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.001)
+        in_flight -= 1
+        return httpx.Response(200, json=created(json.loads(request.content)))
+
+    client_responses.add_response(url="https://data-catalogue.test.com/records/batch", status_code=404)
+    client_responses.add_callback(single_callback, url="https://data-catalogue.test.com/records")
+
+    records = make_records(12)
+    results = await data_catalogue.post_file_records(records=records, concurrency=4)
+    assert [result.file_meta for result in results] == [record["file_meta"] for record in records]
+    assert max_in_flight == 4
+
+    # The missing route is remembered
+    await data_catalogue.post_file_records(records=records[:2])
+    assert len(client_responses.get_requests(url="https://data-catalogue.test.com/records/batch")) == 1
+
+
+@pytest.mark.asyncio
+async def test_missing_batch_route_is_retried(client_responses, fake_clock, monkeypatch):
+    monkeypatch.setattr(data_catalogue, "_no_batch_route", {})
+    monkeypatch.setattr(data_catalogue, "time", fake_clock)
+    client_responses.add_response(url="https://data-catalogue.test.com/records/batch", status_code=404)
+    client_responses.add_callback(
+        lambda request: httpx.Response(200, json=created(json.loads(request.content))),
+        url="https://data-catalogue.test.com/records",
+    )
+
+    def batch_requests() -> int:
+        return len(client_responses.get_requests(url="https://data-catalogue.test.com/records/batch"))
+
+    await data_catalogue.post_file_records(records=make_records(1))
+    await data_catalogue.post_file_records(records=make_records(1))
+    assert batch_requests() == 1
+
+    await fake_clock.advance(data_catalogue.NO_BATCH_ROUTE_TTL)
+    await data_catalogue.post_file_records(records=make_records(1))
+    assert batch_requests() == 2
+
+    data_catalogue.reset_batch_routes()
+    await data_catalogue.post_file_records(records=make_records(1))
+    assert batch_requests() == 3
+
+
+@pytest.mark.asyncio
+async def test_post_file_records_attaches_created_records_to_error(client_responses, monkeypatch):
+    monkeypatch.setattr(data_catalogue, "_no_batch_route", {})
+
+    def batch_callback(request: httpx.Request) -> httpx.Response:
+        records = json.loads(request.content)["records"]
+        if records[0]["feed_identifier"] == "feed_10":
+            return httpx.Response(500)
+        return httpx.Response(200, json=[created(record) for record in records])
+
+    client_responses.add_callback(batch_callback, url="https://data-catalogue.test.com/records/batch")
+    with pytest.raises(data_catalogue.FileRecordsError) as error:
+        await data_catalogue.post_file_records(records=make_records(15), max_batch_size=5, concurrency=1)
+    assert [result.feed_identifier for result in error.value.results[:10]] == [f"feed_{i}" for i in range(10)]
+    assert error.value.results[10:] == [None] * 5
+    assert isinstance(error.value.error, httpx.HTTPStatusError)
+
+
+@pytest.mark.asyncio
+async def test_post_file_records_needs_concurrency(client_responses):
+    with pytest.raises(ValueError):
+        await data_catalogue.post_file_records(records=make_records(1), concurrency=0)
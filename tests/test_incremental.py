@@ -0,0 +1,145 @@
+import hashlib
+import json
+import re
+
+import httpx
+import pytest
+
+from src.client import M2MClient
+from src.incremental import Change, CheckpointStore, IncrementalSync
+from src.schema import Organisation
+from src.services import authinator
+
+
+class Organisations:
+    """A paginated organisations endpoint that supports conditional requests, recording the pages requested."""
+
+    def __init__(self, count: int, etags: bool = True):
+        self.items = [{"id": i, "host_name": f"host-{i}", "verbose_name": f"Organisation {i}"} for i in range(count)]
+        self.etags = etags
+        self.requested: list[int] = []
+        self.not_modified = 0
+
+    def __call__(self, request: httpx.Request) -> httpx.Response:
+        page, per_page = int(request.url.params["page"]), int(request.url.params["per_page"])
+        since = int(request.url.params.get("since_id", -1))
+        self.requested.append(page)
+        items = [item for item in self.items if item["id"] > since]
+        content = json.dumps(
+            {
+                "items": items[(page - 1) * per_page:page * per_page],
+                "page": page,
+                "pages": max(-(-len(items) // per_page), 1),
+                "per_page": per_page,
+            }
+        ).encode()
+        if not self.etags:
+            return httpx.Response(200, content=content)
+        etag = f'"{hashlib.md5(content).hexdigest()}"'
+        if request.headers.get("If-None-Match") == etag:
+            self.not_modified += 1
+            return httpx.Response(304, headers={"ETag": etag})
+        return httpx.Response(200, content=content, headers={"ETag": etag})
+
+
+@pytest.fixture()
+def organisations(client_responses) -> Organisations:
+    organisations = Organisations(25)
+    client_responses.add_callback(organisations, url=re.compile(r"https://authinator.test.com/organisations.*"))
+    return organisations
+
+
+@pytest.mark.asyncio
+async def test_first_sync_adds_every_item(organisations):
+    store = CheckpointStore()
+    async with M2MClient("authinator") as client:
+        sync = IncrementalSync(authinator.get_organisations, store, per_page=10, key=lambda o: o.id, client=client)
+        changes = await sync.sync()
+    assert [change.kind for change in changes] == ["added"] * 25
+    assert changes[0] == Change("added", 0, Organisation(**organisations.items[0]))
+    assert sorted(organisations.requested) == [1, 2, 3]
+
+
+@pytest.mark.asyncio
+async def test_repeat_sync_yields_only_changes(organisations, tmp_path):
+    path = str(tmp_path / "checkpoints.db")
+    async with M2MClient("authinator") as client:
+
+        def incremental_sync() -> IncrementalSync:
+            # A new store each time, as the checkpoint must survive between processes
+            return IncrementalSync(
+                authinator.get_organisations, CheckpointStore(path), per_page=10, key=lambda o: o.id, client=client
+            )
+
+        await incremental_sync().sync()
+        assert await incremental_sync().sync() == []
+        assert organisations.not_modified == 3
+
+        organisations.items[12]["verbose_name"] = "Renamed"
+        del organisations.items[24]
+        sync = incremental_sync()
+        changes = await sync.sync()
+    assert changes == [Change("updated", 12, Organisation(**organisations.items[12])), Change("removed", 24)]
+    assert sync.stats == {"requests": 3, "not_modified": 1, "changed_pages": 2, "changed_items": 1}
+
+
+@pytest.mark.asyncio
+async def test_unchanged_pages_are_skipped_without_etags(client_responses):
+    organisations = Organisations(25, etags=False)
+    client_responses.add_callback(organisations, url=re.compile(r"https://authinator.test.com/organisations.*"))
+    store = CheckpointStore()
+    async with M2MClient("authinator") as client:
+        await IncrementalSync(authinator.get_organisations, store, per_page=10, client=client).sync()
+        organisations.items[3]["host_name"] = "moved"
+        sync = IncrementalSync(authinator.get_organisations, store, per_page=10, client=client)
+        changes = await sync.sync()
+    # Without a key, a changed item is identified by its content
+    assert [change.kind for change in changes] == ["added", "removed"]
+    assert sync.stats["changed_pages"] == 1
+
+
+@pytest.mark.asyncio
+async def test_append_only_resumes_from_last_page(organisations):
+    store = CheckpointStore()
+    kwargs = dict(per_page=10, key=lambda o: o.id, append_only=True)
+    async with M2MClient("authinator") as client:
+        await IncrementalSync(authinator.get_organisations, store, client=client, **kwargs).sync()
+        organisations.requested.clear()
+        organisations.items += [{"id": i, "host_name": f"host-{i}", "verbose_name": "New"} for i in range(25, 32)]
+        changes = await IncrementalSync(authinator.get_organisations, store, client=client, **kwargs).sync()
+    assert [change.key for change in changes] == list(range(25, 32))
+    assert organisations.requested == [3, 4]
+
+
+@pytest.mark.asyncio
+async def test_since_param_requests_items_after_high_water_mark(organisations):
+    store = CheckpointStore()
+    kwargs = dict(per_page=10, key=lambda o: o.id, high_water=lambda o: o.id, since_param="since_id")
+    async with M2MClient("authinator") as client:
+        await IncrementalSync(authinator.get_organisations, store, client=client, **kwargs).sync()
+        organisations.requested.clear()
+        organisations.items.append({"id": 25, "host_name": "host-25", "verbose_name": "New"})
+        changes = await IncrementalSync(authinator.get_organisations, store, client=client, **kwargs).sync()
+        checkpoint = await store.load("authinator:get_organisations")
+    assert checkpoint.high_water == 25
+    # The page count of the full sync is kept, as a since request only covers the newer items
+    assert checkpoint.page_count == 3
+    assert [change.key for change in changes] == [25]
+    assert organisations.requested == [1]
+
+
+@pytest.mark.asyncio
+async def test_stats_are_for_the_latest_sync(organisations):
+    async with M2MClient("authinator") as client:
+        sync = IncrementalSync(authinator.get_organisations, CheckpointStore(), per_page=10, client=client)
+        await sync.sync()
+        await sync.sync()
+    assert sync.stats == {"requests": 3, "not_modified": 3, "changed_pages": 0, "changed_items": 0}
+
+
+def test_needs_a_registered_paginated_function():
+    async def get_organisations(**kwargs):
+        pass
+
+    with pytest.raises(ValueError):
+        IncrementalSync(get_organisations, CheckpointStore())
@@ -0,0 +1,157 @@
+import asyncio
+import time
+
+import pytest
+
+from src.client import M2MClient
+from src.instrumentation import (
+    MetricsCollector,
+    OpenTelemetryInstrumentation,
+    PageTiming,
+    PhaseTimer,
+    RequestTiming,
+    get_instrumentation,
+    set_instrumentation,
+)
+from src.pool import ClientPool
+from src.resilience import RetryPolicy
+from src.utilities import fetch_all
+from .factories import inject_function
+
+
+@pytest.fixture()
+def collector():
+    collector = MetricsCollector()
+    set_instrumentation(collector)
+    yield collector
+    set_instrumentation(None)
+
+
+@pytest.mark.asyncio
+async def test_phase_timer():
+    timer = PhaseTimer()
+    for name in (
+        "connection.connect_tcp.started",
+        "connection.connect_tcp.complete",
+        "http11.send_request_headers.started",
+        "http11.send_request_headers.complete",
+        "http11.receive_response_headers.started",
+        "http11.receive_response_headers.complete",
+        "http11.receive_response_body.started",
+        "http11.receive_response_body.complete",
+        "http11.response_closed.started",
+    ):
+        await timer(name, {})
+    assert set(timer.phases) == {"connect", "transfer", "wait"}
+
+
+@pytest.mark.asyncio
+async def test_request_phases_from_real_connection(monkeypatch):
+    async def fetch_token(self, *args, **kwargs):
+        # There is no token endpoint to reach, and the local server does not check the token
+        self.token = {"access_token": "token", "token_type": "Bearer", "expires_at": time.time() + 3600}
+        return self.token
+
+    monkeypatch.setattr(M2MClient, "fetch_token", fetch_token)
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        await reader.readuntil(b"\r\n\r\n")
+        await asyncio.sleep(0.01)
+        writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok")
+        await writer.drain()
+        writer.close()
+
+    server = await asyncio.start_server(handle, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    collector = MetricsCollector()
+    async with server, M2MClient(
+        client_id="id",
+        client_secret="secret",
+        auth_base_url="https://test.auth0.com/oauth/token",
+        audience="local",
+        base_url=f"http://127.0.0.1:{port}",
+        instrumentation=collector,
+    ) as client:
+        response = await client.get("/")
+
+    assert response.text == "ok"
+    (timing,) = collector.requests
+    assert timing.status_code == 200
+    assert timing.connect is not None
+    assert timing.wait >= 0.01
+    assert timing.transfer is not None
+    assert timing.duration >= timing.wait
+
+
+@pytest.mark.asyncio
+async def test_collects_tokens_retries_and_requests(client_responses, collector):
+    client_responses.add_response(url="https://test.test.com/data", status_code=503)
+    client_responses.add_response(url="https://test.test.com/data", json={})
+
+    async with M2MClient("test", retry_policy=RetryPolicy(backoff_factor=0)) as client:
+        await client.get("data")
+        await client.fetch_token()
+
+    assert collector.counters["token.endpoint"] == 1
+    assert collector.counters["token.memory"] >= 1
+    assert collector.counters["retries"] == 1
+    assert collector.counters["requests"] == 2
+    assert collector.counters["requests.errors"] == 1
+    assert [timing.status_code for timing in collector.requests] == [503, 200]
+    assert collector.summary()["requests"]["duration"]["p99"] > 0
+
+
+@pytest.mark.asyncio
+async def test_collects_pool_and_page_metrics(client_responses, collector):
+    pool = ClientPool()
+    client = pool.get("test")
+    assert pool.get("test") is client
+    await client.fetch_token()
+    await fetch_all(inject_function, client, per_page=100)
+    await pool.aclose()
+
+    assert collector.counters["pool.miss"] == 1
+    assert collector.counters["pool.hit"] == 1
+    assert [timing.page for timing in collector.pages] == [1, 2, 3]
+    assert collector.pages[0].function == inject_function.__qualname__
+
+
+def test_default_instrumentation_is_disabled():
+    assert not get_instrumentation().enabled
+
+
+class FakeInstrument:
+    def __init__(self):
+        self.values = []
+
+    def record(self, value, attributes):
+        self.values.append((value, attributes))
+
+    add = record
+
+
+class FakeMeter:
+    def __init__(self):
+        self.instruments = {}
+
+    def create_histogram(self, name, **kwargs):
+        return self.instruments.setdefault(name, FakeInstrument())
+
+    create_counter = create_histogram
+
+
+def test_open_telemetry_instrumentation():
+    meter = FakeMeter()
+    instrumentation = OpenTelemetryInstrumentation(meter)
+    instrumentation.request(RequestTiming("TEST", "GET", "data", 0, 0.5, status_code=200, wait=0.25))
+    instrumentation.token("TEST", "cache")
+    instrumentation.page(PageTiming("get_claims", 1, 0.1))
+
+    assert meter.instruments["http.client.request.duration"].values == [
+        (0.5, {"service": "TEST", "http.request.method": "GET", "http.response.status_code": 200})
+    ]
+    assert meter.instruments["m2m_client.request.phase.duration"].values == [
+        (0.25, {"service": "TEST", "phase": "wait"})
+    ]
+    assert meter.instruments["m2m_client.token.lookups"].values == [(1, {"service": "TEST", "source": "cache"})]
+    assert meter.instruments["m2m_client.page.duration"].values == [(0.1, {"function": "get_claims"})]
@@ -0,0 +1,36 @@
+import logging
+import subprocess
+import sys
+
+from src.log import LogSampler
+
+
+def test_log_sampler(caplog):
+    logger = logging.getLogger("test_log_sampler")
+    sampler = LogSampler(interval=60)
+    with caplog.at_level(logging.DEBUG, logger="test_log_sampler"):
+        for _ in range(5):
+            sampler.log(logger, logging.DEBUG, "a", "message %s", "a")
+        sampler.log(logger, logging.DEBUG, "b", "message %s", "b")
+    assert [record.getMessage() for record in caplog.records] == ["message a", "message b"]
+
+    sampler.interval = 0
+    with caplog.at_level(logging.DEBUG, logger="test_log_sampler"):
+        sampler.log(logger, logging.DEBUG, "a", "message %s", "a")
+    assert caplog.records[-1].suppressed == 4
+    assert caplog.records[-1].getMessage() == "message a (4 similar messages suppressed)"
+
+
+def test_log_sampler_disabled_level(caplog):
+    logger = logging.getLogger("test_log_sampler")
+    sampler = LogSampler(interval=0)
+    with caplog.at_level(logging.INFO, logger="test_log_sampler"):
+        sampler.log(logger, logging.DEBUG, "a", "message")
+    assert not caplog.records
+    assert not sampler._suppressed
+
+
+def test_import_does_not_configure_logging():
+    code = "import logging, src.client; print(len(logging.getLogger().handlers), logging.getLogger().level)"
+    output = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, check=True).stdout
+    assert output.split() == ["0", str(logging.WARNING)]
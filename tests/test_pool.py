@@ -0,0 +1,153 @@
+import asyncio
+import multiprocessing
+
+import pytest
+
+from src import blocking
+from src import pool as pool_module
+from src.client import M2MClient
+from src.pool import ClientPool, client_pool
+from src.utilities import inject_client
+
+
+@inject_client(service="test")
+async def pooled_function(client: M2MClient) -> M2MClient:
+    """Function to test pooled client injection."""
+    return client
+
+
+@inject_client(service="test", pooled=False)
+async def unpooled_function(client: M2MClient) -> M2MClient:
+    """Function to test unpooled client injection."""
+    return client
+
+
+@pytest.mark.asyncio
+async def test_get_reuses_client():
+    pool = ClientPool()
+    client = pool.get("test")
+    assert isinstance(client, M2MClient)
+    assert pool.get("test") is client
+    assert pool.get("authinator") is not client
+    await pool.aclose()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_acquire_fetches_token(client_responses):
+    pool = ClientPool()
+    client = await pool.acquire("test")
+    assert client.token["access_token"] == "test_access_token"
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_idle_clients_are_closed(fake_clock, monkeypatch):
+    monkeypatch.setattr(pool_module, "time", fake_clock)
+    pool = ClientPool(idle_timeout=60)
+    client = pool.get("test")
+    await fake_clock.advance(59)
+    assert pool.get("test") is client
+    await fake_clock.advance(61)
+    assert pool.get("test") is not client
+    await asyncio.sleep(0)
+    assert client.is_closed
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_borrowed_clients_are_not_closed(client_responses, fake_clock, monkeypatch):
+    monkeypatch.setattr(pool_module, "time", fake_clock)
+    pool = ClientPool(idle_timeout=60)
+    async with pool.borrow("test") as client:
+        assert client.token["access_token"] == "test_access_token"
+        await fake_clock.advance(120)
+        assert pool.get("test") is client
+        await asyncio.sleep(0)
+        assert not client.is_closed
+        await fake_clock.advance(120)
+    # Idle from when it was returned
+    await fake_clock.advance(59)
+    assert pool.get("test") is client
+    await fake_clock.advance(61)
+    assert pool.get("test") is not client
+    await asyncio.sleep(0)
+    assert client.is_closed
+    await pool.aclose()
+
+
+def test_clients_are_not_shared_across_loops():
+    pool = ClientPool()
+
+    async def get():
+        return pool.get("test")
+
+    first = asyncio.run(get())
+    second = asyncio.run(get())
+    assert first is not second
+    pool.close()
+
+
+@pytest.mark.asyncio
+async def test_inject_client_uses_pool(client_responses):
+    first = await pooled_function()
+    second = await pooled_function()
+    assert first is second
+    assert not first.is_closed
+    assert len(client_responses.get_requests()) == 1
+
+
+@pytest.mark.asyncio
+async def test_inject_client_unpooled(client_responses):
+    client = await unpooled_function()
+    assert client.is_closed
+
+
+@pytest.mark.asyncio
+async def test_configure():
+    pool = ClientPool()
+    pool.configure("test", token_cache_buffer=10)
+    assert pool.get("test").token_cache_buffer == 10
+    assert pool.get("authinator").token_cache_buffer == 60
+    await pool.aclose()
+
+
+@pytest.mark.asyncio
+async def test_reconfigured_services_get_new_clients():
+    pool = ClientPool()
+    client = pool.get("test")
+    pool.configure("test", audience="https://other.test.com")
+    other = pool.get("test")
+    assert other is not client
+    assert other.audience == "https://other.test.com"
+    pool.configure("test", audience="https://other.test.com", token_cache_buffer=10)
+    assert pool.get("test") is not other
+    assert pool.get("test").token_cache_buffer == 10
+    await pool.aclose()
+
+
+async def get_pooled_client() -> M2MClient:
+    return client_pool.get("test")
+
+
+def check_pool_in_child(results: multiprocessing.Queue) -> None:
+    reset = not client_pool._loops and blocking.background_loop._loop is None and not M2MClient._inflight_tokens
+    client = blocking.run(get_pooled_client())
+    results.put((reset, client.is_closed, len(client_pool._loops)))
+
+
+def test_pool_is_reset_in_forked_child():
+    client = blocking.run(get_pooled_client())
+    try:
+        context = multiprocessing.get_context("fork")
+        results = context.Queue()
+        child = context.Process(target=check_pool_in_child, args=(results,))
+        child.start()
+        child.join(10)
+        assert child.exitcode == 0
+        assert results.get(timeout=1) == (True, False, 1)
+        # The parent's client is untouched by the child
+        assert not client.is_closed
+        assert blocking.run(get_pooled_client()) is client
+    finally:
+        blocking.background_loop.close()
@@ -0,0 +1,98 @@
+import asyncio
+
+import httpx
+import pytest
+
+from src import ratelimit
+from src.cache import InMemoryCache
+from src.client import M2MClient
+from src.ratelimit import RateLimiter, configure_rate_limit, get_rate_limiter
+
+
+@pytest.mark.asyncio
+async def test_burst_then_steady_rate(fake_clock, monkeypatch):
+    monkeypatch.setattr(ratelimit, "time", fake_clock)
+    limiter = RateLimiter(rate=50, burst=5)
+    start = fake_clock.now
+    sent = []
+
+    async def request(i):
+        async with limiter:
+            sent.append((i, round(fake_clock.now - start, 6)))
+
+    requests = asyncio.gather(*(request(i) for i in range(10)))
+    await fake_clock.advance(1)
+    await requests
+    # The first five go straight away and the rest are spaced 20ms apart, in the order they arrived
+    assert sent == [(i, 0) for i in range(5)] + [(i, round(0.02 * (i - 4), 6)) for i in range(5, 10)]
+
+
+@pytest.mark.asyncio
+async def test_max_in_flight():
+    limiter = RateLimiter(max_in_flight=2)
+    in_flight = max_in_flight = 0
+
+    async def request():
+        nonlocal in_flight, max_in_flight
+        async with limiter:
+            in_flight += 1
+            max_in_flight = max(max_in_flight, in_flight)
+            await asyncio.sleep(0.001)
+            in_flight -= 1
+
+    await asyncio.gather(*(request() for _ in range(10)))
+    assert max_in_flight == 2
+
+
+def test_adaptive_rate():
+    limiter = RateLimiter(rate=100, adaptive=True)
+    request = httpx.Request("GET", "https://test.test.com")
+    limiter.update(
+        httpx.Response(200, headers={"X-RateLimit-Remaining": "10", "X-RateLimit-Reset": "5"}, request=request)
+    )
+    assert limiter.rate == 2
+    limiter.update(
+        httpx.Response(200, headers={"RateLimit-Remaining": "1000", "RateLimit-Reset": "1"}, request=request)
+    )
+    assert limiter.rate == 100
+
+    limiter.update(httpx.Response(429, headers={"Retry-After": "1"}, request=request))
+    assert limiter._reserve() > 0.9
+
+
+def test_get_rate_limiter_from_environment(monkeypatch):
+    monkeypatch.setattr("src.ratelimit._rate_limiters", {})
+    monkeypatch.setenv("LIMITED_RATE_LIMIT", "20")
+    monkeypatch.setenv("LIMITED_RATE_LIMIT_BURST", "4")
+    limiter = get_rate_limiter("limited")
+    assert limiter.rate == 20
+    assert limiter.burst == 4
+    assert get_rate_limiter("limited") is limiter
+    assert get_rate_limiter("unlimited") is None
+
+
+class CountingRateLimiter(RateLimiter):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.acquired = 0
+
+    async def acquire(self) -> None:
+        self.acquired += 1
+        await super().acquire()
+
+
+@pytest.mark.asyncio
+async def test_client_requests_are_rate_limited(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", json={})
+    limiter = CountingRateLimiter(rate=1000)
+    async with M2MClient(service="test", cache=InMemoryCache(), rate_limiter=limiter) as client:
+        await client.get("items")
+        await client.get("items")
+    # Requests to the token endpoint are not rate limited
+    assert limiter.acquired == 2
+
+
+def test_client_uses_configured_rate_limiter(monkeypatch):
+    monkeypatch.setattr("src.ratelimit._rate_limiters", {})
+    limiter = configure_rate_limit("test", rate=1000, max_in_flight=1)
+    assert M2MClient(service="test", cache=InMemoryCache()).rate_limiter is limiter
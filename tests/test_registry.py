@@ -0,0 +1,92 @@
+import inspect
+import re
+
+import pytest
+from pydantic import BaseModel
+
+from src.client import M2MClient
+from src.response_cache import ResponseCache
+from src.schema import FeedParams, FileType
+from src.services import Service, data_catalogue
+from src.services.registry import Endpoint, register, registry
+from .factories import FileTypeFactory
+
+
+class Widget(BaseModel):
+    id: int
+    name: str
+
+
+class WidgetParams(BaseModel):
+    name: str
+    colour: str = "blue"
+
+
+@pytest.fixture()
+def create_widget(monkeypatch):
+    # Registered under a fresh entry for the service, which is removed again after the test
+    monkeypatch.setitem(registry, "test", {})
+    return register(
+        Endpoint("test", "create_widget", "POST", "widgets", params_model=WidgetParams, response_model=Widget), __name__
+    )
+
+
+@pytest.mark.asyncio
+async def test_generated_function_posts_params(client_responses, create_widget):
+    client_responses.add_response(
+        url="https://test.test.com/widgets",
+        method="POST",
+        match_json={"name": "gear", "colour": "blue"},
+        json={"id": 1, "name": "gear"},
+    )
+    assert await create_widget(name="gear") == Widget(id=1, name="gear")
+
+
+@pytest.mark.asyncio
+async def test_generated_function_checks_arguments(create_widget):
+    with pytest.raises(TypeError, match="missing required keyword arguments: name"):
+        await create_widget(colour="red")
+    with pytest.raises(TypeError, match="unexpected keyword arguments: size"):
+        await create_widget(name="gear", size=3)
+
+
+def test_generated_function_metadata(create_widget):
+    assert create_widget.__name__ == "create_widget"
+    assert create_widget.__module__ == __name__
+    assert inspect.iscoroutinefunction(create_widget)
+    signature = inspect.signature(create_widget)
+    assert list(signature.parameters) == ["client", "name", "colour"]
+    assert signature.parameters["colour"].default == "blue"
+    assert signature.return_annotation is Widget
+    assert registry["test"]["create_widget"] is create_widget.endpoint
+    assert Service.DATA_CATALOGUE.endpoints["get_file_type"] == Endpoint(
+        Service.DATA_CATALOGUE, "get_file_type", "GET", "file_types", params_model=FeedParams, response_model=FileType
+    )
+
+
+@pytest.mark.asyncio
+async def test_url_for_is_cached():
+    client = M2MClient("test")
+    url = client.url_for("widgets")
+    assert str(url) == "https://test.test.com/widgets"
+    assert client.url_for("widgets") is url
+    client.base_url = "https://other.test.com"
+    assert str(client.url_for("widgets")) == "https://other.test.com/widgets"
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_response_cache_ttls_by_path(client_responses):
+    file_type = FileTypeFactory.build()
+    client_responses.add_response(
+        url="https://data-catalogue.test.com/file_types?feed_identifier=feed&feed_version=1",
+        method="GET",
+        json=file_type.model_dump(),
+    )
+    response_cache = ResponseCache(ttl=0, ttls={"file_types": 60})
+    async with M2MClient(Service.DATA_CATALOGUE, response_cache=response_cache) as client:
+        for _ in range(2):
+            response = await data_catalogue.get_file_type(client=client, feed_identifier="feed", feed_version=1)
+            assert response == file_type
+    # The second call is served from the response cache. The token request is not counted
+    assert len(client_responses.get_requests(url=re.compile(r"https://data-catalogue\.test\.com/file_types.*"))) == 1
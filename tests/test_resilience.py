@@ -0,0 +1,99 @@
+import time
+
+import httpx
+import pytest
+
+from src.cache import InMemoryCache
+from src.client import M2MClient
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy, parse_retry_after
+
+NO_BACKOFF = RetryPolicy(backoff_factor=0)
+
+
+def make_client(**kwargs) -> M2MClient:
+    kwargs.setdefault("retry_policy", NO_BACKOFF)
+    kwargs.setdefault("circuit_breaker", CircuitBreaker("test"))
+    return M2MClient(service="test", cache=InMemoryCache(), **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_retry_transient_errors(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", status_code=502)
+    client_responses.add_exception(httpx.ReadError("connection reset"), url="https://test.test.com/items")
+    client_responses.add_response(url="https://test.test.com/items", json={"ok": True})
+    async with make_client() as client:
+        response = await client.get("items")
+    assert response.json() == {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_no_retry_for_non_idempotent_methods(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", method="POST", status_code=502)
+    async with make_client() as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.post("items")
+    assert len(client_responses.get_requests(method="POST", url="https://test.test.com/items")) == 1
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honoured(client_responses):
+    client_responses.add_response(
+        url="https://test.test.com/items", method="POST", status_code=429, headers={"Retry-After": "0"}
+    )
+    client_responses.add_response(url="https://test.test.com/items", method="POST", json={"ok": True})
+    async with make_client(retry_policy=RetryPolicy(backoff_factor=60)) as client:
+        response = await client.post("items")
+    assert response.json() == {"ok": True}
+
+
+@pytest.mark.asyncio
+async def test_retries_exhausted(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", status_code=503)
+    async with make_client(retry_policy=RetryPolicy(max_retries=2, backoff_factor=0)) as client:
+        with pytest.raises(httpx.HTTPStatusError):
+            await client.get("items")
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 3
+
+
+@pytest.mark.asyncio
+async def test_unauthorised_refreshes_token(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", status_code=401)
+    client_responses.add_response(url="https://test.test.com/items", json={"ok": True})
+    async with make_client() as client:
+        response = await client.get("items")
+    assert response.json() == {"ok": True}
+    assert len(client_responses.get_requests(url="https://test.auth0.com/oauth/token")) == 2
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", status_code=500)
+    breaker = CircuitBreaker("test", failure_threshold=2, reset_timeout=60)
+    async with make_client(circuit_breaker=breaker, retry_policy=RetryPolicy(max_retries=0)) as client:
+        for _ in range(2):
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.get("items")
+        with pytest.raises(CircuitOpenError):
+            await client.get("items")
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 2
+
+
+def test_circuit_breaker_half_open():
+    breaker = CircuitBreaker("test", failure_threshold=1, reset_timeout=0)
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.before_request()
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+    breaker.before_request()
+    breaker.record_success()
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_parse_retry_after():
+    request = httpx.Request("GET", "https://test.test.com")
+    assert parse_retry_after(httpx.Response(429, headers={"Retry-After": "5"}, request=request)) == 5
+    date = time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 30))
+    assert 25 < parse_retry_after(httpx.Response(429, headers={"Retry-After": date}, request=request)) <= 30
+    assert parse_retry_after(httpx.Response(429, request=request)) is None
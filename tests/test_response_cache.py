@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from src.cache import InMemoryCache
+from src.client import M2MClient
+from src.response_cache import ResponseCache
+
+
+def make_client(response_cache: ResponseCache, **kwargs) -> M2MClient:
+    return M2MClient(service="test", cache=InMemoryCache(), response_cache=response_cache, **kwargs)
+
+
+@pytest.mark.asyncio
+async def test_fresh_responses_are_served_from_cache(client_responses):
+    client_responses.add_response(url="https://test.test.com/items?page=1", json={"page": 1})
+    client_responses.add_response(url="https://test.test.com/items?page=2", json={"page": 2})
+    async with make_client(ResponseCache(ttl=60)) as client:
+        first = await client.get("items", params={"page": 1})
+        second = await client.get("items", params={"page": 1})
+        other = await client.get("items", params={"page": 2})
+    assert first.json() == second.json() == {"page": 1}
+    assert second.extensions["from_cache"]
+    assert other.json() == {"page": 2}
+    assert len(client_responses.get_requests(url="https://test.test.com/items?page=1")) == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_responses_are_revalidated(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", json={"id": 1}, headers={"ETag": '"v1"'})
+    client_responses.add_response(
+        url="https://test.test.com/items", status_code=304, match_headers={"If-None-Match": '"v1"'}
+    )
+    async with make_client(ResponseCache(ttl=0)) as client:
+        first = await client.get("items")
+        second = await client.get("items")
+    assert first.json() == second.json() == {"id": 1}
+    assert second.status_code == 200
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 2
+
+
+@pytest.mark.asyncio
+async def test_per_endpoint_ttls(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", json={})
+    client_responses.add_response(url="https://test.test.com/file_types", json={})
+    async with make_client(ResponseCache(ttl=0, ttls={"file_types": 60})) as client:
+        for _ in range(2):
+            await client.get("items")
+            await client.get("file_types")
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 2
+    assert len(client_responses.get_requests(url="https://test.test.com/file_types")) == 1
+
+
+@pytest.mark.asyncio
+async def test_identical_requests_are_coalesced(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", json={"id": 1})
+    async with make_client(ResponseCache()) as client:
+        responses = await asyncio.gather(*(client.get("items") for _ in range(10)))
+    assert all(response.json() == {"id": 1} for response in responses)
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 1
+
+
+@pytest.mark.asyncio
+async def test_entries_are_scoped_by_audience(client_responses):
+    client_responses.add_response(url="https://test.test.com/items", json={})
+    response_cache = ResponseCache()
+    async with make_client(response_cache) as client:
+        await client.get("items")
+    async with make_client(response_cache, audience="https://other.test.com") as client:
+        await client.get("items")
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 2
+
+
+@pytest.mark.asyncio
+async def test_no_store_and_other_methods_are_not_cached(client_responses):
+    client_responses.add_response(
+        url="https://test.test.com/items", method="GET", json={}, headers={"Cache-Control": "no-store"}
+    )
+    client_responses.add_response(url="https://test.test.com/items", method="POST", json={})
+    async with make_client(ResponseCache()) as client:
+        for _ in range(2):
+            await client.get("items")
+            await client.post("items")
+    assert len(client_responses.get_requests(url="https://test.test.com/items")) == 4
@@ -0,0 +1,117 @@
+import json
+
+import pytest
+
+from src import schema
+from .factories import ClaimFactory, OrganisationFactory
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_decode_page(validate):
+    page = OrganisationFactory.build()
+    decoded = schema.decode(schema.PageOfOrganisations, page.model_dump_json(), validate=validate)
+    assert decoded == page
+    assert isinstance(decoded.items[0], schema.Organisation)
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_decode_aliased_page(validate):
+    page = ClaimFactory.build()
+    decoded = schema.decode(schema.PageOfClaims, json.dumps(page.model_dump(by_alias=True)), validate=validate)
+    assert decoded.claims == page.claims
+
+
+def test_decode_list():
+    organisations = OrganisationFactory.build().items
+    content = json.dumps([organisation.model_dump() for organisation in organisations]).encode()
+    assert schema.decode(list[schema.Organisation], content) == organisations
+    assert schema.type_adapter(list[schema.Organisation]) is schema.type_adapter(list[schema.Organisation])
+
+
+def test_decode_validates():
+    with pytest.raises(ValueError):
+        schema.decode(schema.Organisation, b'{"id": "not a number", "host_name": "a", "verbose_name": "b"}')
+    organisation = schema.decode(
+        schema.Organisation, b'{"id": "not a number", "host_name": "a", "verbose_name": "b"}', validate=False
+    )
+    assert organisation.id == "not a number"
+
+
+@pytest.mark.parametrize("validate", [True, False])
+def test_lazy_page(validate):
+    page = OrganisationFactory.build()
+    lazy = schema.LazyPage.decode(page.model_dump_json(indent=2).encode(), schema.Organisation, validate=validate)
+    assert (lazy.page, lazy.pages, lazy.per_page) == (page.page, page.pages, page.per_page)
+    assert len(lazy.items) == len(page.items)
+    assert lazy.items == page.items
+    assert lazy.items[-1] == page.items[-1]
+    assert lazy.items[:2] == page.items[:2]
+    with pytest.raises(IndexError):
+        lazy.items[len(page.items)]
+
+
+def test_lazy_page_untyped_items():
+    lazy = schema.LazyPage.decode('{"page": 1, "items": [{"a": [1, "]"]}, "x,y", null], "pages": 1, "per_page": 3}')
+    assert list(lazy.claims) == [{"a": [1, "]"]}, "x,y", None]
+    assert schema.LazyPage.decode(b'{"items": [], "page": 1, "pages": 0, "per_page": 3}').items == []
+
+
+def test_lazy_page_finds_item_boundaries_without_decoding(monkeypatch):
+    items = [{"a": 'quote " and [bracket', "b": "\\"}, [[[[[[1]]]], "]"]], {"deep": {"er": {"and": {"deeper": [{}]}}}}]
+    content = json.dumps({"page": 1, "pages": 1, "per_page": 3, "items": items})
+    raw_decode = json.JSONDecoder.raw_decode
+    decoded = []
+    monkeypatch.setattr(
+        json.JSONDecoder, "raw_decode", lambda self, s, idx=0: decoded.append(s[idx]) or raw_decode(self, s, idx)
+    )
+    lazy = schema.LazyPage.decode(content)
+    # Only the envelope fields are decoded
+    assert decoded == ["1", "1", "3"]
+    assert [json.loads(lazy.items.raw(index)) for index in range(3)] == items
+    assert list(lazy.items) == items
+
+
+@pytest.mark.parametrize(
+    "content", [b'{"items": [1, 2', b'{"items": [1 2], "page": 1}', b"[]", b'{"items": ["a], "page": 1}']
+)
+def test_lazy_page_invalid(content):
+    with pytest.raises(json.JSONDecodeError):
+        schema.LazyPage.decode(content)
+
+
+@pytest.mark.parametrize(
+    "meta",
+    [
+        {},
+        {"rows": 10, "source": "Sainsbury's"},
+        {"quote": 'say "hi"', "delta": True, "replaces": None},
+        {"nested": [1, 2.5, {"key": "value"}], "text": "line\nbreak"},
+    ],
+)
+def test_parse_file_meta(meta):
+    assert schema.parse_file_meta(json.dumps(meta)) == meta
+    assert schema.parse_file_meta(repr(meta)) == meta
+
+
+@pytest.mark.parametrize("value", ["[1, 2]", "__import__('os')", "{'a': b}", "not metadata"])
+def test_parse_file_meta_invalid(value):
+    with pytest.raises(ValueError):
+        schema.parse_file_meta(value)
+
+
+def test_file_record_legacy_file_meta():
+    record = schema.decode(
+        schema.FileRecord,
+        json.dumps(
+            {
+                "feed_identifier": "test",
+                "feed_version": 1,
+                "file_location": "s3://bucket/data.csv",
+                "catalogued_time": "2024-01-01T00:00:00",
+                "posted_by": "test",
+                "organisation": "atheon",
+                "file_meta": repr({"source": "Sainsbury's"}),
+            }
+        ),
+    )
+    assert record.file_meta == {"source": "Sainsbury's"}
@@ -0,0 +1,46 @@
+import httpx
+import pytest
+
+from src import transport
+from src.client import M2MClient
+from src.transport import TransportConfig
+
+
+def test_defaults_match_previous_client_settings():
+    config = TransportConfig()
+    assert config.timeout == httpx.Timeout(30)
+    assert config.limits == httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=5.0)
+    assert TransportConfig.from_env("test") == config
+
+
+def test_from_env(monkeypatch):
+    monkeypatch.setenv("TEST_HTTP2", "true")
+    monkeypatch.setenv("TEST_MAX_CONNECTIONS", "200")
+    monkeypatch.setenv("TEST_MAX_KEEPALIVE_CONNECTIONS", "none")
+    monkeypatch.setenv("TEST_READ_TIMEOUT", "2.5")
+    config = TransportConfig.from_env("test")
+    assert config == TransportConfig(http2=True, max_connections=200, max_keepalive_connections=None, read_timeout=2.5)
+    assert config.timeout == httpx.Timeout(30, read=2.5)
+
+
+@pytest.mark.asyncio
+async def test_client_uses_config():
+    config = TransportConfig(max_connections=7, max_keepalive_connections=3, connect_timeout=1, write_timeout=None)
+    client = M2MClient("test", transport_config=config)
+    assert client.timeout == httpx.Timeout(30, connect=1, write=None)
+    pool = client._transport._pool
+    assert (pool._max_connections, pool._max_keepalive_connections) == (7, 3)
+    await client.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_reads_config_from_env(client_responses, monkeypatch):
+    monkeypatch.setenv("TEST_POOL_TIMEOUT", "4")
+    async with M2MClient("test") as client:
+        assert client.timeout.pool == 4
+
+
+def test_http2_falls_back_without_h2(monkeypatch, caplog):
+    monkeypatch.setattr(transport, "http2_available", lambda: False)
+    assert TransportConfig(http2=True).client_kwargs()["http2"] is False
+    assert "h2 package is not installed" in caplog.text
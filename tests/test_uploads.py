@@ -0,0 +1,78 @@
+import io
+import threading
+from email.parser import BytesParser
+from email.policy import default
+
+import pytest
+
+from src.uploads import MultipartFileStream
+
+
+async def read_body(stream: MultipartFileStream) -> bytes:
+    return b"".join([chunk async for chunk in stream])
+
+
+def parse_parts(stream: MultipartFileStream, body: bytes) -> dict:
+    message = BytesParser(policy=default).parsebytes(
+        f"Content-Type: {stream.headers['Content-Type']}\r\n\r\n".encode() + body
+    )
+    return {part.get_param("name", header="content-disposition"): part for part in message.iter_parts()}
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 7, 1024 * 1024])
+async def test_stream_from_disk(tmp_path, chunk_size):
+    path = tmp_path / "data.csv"
+    path.write_bytes(b"a,b\n1,2\n" * 100)
+    progress = []
+    with open(path, "rb") as file:
+        stream = MultipartFileStream(
+            {"key": "uploads/data.csv", "policy": "abc"},
+            file,
+            "uploads/data.csv",
+            chunk_size=chunk_size,
+            progress=lambda sent, total: progress.append((sent, total)),
+        )
+        body = await read_body(stream)
+
+    assert len(body) == stream.content_length == int(stream.headers["Content-Length"])
+    parts = parse_parts(stream, body)
+    assert parts["key"].get_content() == "uploads/data.csv"
+    assert parts["policy"].get_content() == "abc"
+    assert parts["file"].get_filename() == "uploads/data.csv"
+    assert parts["file"].get_payload(decode=True) == path.read_bytes()
+    assert progress[-1] == (len(body), len(body))
+    assert stream.bytes_sent == len(body)
+
+
+@pytest.mark.asyncio
+async def test_stream_reads_files_off_the_event_loop(tmp_path):
+    path = tmp_path / "data.bin"
+    path.write_bytes(b"x" * 10)
+    threads = set()
+
+    class RecordingFile(io.FileIO):
+        def read(self, size=-1):
+            threads.add(threading.current_thread())
+            return super().read(size)
+
+    with RecordingFile(path) as file:
+        await read_body(MultipartFileStream({}, file, "data.bin", chunk_size=4))
+    assert threads and threading.current_thread() not in threads
+
+
+@pytest.mark.asyncio
+async def test_stream_from_memory():
+    file = io.BytesIO(b"skip" + b"x" * 10)
+    file.seek(4)
+    stream = MultipartFileStream({}, file, "data.bin", chunk_size=3)
+    body = await read_body(stream)
+    assert stream.file_size == 10
+    assert parse_parts(stream, body)["file"].get_payload(decode=True) == b"x" * 10
+
+
+@pytest.mark.asyncio
+async def test_stream_from_text():
+    stream = MultipartFileStream({}, io.StringIO("héllo"), "data.txt")
+    body = await read_body(stream)
+    assert parse_parts(stream, body)["file"].get_payload(decode=True) == "héllo".encode()
@@ -1,21 +1,12 @@
+import asyncio
+
 import pytest
 
 from src.client import M2MClient
 from src.schema import PaginatedResponse
-from src.utilities import get_client, inject_client, get_or_create_client, Paginator, fetch_all
-
+from src.utilities import get_client, get_or_create_client, Paginator, fetch_all, iter_all, iter_pages
 
-@inject_client(service="test")
-async def inject_function(client: M2MClient, page: int = 1, per_page: int = 100) -> PaginatedResponse:
-    """Function to test client injection."""
-    assert isinstance(client, M2MClient)
-    assert client.token["access_token"] == "test_access_token"
-    return PaginatedResponse(
-        items=[f"item_{page}"],
-        page=page,
-        pages=3,
-        per_page=per_page,
-    )
+from .factories import inject_function
 
 
 @pytest.mark.asyncio
@@ -45,7 +36,6 @@ async def test_inject_client(client_responses):
 
 
 class TestPaginator:
-    
     def test_init(self):
         paginator = Paginator(inject_function, per_page=100)
         assert paginator.per_page == 100
@@ -73,9 +63,162 @@ class TestPaginator:
         assert page.items == ["item_3"]
         assert page.per_page == 100
 
+    @pytest.mark.asyncio
+    async def test_read_ahead(self):
+        fn = PageRecorder(pages=10)
+        paginator = Paginator(fn, client=None, per_page=1, read_ahead=3)
+        pages = []
+        async for page in paginator:
+            assert len(paginator._prefetched) <= 3
+            pages.append(page.page)
+        assert pages == list(range(1, 11))
+        assert fn.max_in_flight == 3
+        assert fn.requested.count(5) == 1
+
+    @pytest.mark.asyncio
+    async def test_read_ahead_cancelled_on_close(self):
+        fn = PageRecorder(pages=10)
+        async with Paginator(fn, client=None, per_page=1, read_ahead=3) as paginator:
+            async for page in paginator:
+                if page.page == 2:
+                    break
+        assert not paginator._prefetched
+        await asyncio.sleep(0)
+        assert fn.in_flight == 0
+
+    @pytest.mark.asyncio
+    async def test_get_uses_prefetched_page(self):
+        fn = PageRecorder(pages=10)
+        paginator = Paginator(fn, client=None, per_page=1, read_ahead=2)
+        await paginator.__anext__()
+        page = await paginator.get(3)
+        assert page.page == 3
+        # Page 3 was already prefetched and page 2 was cancelled before it was sent
+        assert fn.requested == [1, 3]
+        assert not paginator._prefetched
+
+    @pytest.mark.asyncio
+    async def test_read_ahead_cancelled_on_error(self):
+        fn = PageRecorder(pages=10)
+
+        async def fail_fast(client: M2MClient, page: int, per_page: int) -> PaginatedResponse:
+            # Fail page 2 while the pages after it are still in flight
+            if page == 2:
+                await asyncio.sleep(0.001)
+                raise ValueError("page 2 failed")
+            return await fn(client, page, per_page)
+
+        paginator = Paginator(fail_fast, client=None, per_page=1, read_ahead=3)
+        with pytest.raises(ValueError):
+            async for _ in paginator:
+                pass
+        assert not paginator._prefetched
+        await asyncio.sleep(0)
+        assert fn.in_flight == 0
+        assert fn.cancelled == 2
+
+    @pytest.mark.asyncio
+    async def test_unclosed_read_ahead_warns(self):
+        fn = PageRecorder(pages=10)
+        paginator = Paginator(fn, client=None, per_page=1, read_ahead=3)
+        await paginator.__anext__()
+        tasks = list(paginator._prefetched.values())
+        with pytest.warns(ResourceWarning):
+            paginator.__del__()
+        # Nothing is cancelled from the finaliser
+        assert not any(task.cancelled() for task in tasks)
+        await paginator.aclose()
+
 
 @pytest.mark.asyncio
 async def test_fetch_all(client_responses):
     async with get_client("test") as client:
         results = await fetch_all(inject_function, client, per_page=100)
         assert results == ['item_1', 'item_2', 'item_3']
+
+
+class PageRecorder:
+    """Paginated function that records how many requests are in flight, optionally failing on one page."""
+
+    def __init__(self, pages: int, fail_on: int = None):
+        self.pages = pages
+        self.fail_on = fail_on
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.cancelled = 0
+        self.requested = []
+
+    async def __call__(self, client: M2MClient, page: int, per_page: int) -> PaginatedResponse:
+        self.requested.append(page)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            # Later pages arrive first so ordering is exercised
+            await asyncio.sleep(0.005 * (self.pages - page))
+            if page == self.fail_on:
+                raise ValueError(f"page {page} failed")
+            return PaginatedResponse(items=[f"item_{page}"], page=page, pages=self.pages, per_page=per_page)
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            raise
+        finally:
+            self.in_flight -= 1
+
+
+@pytest.mark.asyncio
+async def test_fetch_all_max_concurrency():
+    fn = PageRecorder(pages=20)
+    results = await fetch_all(fn, None, per_page=1, max_concurrency=3)
+    assert results == [f"item_{page}" for page in range(1, 21)]
+    assert fn.max_in_flight == 3
+
+
+@pytest.mark.asyncio
+async def test_iter_all_unordered():
+    fn = PageRecorder(pages=5)
+    results = [item async for item in iter_all(fn, None, per_page=1, max_concurrency=4, ordered=False)]
+    assert results == ["item_1", "item_5", "item_4", "item_3", "item_2"]
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_cancels_outstanding_on_failure():
+    fn = PageRecorder(pages=10, fail_on=3)
+    with pytest.raises(ValueError, match="page 3 failed"):
+        async for _ in iter_pages(fn, None, per_page=1, max_concurrency=5):
+            pass
+    # Page 2 is still in flight when page 3 fails
+    assert fn.cancelled == 1
+    assert fn.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_cancels_outstanding_on_break():
+    fn = PageRecorder(pages=10)
+    pages = iter_pages(fn, None, per_page=1, max_concurrency=5)
+    async for page in pages:
+        if page.page == 2:
+            break
+    await pages.aclose()
+    assert len(fn.requested) < 10
+    assert fn.in_flight == 0
+
+
+@pytest.mark.asyncio
+async def test_iter_pages_ordered_does_not_spin_while_waiting_for_head(monkeypatch):
+    async def fetch(page: int, per_page: int, **kwargs) -> PaginatedResponse:
+        # Page 2 finishes long after page 3, so the ordered loop waits on the head with a finished page pending
+        await asyncio.sleep(0.1 if page == 2 else 0)
+        return PaginatedResponse(items=[page], page=page, pages=3, per_page=per_page)
+
+    waits = 0
+    wait = asyncio.wait
+
+    async def counting_wait(*args, **kwargs):
+        nonlocal waits
+        waits += 1
+        return await wait(*args, **kwargs)
+
+    monkeypatch.setattr(asyncio, "wait", counting_wait)
+    pages = [page.page async for page in iter_pages(fetch, None, per_page=1, max_concurrency=5)]
+    assert pages == [1, 2, 3]
+    assert waits < 5